@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Micro-benchmark of matching the points of two synthetic swaths by longitude and latitude
+(collocation.create_colocation_mapping_within_epsilon).
+
+Older versions of glance return the matches as dictionaries of points with lists of the
+indexes they matched, newer ones as parallel arrays of the A and B indexes of each matched
+pair; both are turned into the sorted A and B index arrays of the pairs, which must match
+exactly between trees. The swaths stay away from the +/-180 degree line and have no invalid
+points, since older versions didn't handle those.
+
+usage: python bench_colocation.py [--compare-to /path/to/other/pyglance] [--scale 0.5]
+
+Copyright (c) 2026 University of Wisconsin SSEC. All rights reserved.
+"""
+
+import sys
+
+import numpy as np
+
+import benchutil
+
+# the shape of the swaths at a scale of 1 (older versions of glance check every point
+# in the neighboring 1 degree bins in python, so larger swaths take a long time with them)
+BASE_SHAPE = (50, 200)
+
+# the spacing of the swath points in degrees
+POINT_SPACING = 0.1
+
+def make_test_swaths (shape, bOffset, seed=1) :
+    """
+    make the longitude and latitude for a pair of slightly curved swaths, the B swath
+    is shifted by bOffset (in degrees of longitude and latitude) and has some noise
+    """
+
+    randomState = np.random.RandomState(seed)
+    rows, cols  = np.indices(shape, dtype=np.float64)
+
+    aLatitude  = 20.0 + rows * POINT_SPACING + 0.0005 * (cols - shape[1] / 2.0) ** 2 * POINT_SPACING
+    aLongitude = -100.0 + cols * POINT_SPACING + rows * POINT_SPACING * 0.2
+
+    bLatitude  = aLatitude  + bOffset[1] + randomState.normal(0.0, POINT_SPACING * 0.1, shape)
+    bLongitude = aLongitude + bOffset[0] + randomState.normal(0.0, POINT_SPACING * 0.1, shape)
+
+    return ((aLongitude.astype(np.float32), aLatitude.astype(np.float32)),
+            (bLongitude.astype(np.float32), bLatitude.astype(np.float32)))
+
+def _get_matched_pairs (mapping) :
+    """
+    get the sorted A and B index arrays of the matched pairs from either form of mapping
+    """
+
+    aMatches, bMatches, totalMatches = mapping
+
+    # older versions give dictionaries of [lon, lat, index, [matching indexes]] keyed on the index
+    if isinstance(aMatches, dict) :
+        pairs = [(aIndex, bIndex) for aIndex in sorted(aMatches.keys()) for bIndex in sorted(aMatches[aIndex][3])]
+        aMatches = np.array([aIndex for aIndex, _ in pairs], dtype=np.int64)
+        bMatches = np.array([bIndex for _, bIndex in pairs], dtype=np.int64)
+
+    return {'a_indexes': np.asarray(aMatches, dtype=np.int64),
+            'b_indexes': np.asarray(bMatches, dtype=np.int64),
+            'total':     int(totalMatches)}
+
+def make_case (bOffset, epsilon) :
+    """
+    make the case function for matching swaths offset by bOffset within epsilon degrees
+    """
+
+    def case (scale, repeats) :
+        import glance.collocation as collocation
+
+        shape = (max(int(BASE_SHAPE[0] * scale), 1), BASE_SHAPE[1])
+        aLonLat, bLonLat = make_test_swaths(shape, bOffset)
+
+        measured = benchutil.measure(lambda : collocation.create_colocation_mapping_within_epsilon(aLonLat, bLonLat, epsilon),
+                                     repeats=repeats)
+        measured['result'] = _get_matched_pairs(measured['result'])
+
+        return measured
+
+    return case
+
+CASES = [
+         ('single',   "mostly single matches (%dx%d)" % BASE_SHAPE,
+          make_case((0.03, 0.02), POINT_SPACING * 0.5), 0.0),
+         ('multiple', "many multiple matches (%dx%d)" % BASE_SHAPE,
+          make_case((0.03, 0.02), POINT_SPACING * 1.5), 0.0),
+         ('partial',  "half the swath unmatched (%dx%d)" % BASE_SHAPE,
+          make_case((BASE_SHAPE[1] * POINT_SPACING * 0.5, 0.02), POINT_SPACING * 0.5), 0.0),
+        ]
+
+if __name__ == '__main__' :
+    sys.exit(benchutil.run_benchmark(CASES, "time matching the points of two swaths by longitude and latitude"))
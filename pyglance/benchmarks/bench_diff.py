@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Micro-benchmark of finding the differences between two data sets (DiffInfoObject.analyze),
+for integer and floating point data with fill values, non-finite values (for the floating
+point data), and both the epsilon and epsilon percent tests.
+
+The results compared between trees are md5 sums of the difference data and each of the
+difference masks, so they must match exactly.
+
+usage: python bench_diff.py [--compare-to /path/to/other/pyglance] [--scale 0.5]
+
+Copyright (c) 2026 University of Wisconsin SSEC. All rights reserved.
+"""
+
+import sys, hashlib
+
+import numpy as np
+
+import benchutil
+
+# the shape of the data sets at a scale of 1
+BASE_SHAPE = (2000, 2500)
+
+# the epsilon and epsilon percent used for the comparison
+EPSILON         = 1.0
+EPSILON_PERCENT = 5.0
+
+def make_test_data (dtype, shape, seed=1) :
+    """
+    make a pair of data sets of the given type that mostly differ by a little,
+    along with the fill value used in them
+    """
+
+    randomState = np.random.RandomState(seed)
+    dtype       = np.dtype(dtype)
+    if dtype.kind == 'f' :
+        fillValue = dtype.type(-999)
+        aData     = (randomState.random_sample(shape) * 100).astype(dtype)
+        bData     = (aData + randomState.normal(0.0, 0.5, shape)).astype(dtype)
+        bData[::89, ::7] = np.nan
+    else :
+        fillValue = dtype.type(999)
+        aData     = randomState.randint(0, 30000, shape).astype(dtype)
+        bData     = (aData.astype(np.int32) + randomState.randint(-3, 4, shape)).clip(0, 30000).astype(dtype)
+    aData[::97, ::13] = fillValue
+    bData[::83, ::11] = fillValue
+
+    return aData, bData, fillValue
+
+def _describe_diff (diffInfo) :
+    """
+    get md5 sums of the difference data and masks
+    """
+
+    diffObject = diffInfo.diff_data_object
+    toReturn   = {'data': hashlib.md5(np.ascontiguousarray(diffObject.data).view(np.uint8)).hexdigest()}
+    for maskName in ('valid_mask', 'ignore_mask', 'mismatch_mask', 'outside_epsilon_mask') :
+        mask = np.asarray(getattr(diffObject.masks, maskName), dtype=bool)
+        toReturn[maskName] = hashlib.md5(np.ascontiguousarray(mask).view(np.uint8)).hexdigest()
+
+    return toReturn
+
+def make_case (dtype) :
+    """
+    make the case function for comparing data of the given type
+    """
+
+    def case (scale, repeats) :
+        import glance.data as dataobj
+
+        shape = (max(int(BASE_SHAPE[0] * scale), 1), BASE_SHAPE[1])
+        aData, bData, fillValue = make_test_data(dtype, shape)
+        aObject = dataobj.DataObject(aData, fillValue=fillValue)
+        bObject = dataobj.DataObject(bData, fillValue=fillValue)
+        aObject.self_analysis()
+        bObject.self_analysis()
+
+        measured = benchutil.measure(lambda : dataobj.DiffInfoObject(aObject, bObject,
+                                                                     epsilonValue=EPSILON, epsilonPercent=EPSILON_PERCENT),
+                                     repeats=repeats)
+        measured['result'] = _describe_diff(measured['result'])
+
+        return measured
+
+    return case
+
+CASES = [(np.dtype(dtype).name, np.dtype(dtype).name + " difference (%dx%d)" % BASE_SHAPE, make_case(dtype), 0.0)
+         for dtype in (np.int16, np.uint16, np.float32, np.float64)]
+
+if __name__ == '__main__' :
+    sys.exit(benchutil.run_benchmark(CASES, "time the differencing of two data sets (DiffInfoObject.analyze)"))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Micro-benchmark of the comparison statistics: the numerical comparison statistics of a
+difference (NumericalComparisonStatistics), the general statistics of both data sets
+(GeneralStatistics), and the basic analysis of the difference data alone
+(NumericalComparisonStatistics.basic_analysis).
+
+The results compared between trees are the dictionary forms of the statistics; the
+moments may be summed in a different order, so they only need to match to within
+floating point round off. The root mean square of integer differences isn't compared,
+since older versions rounded it down.
+
+usage: python bench_stats.py [--compare-to /path/to/other/pyglance] [--scale 0.5]
+
+Copyright (c) 2026 University of Wisconsin SSEC. All rights reserved.
+"""
+
+import sys
+
+import numpy as np
+
+import benchutil
+from bench_diff import make_test_data, EPSILON, EPSILON_PERCENT
+
+# the shape of the data sets at a scale of 1
+BASE_SHAPE = (2000, 2500)
+
+# how much the statistics may differ between trees
+RELATIVE_TOLERANCE = 1e-5
+
+def _make_diff_info (dtype, scale) :
+    """
+    make the DiffInfoObject for a pair of test data sets of the given type
+    """
+    import glance.data as dataobj
+
+    shape = (max(int(BASE_SHAPE[0] * scale), 1), BASE_SHAPE[1])
+    aData, bData, fillValue = make_test_data(dtype, shape)
+    aObject = dataobj.DataObject(aData, fillValue=fillValue)
+    bObject = dataobj.DataObject(bData, fillValue=fillValue)
+
+    return dataobj.DiffInfoObject(aObject, bObject, epsilonValue=EPSILON, epsilonPercent=EPSILON_PERCENT)
+
+def make_case (dtype, statsName) :
+    """
+    make the case function for measuring the named statistics for data of the given type
+    """
+
+    def case (scale, repeats) :
+        import glance.stats as statistics
+
+        diffInfo = _make_diff_info(dtype, scale)
+        if statsName == 'comparison' :
+            measured = benchutil.measure(lambda : statistics.NumericalComparisonStatistics(diffInfo).dictionary_form(),
+                                         repeats=repeats)
+        elif statsName == 'general' :
+            measured = benchutil.measure(lambda : statistics.GeneralStatistics(diffInfoObject=diffInfo).dictionary_form(),
+                                         repeats=repeats)
+        else :
+            diffObject = diffInfo.diff_data_object
+            measured   = benchutil.measure(lambda : statistics.NumericalComparisonStatistics.basic_analysis(diffObject.data,
+                                                                                                            diffObject.masks.valid_mask),
+                                           repeats=repeats)
+
+        # older versions used integer division for the root mean square of integer differences
+        # (so it was rounded down before the square root), it can't be compared for those
+        if (np.dtype(dtype).kind in 'iu') and ('rms_val' in measured['result']) :
+            del measured['result']['rms_val']
+
+        return measured
+
+    return case
+
+CASES = [ ]
+for _dtype in (np.int16, np.float32, np.float64) :
+    for _statsName, _statsDescription in (('comparison', "comparison stats"),
+                                          ('general',    "general stats"),
+                                          ('basic',      "basic analysis")) :
+        CASES.append((np.dtype(_dtype).name + "-" + _statsName,
+                      np.dtype(_dtype).name + " " + _statsDescription + " (%dx%d)" % BASE_SHAPE,
+                      make_case(_dtype, _statsName), RELATIVE_TOLERANCE))
+
+if __name__ == '__main__' :
+    sys.exit(benchutil.run_benchmark(CASES, "time the comparison statistics of two data sets"))
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Shared tools for the glance benchmarks in this directory.
+
+Each benchmark script measures a set of cases (wall clock time, and the number, total
+size, and peak size of the numpy arrays allocated) with the glance in this source tree.
+If it's given --compare-to with the path to another glance source tree (the directory
+holding its glance package, such as the pyglance directory of a checkout of an earlier
+version), the same cases are run with that tree too and the results of each case are
+checked to be the same in both. Each tree is measured in its own python process.
+
+For example, to compare the current code to the version before the benchmarked change:
+
+    git worktree add /tmp/glance-before <commit>
+    python pyglance/benchmarks/bench_diff.py --compare-to /tmp/glance-before/pyglance
+
+Copyright (c) 2026 University of Wisconsin SSEC. All rights reserved.
+"""
+
+import os, sys, time, optparse, subprocess, tempfile, ctypes
+import cPickle as pickle
+
+import numpy as np
+
+# the glance source tree this script is part of
+THIS_TREE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the number of times each case is timed, the best time is reported
+DEFAULT_REPEATS = 3
+
+# arrays smaller than this aren't counted by the NumpyMemoryTracker
+DEFAULT_MIN_TRACKED_SIZE = 1024 * 1024
+
+# the index of PyDataMem_SetEventHook in numpy's C API table
+_SET_EVENT_HOOK_API_INDEX = 291
+
+_EVENT_HOOK_TYPE = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p)
+
+def _get_set_event_hook ( ) :
+    """
+    get numpy's PyDataMem_SetEventHook function, or None if this numpy doesn't have it
+    (it was deprecated in numpy 1.23)
+    """
+
+    api = getattr(np.core.multiarray, '_ARRAY_API', None)
+    if (api is None) or (tuple(int(part) for part in np.__version__.split('.')[:2]) >= (1, 23)) :
+        return None
+
+    # python 2 builds of numpy publish their C API as a PyCObject, later ones as a PyCapsule
+    if type(api).__name__ == 'PyCObject' :
+        getPointer          = ctypes.pythonapi.PyCObject_AsVoidPtr
+        getPointer.argtypes = [ctypes.py_object]
+        getPointer.restype  = ctypes.c_void_p
+        tablePointer        = getPointer(api)
+    else :
+        getPointer          = ctypes.pythonapi.PyCapsule_GetPointer
+        getPointer.argtypes = [ctypes.py_object, ctypes.c_char_p]
+        getPointer.restype  = ctypes.c_void_p
+        tablePointer        = getPointer(api, None)
+    table = ctypes.cast(tablePointer, ctypes.POINTER(ctypes.c_void_p))
+
+    return ctypes.CFUNCTYPE(ctypes.c_void_p, _EVENT_HOOK_TYPE, ctypes.c_void_p,
+                            ctypes.POINTER(ctypes.c_void_p))(table[_SET_EVENT_HOOK_API_INDEX])
+
+class NumpyMemoryTracker (object) :
+    """
+    While active (use it in a with statement), this counts the numpy array buffers of at
+    least minSize bytes that are allocated, their total size, and the most bytes they
+    held at once. If numpy can't report its allocations, the counts will be None.
+    """
+
+    def __init__ (self, minSize=DEFAULT_MIN_TRACKED_SIZE) :
+        self.min_size        = minSize
+        self.count           = None
+        self.allocated_bytes = None
+        self.peak_bytes      = None
+        self._live           = { }
+        self._liveBytes      = 0
+        self._hook           = None
+        self._setHook        = _get_set_event_hook()
+
+    def _on_event (self, oldPointer, newPointer, size, userData) :
+        """
+        note an allocation (no old pointer), free (no new pointer), or reallocation
+        """
+
+        if oldPointer in self._live :
+            self._liveBytes -= self._live.pop(oldPointer)
+        if newPointer and (size >= self.min_size) :
+            self._live[newPointer]  = size
+            self._liveBytes        += size
+            self.count             += 1
+            self.allocated_bytes   += size
+            self.peak_bytes         = max(self.peak_bytes, self._liveBytes)
+
+    def __enter__ (self) :
+        if self._setHook is not None :
+            self.count, self.allocated_bytes, self.peak_bytes = 0, 0, 0
+            self._hook = _EVENT_HOOK_TYPE(self._on_event)
+            self._setHook(self._hook, None, ctypes.pointer(ctypes.c_void_p()))
+        return self
+
+    def __exit__ (self, excType, excValue, excTraceback) :
+        if self._setHook is not None :
+            self._setHook(_EVENT_HOOK_TYPE(), None, ctypes.pointer(ctypes.c_void_p()))
+            self._hook = None
+        return False
+
+def measure (function, repeats=DEFAULT_REPEATS) :
+    """
+    call the function repeats times and return a dictionary with the result of the last call
+    ('result'), the best wall clock time in seconds ('time'), and the number, total bytes,
+    and peak bytes of the numpy arrays allocated by the first call ('count', 'allocated', 'peak')
+    """
+
+    toReturn = { }
+    bestTime = None
+    for repeat in range(repeats) :
+        tracker   = NumpyMemoryTracker() if repeat == 0 else None
+        startTime = time.time()
+        if tracker is not None :
+            with tracker :
+                result = function()
+        else :
+            result = function()
+        elapsed  = time.time() - startTime
+        bestTime = elapsed if bestTime is None else min(bestTime, elapsed)
+        if tracker is not None :
+            toReturn['count']     = tracker.count
+            toReturn['allocated'] = tracker.allocated_bytes
+            toReturn['peak']      = tracker.peak_bytes
+        del tracker
+
+    toReturn['time']   = bestTime
+    toReturn['result'] = result
+
+    return toReturn
+
+def results_match (first, second, relativeTolerance=0.0) :
+    """
+    check whether two results (numbers, arrays, or dictionaries, lists, and tuples of them)
+    are the same, nans are considered equal to each other and numbers may differ by the
+    relative tolerance
+    """
+
+    if isinstance(first, dict) or isinstance(second, dict) :
+        return (isinstance(first, dict) and isinstance(second, dict) and (sorted(first.keys()) == sorted(second.keys())) and
+                all(results_match(first[key], second[key], relativeTolerance) for key in first))
+    if isinstance(first, (list, tuple)) and isinstance(second, (list, tuple)) and \
+            not (np.isscalar(first) or np.isscalar(second)) :
+        return (len(first) == len(second)) and all(results_match(one, two, relativeTolerance) for one, two in zip(first, second))
+    if (first is None) or (second is None) or isinstance(first, basestring) or isinstance(second, basestring) :
+        return first == second
+
+    first  = np.asarray(first)
+    second = np.asarray(second)
+    if first.shape != second.shape :
+        return False
+    if (first.dtype.kind not in 'fc') and (second.dtype.kind not in 'fc') :
+        return np.array_equal(first, second)
+
+    return bool(np.all((first == second) | (np.isnan(first) & np.isnan(second)) |
+                       np.isclose(first, second, rtol=relativeTolerance, atol=0.0)))
+
+def _format_bytes (numBytes) :
+    return ("%6d MB" % (numBytes / (1024 * 1024))) if numBytes is not None else "      -  "
+
+def _print_results (cases, treeResults, treeNames, output=sys.stdout) :
+    """
+    print a table of the results for each case and tree,
+    and whether the results of each case match across the trees
+    """
+
+    print >> output, "%-40s %-8s %9s %7s %10s %9s  %s" % ("case", "tree", "time", "arrays", "allocated", "peak", "result")
+    allMatch = True
+    for name, description, caseFunction, tolerance in cases :
+        firstResult = treeResults[0][name]['result']
+        for treeIndex, (treeName, results) in enumerate(zip(treeNames, treeResults)) :
+            caseResults = results[name]
+            matchText   = ""
+            if treeIndex > 0 :
+                matches   = results_match(firstResult, caseResults['result'], tolerance)
+                allMatch  = allMatch and matches
+                matchText = "same" if matches else "DIFFERENT"
+            print >> output, "%-40s %-8s %7.3f s %7s %10s %9s  %s" % (description if treeIndex == 0 else "", treeName,
+                                                                   caseResults['time'],
+                                                                   caseResults['count'] if caseResults['count'] is not None else '-',
+                                                                   _format_bytes(caseResults['allocated']),
+                                                                   _format_bytes(caseResults['peak']),
+                                                                   matchText)
+
+    return allMatch
+
+def run_benchmark (cases, description) :
+    """
+    run a benchmark script's cases from the command line
+
+    cases is a list of (name, description, caseFunction, relativeTolerance) where
+    caseFunction(scale, repeats) sets up the case's inputs (with about scale times
+    its usual number of points), measures it, and returns the dictionary from measure;
+    the relativeTolerance is how much the results may differ between trees
+
+    returns the exit status for the script
+    """
+
+    parser = optparse.OptionParser(description=description)
+    parser.add_option('--compare-to', dest='compareTo', type='string', default=None,
+                      help="also run the cases with the glance package in this directory and compare the results")
+    parser.add_option('--scale', dest='scale', type='float', default=1.0,
+                      help="multiply the number of points in each case by this")
+    parser.add_option('--repeats', dest='repeats', type='int', default=DEFAULT_REPEATS,
+                      help="time each case this many times and report the best time")
+    parser.add_option('--case', dest='caseNames', action='append', default=None,
+                      help="only run the case with this name (may be given more than once)")
+    # used to run the cases for one tree in a separate process
+    parser.add_option('--results-file', dest='resultsFile', type='string', default=None,
+                      help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args()
+
+    if options.caseNames is not None :
+        cases = [case for case in cases if case[0] in options.caseNames]
+
+    # if we're measuring one tree, run the cases and hand back the results
+    if options.resultsFile is not None :
+        results = { }
+        for name, _, caseFunction, _ in cases :
+            results[name] = caseFunction(options.scale, options.repeats)
+        with open(options.resultsFile, 'wb') as resultsFile :
+            pickle.dump(results, resultsFile, pickle.HIGHEST_PROTOCOL)
+        return 0
+
+    # otherwise measure each tree in a process of its own
+    trees     = [THIS_TREE] + ([os.path.abspath(options.compareTo)] if options.compareTo is not None else [ ])
+    treeNames = ["this", "other"][:len(trees)]
+    treeResults = [ ]
+    for tree in trees :
+        print >> sys.stderr, "measuring the glance in " + tree
+        handle, resultsPath = tempfile.mkstemp(suffix='.pickle')
+        os.close(handle)
+        try :
+            environment = os.environ.copy()
+            environment['PYTHONPATH'] = tree + ((os.pathsep + environment['PYTHONPATH']) if 'PYTHONPATH' in environment else '')
+            command = [sys.executable, os.path.abspath(sys.argv[0]), '--results-file', resultsPath,
+                       '--scale', str(options.scale), '--repeats', str(options.repeats)]
+            for name, _, _, _ in cases :
+                command += ['--case', name]
+            subprocess.check_call(command, env=environment)
+            with open(resultsPath, 'rb') as resultsFile :
+                treeResults.append(pickle.load(resultsFile))
+        finally :
+            os.remove(resultsPath)
+
+    if len(trees) > 1 :
+        print "this:  " + trees[0]
+        print "other: " + trees[1]
+    allMatch = _print_results(cases, treeResults, treeNames)
+
+    return 0 if allMatch else 1
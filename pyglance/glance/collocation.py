@@ -8,7 +8,7 @@ Created by evas Apr 2010.
 Copyright (c) 2010 University of Wisconsin SSEC. All rights reserved.
 """
 
-import logging
+import os, logging, hashlib, tempfile
 import numpy as np
 
 import glance.delta as delta
@@ -17,44 +17,147 @@ import glance.delta as delta
 LOG = logging.getLogger(__name__)
 
 
+# the maximum number of candidate A/B pairs that will be epsilon tested at one time,
+# this bounds the memory used by the matching regardless of how dense the bins are
+MAX_CANDIDATE_PAIRS_PER_BLOCK = 2 ** 22
+
+# the smallest bins we will use when searching in longitude/latitude space (in degrees)
+# or on the unit sphere (as a fraction of the radius); much smaller bins would not
+# speed up the search and would risk overflowing the bin keys
+MIN_LON_LAT_BIN_SIZE = 1.0e-4
+MIN_SPHERE_BIN_SIZE  = 1.0e-5
+
+# colocation mappings that are saved to disk will be named with this prefix followed by their key
+COLOCATION_MAPPING_FILE_PREFIX = 'colocation-mapping-'
+COLOCATION_MAPPING_FILE_SUFFIX = '.npz'
+
+# this should be changed any time the matching rules or the saved format change, so old files won't be reused
+COLOCATION_MAPPING_FORMAT_VERSION = 1
+
+def _expand_ranges (starts, counts) :
+    """
+    given the start positions and lengths of a set of ranges, return the
+    concatenation of all of those ranges as a single index array
+    
+    ex. starts [5, 0], counts [2, 3] will result in [5, 6, 0, 1, 2]
+    """
+    
+    totalCount = np.sum(counts)
+    
+    # figure out where each range begins in the output
+    # and how far each output position is into its range
+    rangeBeginnings  = np.cumsum(counts) - counts
+    positionInRange  = np.arange(totalCount) - np.repeat(rangeBeginnings, counts)
+    
+    return np.repeat(starts, counts) + positionInRange
+
+def _longitude_difference (longitudeA, longitudeB) :
+    """
+    get the absolute difference between two sets of longitudes (in degrees),
+    going the short way around the globe
+    """
+    
+    difference = np.abs(longitudeA - longitudeB) % 360.0
+    
+    return np.minimum(difference, 360.0 - difference)
+
+def _make_lon_lat_bin_keys (latitudes, longitudes, lonlatEpsilon) :
+    """
+    bin the points in longitude/latitude space using bins that are at least lonlatEpsilon
+    degrees on a side, the longitude bins wrap around the globe so that points on either
+    side of the +/-180 degree line will be neighbors
+    
+    returns a function that makes keys from bin numbers, the latitude and longitude bins
+    of the points, and the list of neighboring bin offsets that must be searched
+    """
+    
+    # the longitude bins must evenly divide the globe so that the last bin is next to the first
+    # (pad the bin size very slightly so rounding can't put points epsilon apart two bins apart)
+    binSize        = max(lonlatEpsilon, MIN_LON_LAT_BIN_SIZE) * (1.0 + 1.0e-9)
+    numLonBins     = max(int(np.floor(360.0 / binSize)), 1)
+    lonBinSize     = 360.0 / numLonBins
+    
+    latBins = np.floor((latitudes + 90.0) / binSize).astype(np.int64)
+    lonBins = np.floor((longitudes % 360.0) / lonBinSize).astype(np.int64) % numLonBins
+    
+    # if there are only a couple of longitude bins, don't search the same bin twice
+    lonOffsets = sorted(set([offset % numLonBins for offset in (-1, 0, 1)]))
+    offsets    = [(latOffset, lonOffset) for latOffset in (-1, 0, 1) for lonOffset in lonOffsets]
+    
+    def make_keys (latBin, lonBin) :
+        return latBin * numLonBins + (lonBin % numLonBins)
+    
+    return make_keys, (latBins, lonBins), offsets
+
+def _make_sphere_bin_keys (latitudes, longitudes, greatCircleRadius) :
+    """
+    bin the points on the unit sphere in 3D using cubic bins at least as large as the chord
+    that spans greatCircleRadius km, this has no seams at the poles or the +/-180 degree line
+    
+    returns a function that makes keys from bin numbers, the x, y, and z bins of
+    the points, and the list of neighboring bin offsets that must be searched
+    """
+    
+    # the chord length of the radius on a unit sphere
+    angle   = min(greatCircleRadius / delta.SPHERICAL_EARTH_RADIUS, np.pi)
+    binSize = max(2.0 * np.sin(angle / 2.0), MIN_SPHERE_BIN_SIZE) * (1.0 + 1.0e-9)
+    
+    latRad = np.radians(latitudes)
+    lonRad = np.radians(longitudes)
+    coords = (np.cos(latRad) * np.cos(lonRad), np.cos(latRad) * np.sin(lonRad), np.sin(latRad))
+    
+    # the unit sphere lies in [-1, 1] in each direction, shift so that bin numbers
+    # (including the neighbors of the bins) are never negative
+    numBins   = int(np.ceil(2.0 / binSize)) + 3
+    coordBins = tuple([np.floor((coord + 1.0) / binSize).astype(np.int64) + 1 for coord in coords])
+    
+    offsets = [(xOffset, yOffset, zOffset) for xOffset in (-1, 0, 1) for yOffset in (-1, 0, 1) for zOffset in (-1, 0, 1)]
+    
+    def make_keys (xBin, yBin, zBin) :
+        return (xBin * numBins + yBin) * numBins + zBin
+    
+    return make_keys, coordBins, offsets
+
 def create_colocation_mapping_within_epsilon((alongitude, alatitude),
                                              (blongitude, blatitude),
                                              lonlatEpsilon,
-                                             invalidAMask=None, invalidBMask=None):
+                                             invalidAMask=None, invalidBMask=None,
+                                             greatCircleRadius=None):
     """
     match points together based on their longitude and latitude values
     to match points must be within lonlatEpsilon degrees in both longitude and latitude
+    (longitudes are compared the short way around the globe, so the +/-180 degree line
+    does not separate points)
+    
+    if greatCircleRadius is given (in km), points will instead match if the great circle
+    distance between them is less than or equal to greatCircleRadius and the lonlatEpsilon
+    will be ignored
     
     if the longitude and latitude variables contain invalid data the invalidAMask and
     invalidBMask should be passed with the appropriate masking to remove the invalid values
+    (non-finite longitudes and latitudes will never be matched)
     
-    the return will be in the form of two dictionaries of points, one from a and one from b,
-    indexed on the index number in the A or B data where they can be found. Each entry will
-    consist of a list of:
-        [longitudeValue, latitudeValue, indexNumber, [list of matching indexes in the other set]]
+    the return will be in the form of two parallel arrays of flat index numbers, one into
+    the A data and one into the B data, and the total number of matches; each position in
+    the arrays describes one matched pair of points and the pairs will be sorted by their
+    A index and then their B index
     
     Note: the return will include all pairs of points that match,
     this means an individual a or b point may be repeated if it matches
     multiple points within the lonlatEpsilon provided
-    
-    Warning: This algorithm will fail to find all matching points if the lonlatEpsilon is set to a
-    value greater than or equal to 1.0 degrees. This is related to the bin size used for searching
-    thoretically the bin size could be corrected to scale with the lonlatEpsilon in the future. TODO
     """
     assert(alongitude.shape == alatitude.shape)
     assert(blongitude.shape == blatitude.shape)
     assert(lonlatEpsilon >= 0.0)
+    assert((greatCircleRadius is None) or (greatCircleRadius >= 0.0))
     
-    LOG.debug("Preparing to colocate longitude and latitude points (acceptable epsilon: " + str(lonlatEpsilon) + " degrees)")
+    if greatCircleRadius is None :
+        LOG.debug("Preparing to colocate longitude and latitude points (acceptable epsilon: " + str(lonlatEpsilon) + " degrees)")
+    else :
+        LOG.debug("Preparing to colocate longitude and latitude points (acceptable great circle distance: " + str(greatCircleRadius) + " km)")
     LOG.debug("size of A: " + str(alongitude.shape))
     LOG.debug("size of B: " + str(blongitude.shape))
     
-    # make blank invalid masks if none were passed in
-    if invalidAMask is None :
-        invalidAMask = np.zeros(alongitude.shape, dtype=bool)
-    if invalidBMask is None :
-        invalidBMask = np.zeros(blongitude.shape, dtype=bool)
-    
     # make flat versions of our longitude and latitude
     # so that our index correlations will be simple
     flatALatitude  =  alatitude.ravel()
@@ -62,269 +165,331 @@ def create_colocation_mapping_within_epsilon((alongitude, alatitude),
     flatBLatitude  =  blatitude.ravel()
     flatBLongitude = blongitude.ravel()
     
-    # find the ranges of the longitude and latitude
-    minLatitude  = min(np.min(flatALatitude),  np.min(flatBLatitude))
-    maxLatitude  = max(np.max(flatALatitude),  np.max(flatBLatitude))
-    minLongitude = min(np.min(flatALongitude), np.min(flatBLongitude))
-    maxLongitude = max(np.max(flatALongitude), np.max(flatBLongitude))
-    
-    # make the bins for the data in longitude/latitude space
-    aBins = { }
-    bBins = { }
-    allAPts = { }
-    allBPts = { }
-    
-    # loop to put all the aData in the bins
-    for index in range(flatALatitude.size) :
-        filingLat = int( flatALatitude[index])
-        filingLon = int(flatALongitude[index])
+    # figure out which points can be considered for matching at all
+    usableA = np.isfinite(flatALatitude) & np.isfinite(flatALongitude)
+    usableB = np.isfinite(flatBLatitude) & np.isfinite(flatBLongitude)
+    if invalidAMask is not None :
+        usableA &= ~invalidAMask.ravel()
+    if invalidBMask is not None :
+        usableB &= ~invalidBMask.ravel()
+    aIndexes = np.flatnonzero(usableA)
+    bIndexes = np.flatnonzero(usableB)
+    
+    # if either set has nothing we can match, there are no matches
+    if (aIndexes.size <= 0) or (bIndexes.size <= 0) :
+        LOG.debug('Found 0 matched pairs.')
+        return np.array([ ], dtype=np.int64), np.array([ ], dtype=np.int64), 0
+    
+    # bin the points and decide how we will test whether a pair matches
+    if greatCircleRadius is None :
+        make_bin_keys, aBins, offsets = _make_lon_lat_bin_keys(flatALatitude[aIndexes], flatALongitude[aIndexes], lonlatEpsilon)
+        _,             bBins, _       = _make_lon_lat_bin_keys(flatBLatitude[bIndexes], flatBLongitude[bIndexes], lonlatEpsilon)
         
-        if (filingLat, filingLon) not in aBins :
-            aBins[(filingLat, filingLon)] = [ ]
+        def is_match (aCandidates, bCandidates) :
+            return ((np.abs(flatBLatitude[bCandidates] - flatALatitude[aCandidates]) <= lonlatEpsilon) &
+                    (_longitude_difference(flatALongitude[aCandidates], flatBLongitude[bCandidates]) <= lonlatEpsilon))
+    else :
+        make_bin_keys, aBins, offsets = _make_sphere_bin_keys(flatALatitude[aIndexes], flatALongitude[aIndexes], greatCircleRadius)
+        _,             bBins, _       = _make_sphere_bin_keys(flatBLatitude[bIndexes], flatBLongitude[bIndexes], greatCircleRadius)
         
-        # create the simple list holding that point in the form:
-        # the lon/lat values (for ease of comparison), the index number in A, and the list of matches
-        aPoint = [flatALatitude[index], flatALongitude[index], index, [ ]]
+        def is_match (aCandidates, bCandidates) :
+            return delta.great_circle_distance(flatALatitude[aCandidates], flatALongitude[aCandidates],
+                                               flatBLatitude[bCandidates], flatBLongitude[bCandidates]) <= greatCircleRadius
+    
+    # sort the B points by their bin so each bin is a contiguous run in the sorted order
+    bKeys        = make_bin_keys(*bBins)
+    bOrder       = np.argsort(bKeys, kind='mergesort')
+    sortedBKeys  = bKeys[bOrder]
+    
+    # find the run of B points in each of the bins that are "near" each A point
+    runStarts = np.empty((len(offsets), aIndexes.size), dtype=np.int64)
+    runCounts = np.empty((len(offsets), aIndexes.size), dtype=np.int64)
+    for offsetNum, offset in enumerate(offsets) :
+        neighborKeys         = make_bin_keys(*[aBin + binOffset for aBin, binOffset in zip(aBins, offset)])
+        runStarts[offsetNum] = np.searchsorted(sortedBKeys, neighborKeys, side='left')
+        runCounts[offsetNum] = np.searchsorted(sortedBKeys, neighborKeys, side='right') - runStarts[offsetNum]
+    candidatesPerA = runCounts.sum(axis=0)
+    
+    # work through the A points in blocks so that the number of candidate pairs we hold at once is bounded
+    matchedAParts = [ ]
+    matchedBParts = [ ]
+    blockStart    = 0
+    candidatesSoFar = np.cumsum(candidatesPerA)
+    while blockStart < aIndexes.size :
         
-        # put the point in the list and bin
-        allAPts[index] = aPoint
-        aBins[(filingLat, filingLon)].append(aPoint)
-    
-    # loop to put all the bData in the bins
-    for index in range(flatBLatitude.size) :
-        filingLat = int( flatBLatitude[index])
-        filingLon = int(flatBLongitude[index])
+        # take as many A points as we can without going over our candidate limit (but always at least one)
+        alreadyUsed = candidatesSoFar[blockStart - 1] if blockStart > 0 else 0
+        blockEnd    = np.searchsorted(candidatesSoFar, alreadyUsed + MAX_CANDIDATE_PAIRS_PER_BLOCK, side='right')
+        blockEnd    = max(blockEnd, blockStart + 1)
         
-        if (filingLat, filingLon) not in bBins :
-            bBins[(filingLat, filingLon)] = [ ]
+        # build all the candidate pairs for this block of A points
+        blockStarts = runStarts[:, blockStart:blockEnd].T.ravel()
+        blockCounts = runCounts[:, blockStart:blockEnd].T.ravel()
+        candidateA  = np.repeat(aIndexes[blockStart:blockEnd], candidatesPerA[blockStart:blockEnd])
+        candidateB  = bIndexes[bOrder[_expand_ranges(blockStarts, blockCounts)]]
         
-        # create the simple list holding that point in the form:
-        # the lon/lat values (for ease of comparison), the index number in A, and the list of matches
-        bPoint = [flatBLatitude[index], flatBLongitude[index], index, [ ]]
+        # keep the pairs that are acceptable matches
+        isMatch = is_match(candidateA, candidateB)
+        matchedAParts.append(candidateA[isMatch])
+        matchedBParts.append(candidateB[isMatch])
         
-        # put the point in the list and bin
-        allBPts[index] = bPoint
-        bBins[(filingLat, filingLon)].append(bPoint)
+        blockStart = blockEnd
     
-    # for debugging purposes
-    totalMatches = 0
-    
-    # look in all the aData bins and select point pairs that match within epsilon
-    for binLatitude, binLongitude in aBins.keys() :
-        
-        # figure out the lat/lon of the 9 bins that are "near" this one
-        toSearch = [ ]
-        for latValue in (binLatitude - 1, binLatitude, binLatitude + 1) : # the old broken code: range(binLatitude - 1, binLatitude + 1) :
-            for lonValue in (binLongitude - 1, binLongitude, binLongitude + 1) : # the old broken code: range(binLongitude - 1, binLongitude + 1) :
-                toSearch.append((latValue, lonValue))
-        
-        # for each A pt in this bin
-        for aLat, aLon, aIndex, aMatches in aBins[(binLatitude, binLongitude)] :
-            
-            # look through my nearby B bins and find any
-            # "matching" points that fall within epsilon
-            for latValue, lonValue in toSearch :
-                
-                # if there's anything in that B bin
-                if ((latValue, lonValue) in bBins) and (bBins[(latValue, lonValue)] is not None) :
-                    
-                    # for each data point in the B bin, check if it matches our current A point
-                    for bLat, bLon, bIndex, bMatches in bBins[(latValue, lonValue)] :
-                        
-                        # if the difference is is less than or equal to epsilon, this is an acceptable match
-                        if (abs(bLat - aLat) <= lonlatEpsilon) and (abs(aLon - bLon) <= lonlatEpsilon) :
-                            totalMatches = totalMatches + 1
-                            
-                            # put the point on our matched lists
-                            aMatches.append(bIndex)
-                            bMatches.append(aIndex)
+    # put the pairs in order by A index and then B index
+    matchedAIndexes = np.concatenate(matchedAParts)
+    matchedBIndexes = np.concatenate(matchedBParts)
+    pairOrder       = np.lexsort((matchedBIndexes, matchedAIndexes))
+    matchedAIndexes = matchedAIndexes[pairOrder]
+    matchedBIndexes = matchedBIndexes[pairOrder]
+    totalMatches    = matchedAIndexes.size
     
     LOG.debug('Found ' + str(totalMatches) + ' matched pairs.')
     
-    return allAPts, allBPts, totalMatches
+    return matchedAIndexes, matchedBIndexes, totalMatches
+
+def get_colocation_mapping_key ((alongitude, alatitude),
+                                (blongitude, blatitude),
+                                lonlatEpsilon,
+                                invalidAMask=None, invalidBMask=None,
+                                greatCircleRadius=None) :
+    """
+    get a key (an md5 hex digest) that uniquely identifies the colocation mapping
+    create_colocation_mapping_within_epsilon would produce for these inputs
+    """
+    
+    hasher = hashlib.md5()
+    hasher.update("version " + str(COLOCATION_MAPPING_FORMAT_VERSION) + "\n")
+    hasher.update("epsilon " + repr(float(lonlatEpsilon)) + "\n")
+    hasher.update("radius "  + repr(None if greatCircleRadius is None else float(greatCircleRadius)) + "\n")
+    
+    # include the contents, types, and shapes of all the arrays that affect the matching
+    for name, array in (("a longitude", alongitude), ("a latitude", alatitude), ("a invalid", invalidAMask),
+                        ("b longitude", blongitude), ("b latitude", blatitude), ("b invalid", invalidBMask)) :
+        if array is None :
+            hasher.update(name + " none\n")
+        else :
+            array = np.ascontiguousarray(array)
+            hasher.update(name + " " + array.dtype.str + " " + str(array.shape) + "\n")
+            hasher.update(array)
+    
+    return hasher.hexdigest()
 
-def create_colocated_lonlat_with_lon_lat_colocation(listOfColocatedALonLat, listOfColocatedBLonLat,
+def _smallest_index_type (numPoints) :
+    """
+    get the smallest unsigned type that can hold an index into numPoints points
+    """
+    
+    return np.uint32 if numPoints <= np.iinfo(np.uint32).max else np.uint64
+
+def save_colocation_mapping (pathToFile, aMatchIndexes, bMatchIndexes, aSize, bSize) :
+    """
+    save a colocation mapping from create_colocation_mapping_within_epsilon to a compressed
+    .npz file so it can be reused later with load_colocation_mapping
+    
+    aSize and bSize are the number of points in the original A and B longitude/latitude,
+    the unmatched indexes and the number of matches for each point are stored along with
+    the matched pairs so other tools can inspect them without redoing the work
+    
+    the file is written to a temporary name first and then moved into place, so a partially
+    written mapping will never be loaded
+    """
+    
+    aMatchCounts = np.bincount(aMatchIndexes, minlength=aSize)
+    bMatchCounts = np.bincount(bMatchIndexes, minlength=bSize)
+    countType    = _smallest_index_type(max(aMatchCounts.max() if aSize > 0 else 0, bMatchCounts.max() if bSize > 0 else 0))
+    
+    tempFileDescriptor, tempPath = tempfile.mkstemp(suffix=COLOCATION_MAPPING_FILE_SUFFIX, dir=os.path.dirname(os.path.abspath(pathToFile)))
+    try :
+        with os.fdopen(tempFileDescriptor, 'wb') as tempFile :
+            np.savez_compressed(tempFile,
+                                format_version=np.array(COLOCATION_MAPPING_FORMAT_VERSION),
+                                a_size=np.array(aSize), b_size=np.array(bSize),
+                                a_match_indexes=aMatchIndexes.astype(_smallest_index_type(aSize)),
+                                b_match_indexes=bMatchIndexes.astype(_smallest_index_type(bSize)),
+                                a_unmatched_indexes=np.flatnonzero(aMatchCounts <= 0).astype(_smallest_index_type(aSize)),
+                                b_unmatched_indexes=np.flatnonzero(bMatchCounts <= 0).astype(_smallest_index_type(bSize)),
+                                a_match_counts=aMatchCounts.astype(countType),
+                                b_match_counts=bMatchCounts.astype(countType))
+        os.rename(tempPath, pathToFile)
+    except :
+        if os.path.exists(tempPath) :
+            os.remove(tempPath)
+        raise
+
+def load_colocation_mapping (pathToFile) :
+    """
+    load a colocation mapping saved by save_colocation_mapping
+    
+    the return will be in the same form as create_colocation_mapping_within_epsilon,
+    or None if the file could not be loaded
+    """
+    
+    try :
+        with np.load(pathToFile) as mappingFile :
+            if int(mappingFile['format_version']) != COLOCATION_MAPPING_FORMAT_VERSION :
+                LOG.debug("Ignoring colocation mapping in an old format: " + pathToFile)
+                return None
+            aMatchIndexes = mappingFile['a_match_indexes'].astype(np.int64)
+            bMatchIndexes = mappingFile['b_match_indexes'].astype(np.int64)
+    except (IOError, OSError, KeyError, ValueError), err :
+        LOG.warn("Unable to load saved colocation mapping (" + pathToFile + "): " + str(err))
+        return None
+    
+    return aMatchIndexes, bMatchIndexes, aMatchIndexes.size
+
+def create_or_load_colocation_mapping_within_epsilon ((alongitude, alatitude),
+                                                      (blongitude, blatitude),
+                                                      lonlatEpsilon,
+                                                      invalidAMask=None, invalidBMask=None,
+                                                      greatCircleRadius=None,
+                                                      cacheDirectory=None) :
+    """
+    get the colocation mapping create_colocation_mapping_within_epsilon would create,
+    reusing a mapping saved in the cacheDirectory if these exact inputs have been matched before
+    
+    if a cacheDirectory is given and no saved mapping exists, the newly created mapping
+    will be saved there for later runs; if the cacheDirectory is None this is the same
+    as calling create_colocation_mapping_within_epsilon
+    """
+    
+    if cacheDirectory is None :
+        return create_colocation_mapping_within_epsilon((alongitude, alatitude), (blongitude, blatitude),
+                                                        lonlatEpsilon,
+                                                        invalidAMask=invalidAMask, invalidBMask=invalidBMask,
+                                                        greatCircleRadius=greatCircleRadius)
+    
+    # figure out where this mapping would be saved
+    mappingKey  = get_colocation_mapping_key((alongitude, alatitude), (blongitude, blatitude),
+                                             lonlatEpsilon,
+                                             invalidAMask=invalidAMask, invalidBMask=invalidBMask,
+                                             greatCircleRadius=greatCircleRadius)
+    mappingPath = os.path.join(cacheDirectory, COLOCATION_MAPPING_FILE_PREFIX + mappingKey + COLOCATION_MAPPING_FILE_SUFFIX)
+    
+    # if we've done this matching before, use the old results
+    if os.path.exists(mappingPath) :
+        LOG.debug("Loading saved colocation mapping: " + mappingPath)
+        loadedMapping = load_colocation_mapping(mappingPath)
+        if loadedMapping is not None :
+            LOG.debug('Found ' + str(loadedMapping[2]) + ' matched pairs.')
+            return loadedMapping
+    
+    # otherwise do the matching and save it for next time
+    aMatchIndexes, bMatchIndexes, totalMatches = \
+            create_colocation_mapping_within_epsilon((alongitude, alatitude), (blongitude, blatitude),
+                                                     lonlatEpsilon,
+                                                     invalidAMask=invalidAMask, invalidBMask=invalidBMask,
+                                                     greatCircleRadius=greatCircleRadius)
+    try :
+        LOG.debug("Saving colocation mapping: " + mappingPath)
+        save_colocation_mapping(mappingPath, aMatchIndexes, bMatchIndexes, alongitude.size, blongitude.size)
+    except (IOError, OSError), err :
+        LOG.warn("Unable to save colocation mapping (" + mappingPath + "): " + str(err))
+    
+    return aMatchIndexes, bMatchIndexes, totalMatches
+
+def _count_multiple_matches (matchCounts) :
+    """
+    given the number of matches for each point, return the total number of
+    matches that involve points used in more than one match
+    """
+    
+    return int(np.sum(matchCounts[matchCounts > 1]))
+
+def create_colocated_lonlat_with_lon_lat_colocation(aMatchIndexes, bMatchIndexes,
                                                     totalMatches,
                                                     aLongitude, aLatitude,
                                                     bLongitude, bLatitude) :
     """
-    given a pre colocated list of A and B lon/lat info from create_colocation_mapping_within_epsilon,
+    given the matched A and B indexes from create_colocation_mapping_within_epsilon,
     match up the longitude and latitude and return the colocated sets
     """
     
+    assert(aMatchIndexes.size == totalMatches)
+    assert(bMatchIndexes.size == totalMatches)
+    
+    flatALongitude = aLongitude.ravel()
+    flatALatitude  =  aLatitude.ravel()
+    flatBLongitude = bLongitude.ravel()
+    flatBLatitude  =  bLatitude.ravel()
+    
+    # our final data sets are the average positions of each matched pair
+    matchedLongitude = ((flatALongitude[aMatchIndexes] + flatBLongitude[bMatchIndexes]) / 2).astype(aLongitude.dtype)
+    matchedLatitide  = ((flatALatitude [aMatchIndexes] + flatBLatitude [bMatchIndexes]) / 2).astype(aLatitude.dtype)
+    
+    # count up how many times each point was matched
+    aMatchCounts = np.bincount(aMatchIndexes, minlength=flatALongitude.size)
+    bMatchCounts = np.bincount(bMatchIndexes, minlength=flatBLongitude.size)
+    
     # some general statistics
-    multipleMatchesInA      = 0
-    multipleMatchesInB      = 0
-    totalValidMatchedPairs  = 0
-    
-    # our final data sets
-    matchedLongitude   = np.zeros(totalMatches, dtype=aLongitude.dtype) 
-    matchedLatitide    = np.zeros(totalMatches, dtype=aLatitude.dtype) 
-    
-    # we don't know how many unmatched points we may have
-    unmatchedALongitude = [ ]
-    unmatchedALatitude  = [ ]
-    unmatchedBLongitude = [ ]
-    unmatchedBLatitude  = [ ]
-    
-    # go through the A list and collect all the matches
-    currentIndex = 0
-    # look through all the A points
-    for aIndex in sorted(listOfColocatedALonLat.keys()) :
-        
-        [aLon, aLat, aIndex, aMatches] = listOfColocatedALonLat[aIndex]
-        tempMatches = 0
-        
-        # for each match you found on a given a point
-        for matchIndex in sorted(aMatches) :
-            
-            [bLon, bLat, bIndex, bMatches] = listOfColocatedBLonLat[matchIndex]
-            
-            # copy the lon/lat info 
-            matchedLongitude[currentIndex] = (aLon + bLon) / 2
-            matchedLatitide[currentIndex]  = (aLat + bLat) / 2
-            
-            currentIndex = currentIndex + 1
-            tempMatches  = tempMatches  + 1
-        
-        # update statistics based on the number of matches
-        totalValidMatchedPairs = totalValidMatchedPairs + tempMatches
-        if tempMatches > 1 :
-            multipleMatchesInA = multipleMatchesInA + tempMatches
-        elif tempMatches <= 0 :
-            unmatchedALatitude.append(aLat)
-            unmatchedALongitude.append(aLon)
-    
-    # gather some additional statistics from the B list
-    # go through each b point
-    for bIndex in sorted(listOfColocatedBLonLat) :
-        
-        [bLon, bLat, bIndex, bMatches] = listOfColocatedBLonLat[bIndex]
-        tempMatches = len(bMatches)
-        
-        # update some statistics based on the number of matches
-        if tempMatches > 1 :
-            multipleMatchesInB = multipleMatchesInB + tempMatches
-        elif tempMatches <= 0 :
-            unmatchedBLatitude.append(bLat)
-            unmatchedBLongitude.append(bLon)
+    multipleMatchesInA = _count_multiple_matches(aMatchCounts)
+    multipleMatchesInB = _count_multiple_matches(bMatchCounts)
     
-    # make the unmatched lists into proper numpy arrays
-    unmatchedALatitude  = np.array(unmatchedALatitude,  dtype=aLatitude.dtype)
-    unmatchedALongitude = np.array(unmatchedALongitude, dtype=aLongitude.dtype)
-    unmatchedBLatitude  = np.array(unmatchedBLatitude,  dtype=bLatitude.dtype)
-    unmatchedBLongitude = np.array(unmatchedBLongitude, dtype=bLongitude.dtype)
+    # pull out the points that were never matched
+    unmatchedALongitude = flatALongitude[aMatchCounts <= 0]
+    unmatchedALatitude  =  flatALatitude[aMatchCounts <= 0]
+    unmatchedBLongitude = flatBLongitude[bMatchCounts <= 0]
+    unmatchedBLatitude  =  flatBLatitude[bMatchCounts <= 0]
     
-    LOG.debug("Total matched pairs of longitude/latitide: " + str(totalValidMatchedPairs))
+    LOG.debug("Total matched pairs of longitude/latitide: " + str(totalMatches))
     
     return (matchedLongitude,    matchedLatitide, (multipleMatchesInA, multipleMatchesInB)), \
            (unmatchedALongitude, unmatchedALatitude), \
            (unmatchedBLongitude, unmatchedBLatitude)
 
-def create_colocated_data_with_lon_lat_colocation(listOfColocatedALonLat, listOfColocatedBLonLat,
-                                                  colocatedLongitude, colocatedLatitude,
+def create_colocated_data_with_lon_lat_colocation(aMatchIndexes, bMatchIndexes,
+                                                  (aLongitude, aLatitude),
+                                                  (bLongitude, bLatitude),
                                                   aData, bData,
                                                   missingData, altMissingDataInB=None,
                                                   invalidAMask=None, invalidBMask=None) :
     """
-    given a pre colocated list of A and B lon/lat info from create_colocation_mapping_within_epsilon,
+    given the matched A and B indexes from create_colocation_mapping_within_epsilon,
     match up the valid data in two data sets and return the list of valid data, padded with missing
-    values so that it will match the original longitude and latitude
+    values so that it will match the colocated longitude and latitude
     """
     
     # Todo other asserts needed?
     assert(missingData is not None)
+    assert(aMatchIndexes.size == bMatchIndexes.size)
     
     if altMissingDataInB is None :
         altMissingDataInB = missingData
     
+    # make flat versions of everything so the indexes line up
+    flatAData      = aData.ravel()
+    flatBData      = bData.ravel()
+    invalidAMask   = np.zeros(flatAData.shape, dtype=bool) if invalidAMask is None else invalidAMask.ravel()
+    invalidBMask   = np.zeros(flatBData.shape, dtype=bool) if invalidBMask is None else invalidBMask.ravel()
+    
+    # if either of our data points is invalid, then the data doesn't match
+    validPairs     = ~(invalidAMask[aMatchIndexes] | invalidBMask[bMatchIndexes])
+    validAIndexes  = aMatchIndexes[validPairs]
+    validBIndexes  = bMatchIndexes[validPairs]
+    
+    # our final data sets, with missing data anywhere we didn't have a valid match
+    matchedAPoints = np.ones(aMatchIndexes.shape, dtype=aData.dtype) * missingData
+    matchedBPoints = np.ones(bMatchIndexes.shape, dtype=bData.dtype) * altMissingDataInB
+    matchedAPoints[validPairs] = flatAData[validAIndexes]
+    matchedBPoints[validPairs] = flatBData[validBIndexes]
+    
+    # count up how many valid matches each point was part of
+    aMatchCounts = np.bincount(validAIndexes, minlength=flatAData.size)
+    bMatchCounts = np.bincount(validBIndexes, minlength=flatBData.size)
+    
     # some general statistics
-    multipleMatchesInA      = 0
-    multipleMatchesInB      = 0
-    totalValidMatchedPairs  = 0
-    
-    # our final data sets
-    matchedAPoints     = np.ones(colocatedLatitude.shape, dtype=aData.dtype) * missingData
-    matchedBPoints     = np.ones(colocatedLatitude.shape, dtype=bData.dtype) * altMissingDataInB
-    
-    # we don't know how many unmatched points we may have
-    unmatchedAPoints    = [ ]
-    unmatchedBPoints    = [ ]
-    unmatchedALongitude = [ ]
-    unmatchedALatitude  = [ ]
-    unmatchedBLongitude = [ ]
-    unmatchedBLatitude  = [ ]
-    
-    # go through the A list and sort all the valid matches
-    currentIndex = 0
-    # go through all the a points
-    for aIndex in sorted(listOfColocatedALonLat.keys()) :
-        
-        [aLon, aLat, aIndex, aMatches] = listOfColocatedALonLat[aIndex]
-        tempMatches = 0
-        isInvalidA = invalidAMask[aIndex]
-        
-        # for each point that matched to a given a point
-        for matchIndex in sorted(aMatches) :
-            
-            [bLon, bLat, bIndex, bMatches] = listOfColocatedBLonLat[matchIndex]
-            isInvalidB = invalidBMask[bIndex]
-            
-            # if either of our data points is invalid, then the data doesn't match
-            if isInvalidA or isInvalidB :
-                # fill in missing data in the matches
-                matchedAPoints[currentIndex] = missingData
-                matchedBPoints[currentIndex] = altMissingDataInB
-            else: # we have a valid match!
-                tempMatches = tempMatches + 1
-                matchedAPoints[currentIndex] = aData[aIndex]
-                matchedBPoints[currentIndex] = bData[bIndex]
-            
-            currentIndex = currentIndex + 1
-        
-        totalValidMatchedPairs = totalValidMatchedPairs + tempMatches
-        if tempMatches > 1 :
-            multipleMatchesInA = multipleMatchesInA + tempMatches
-        elif (tempMatches <= 0) and (not isInvalidA) :
-            unmatchedAPoints.append(aData[aIndex])
-            unmatchedALongitude.append(aLon)
-            unmatchedALatitude.append(aLat)
-    
-    # gather some additional statistics from the B list
-    # go through all the b points
-    for bIndex in sorted(listOfColocatedBLonLat.keys()) :
-        
-        [bLon, bLat, bIndex, bMatches] = listOfColocatedBLonLat[bIndex]
-        tempMatches = 0
-        isInvalidB = invalidBMask[bIndex]
-        
-        # for each point that matched to a given b point
-        for matchIndex in sorted(bMatches) :
-            
-            [aLon, aLat, aIndex, aMatches] = listOfColocatedALonLat[matchIndex]
-            isInvalidA = invalidAMask[aIndex]
-            
-            # if either of our data points is invalid, then the data doesn't match
-            if isInvalidB or isInvalidA :
-                # we've already built our matched data, so no need to missing it out
-                pass
-            else: # we have a valid match!
-                tempMatches = tempMatches + 1
-        
-        if tempMatches > 1 :
-            multipleMatchesInB = multipleMatchesInB + tempMatches
-        elif (tempMatches <= 0) and (not isInvalidB) :
-            unmatchedBPoints.append(bData[bIndex])
-            unmatchedBLongitude.append(bLon)
-            unmatchedBLatitude.append(bLat)
-    
-    # make the unmatched lists into proper numpy arrays
-    unmatchedAPoints    = np.array(unmatchedAPoints,    dtype=aData.dtype)
-    unmatchedBPoints    = np.array(unmatchedBPoints,    dtype=bData.dtype)
-    unmatchedALongitude = np.array(unmatchedALongitude, dtype=colocatedLongitude.dtype)
-    unmatchedALatitude  = np.array(unmatchedALatitude,  dtype=colocatedLatitude.dtype)
-    unmatchedBLongitude = np.array(unmatchedBLongitude, dtype=colocatedLongitude.dtype)
-    unmatchedBLatitude  = np.array(unmatchedBLatitude,  dtype=colocatedLatitude.dtype)
+    totalValidMatchedPairs = validAIndexes.size
+    multipleMatchesInA     = _count_multiple_matches(aMatchCounts)
+    multipleMatchesInB     = _count_multiple_matches(bMatchCounts)
+    
+    # the valid points that were never matched
+    unmatchedAMask = (aMatchCounts <= 0) & ~invalidAMask
+    unmatchedBMask = (bMatchCounts <= 0) & ~invalidBMask
+    unmatchedAPoints    = flatAData[unmatchedAMask]
+    unmatchedBPoints    = flatBData[unmatchedBMask]
+    unmatchedALongitude = aLongitude.ravel()[unmatchedAMask]
+    unmatchedALatitude  =  aLatitude.ravel()[unmatchedAMask]
+    unmatchedBLongitude = bLongitude.ravel()[unmatchedBMask]
+    unmatchedBLatitude  =  bLatitude.ravel()[unmatchedBMask]
     
     LOG.debug("Total matched data point pairs found: " + str(totalValidMatchedPairs))
     
@@ -12,6 +12,7 @@ Copyright (c) 2009 University of Wisconsin SSEC. All rights reserved.
 #from pprint import pprint, pformat
 
 import os, sys, logging, re, datetime
+import multiprocessing
 from numpy import *
 import numpy
 from urllib import quote
@@ -33,9 +34,11 @@ import glance.data   as dataobj
 import glance.report as report
 import glance.stats  as statistics
 import glance.plot   as plot
+import glance.graphics as maps
 import glance.plotcreatefns as plotcreate
 import glance.collocation   as collocation
 import glance.config_organizer as config_organizer
+import glance.resultcache as resultcache
 
 from glance.util        import clean_path, rsync_or_copy_files, get_glance_version_string, get_run_identification_info, setup_dir_if_needed
 from glance.load        import get_UV_info_from_magnitude_direction_info, load_variable_data, open_and_process_files, handle_lon_lat_info, handle_lon_lat_info_for_one_file, ValueErrorStringToFloat
@@ -76,6 +79,16 @@ def _get_name_info_for_variable(original_display_name, variable_run_info) :
     
     return technical_name, b_variable_technical_name, explanation_name
 
+def _prefetch_attributes_if_requested (runInfo, *fileObjects) :
+    """
+    if the run settings ask for it, load all the variable attributes of each of these files at once
+    """
+    
+    if (PREFETCH_ATTRIBUTES_KEY in runInfo) and runInfo[PREFETCH_ATTRIBUTES_KEY] :
+        for fileObject in fileObjects :
+            io.prefetch_attributes(fileObject)
+
+@io.with_file_pool
 def colocateToFile_library_call(a_path, b_path, var_list=[ ],
                                 options_set={ },
                                 # todo, this doesn't yet do anything
@@ -94,6 +107,15 @@ def colocateToFile_library_call(a_path, b_path, var_list=[ ],
                                                                                                                 options_set,
                                                                                                                 requestedVars = var_list)
     
+    # set up how the md5 sums of the files will be found
+    dataobj.configure_checksums(cacheDirectory=runInfo[CACHE_DIR_KEY] if CACHE_DIR_KEY in runInfo else None,
+                                skipChecksums=runInfo[SKIP_CHECKSUMS_KEY] if SKIP_CHECKSUMS_KEY in runInfo else False)
+    # and where basemaps will be kept between runs
+    maps.set_basemap_cache_directory(runInfo[CACHE_DIR_KEY] if CACHE_DIR_KEY in runInfo else None)
+    # and how images will be written
+    plot.configure_image_output(compressionLevel=runInfo[PNG_COMPRESSION_KEY]       if PNG_COMPRESSION_KEY       in runInfo else None,
+                                threadedEncode=  runInfo[THREADED_IMAGE_ENCODE_KEY] if THREADED_IMAGE_ENCODE_KEY in runInfo else False)
+    
     # deal with the input and output files
     setup_dir_if_needed(pathsTemp[OUT_FILE_KEY], "output")
     
@@ -114,6 +136,9 @@ def colocateToFile_library_call(a_path, b_path, var_list=[ ],
         LOG.warn("Unable to continue with comparison because file b (" + pathsTemp[B_FILE_KEY] + ") could not be opened.")
         sys.exit(1)
     
+    # if we were asked to, load all the variable attributes at once
+    _prefetch_attributes_if_requested(runInfo, aFile.file_object, bFile.file_object)
+    
     # get information about the names the user requested
     finalNames, nameStats = config_organizer.resolve_names(aFile.file_object,
                                                            bFile.file_object,
@@ -139,16 +164,22 @@ def colocateToFile_library_call(a_path, b_path, var_list=[ ],
     
     # handle the longitude and latitude colocation
     LOG.info("Colocating raw longitude and latitude information")
-    aColocationInfomation, bColocationInformation, totalNumberOfMatchedPoints = \
-                    collocation.create_colocation_mapping_within_epsilon((lon_lat_data[A_FILE_KEY][LON_KEY], lon_lat_data[A_FILE_KEY][LAT_KEY]),
-                                                                         (lon_lat_data[B_FILE_KEY][LON_KEY], lon_lat_data[B_FILE_KEY][LAT_KEY]),
-                                                                         runInfo[LON_LAT_EPSILON_KEY],
-                                                                         invalidAMask=lon_lat_data[A_FILE_KEY][INVALID_MASK_KEY],
-                                                                         invalidBMask=lon_lat_data[B_FILE_KEY][INVALID_MASK_KEY])
+    
+    # reuse the mapping from an earlier run over the same navigation if we can
+    colocationCacheDir = runInfo[CACHE_DIR_KEY] if (CACHE_DIR_KEY in runInfo) and (runInfo[CACHE_DIR_KEY] is not None) else pathsTemp[OUT_FILE_KEY]
+    setup_dir_if_needed(colocationCacheDir, "cache")
+    aMatchIndexes, bMatchIndexes, totalNumberOfMatchedPoints = \
+                    collocation.create_or_load_colocation_mapping_within_epsilon((lon_lat_data[A_FILE_KEY][LON_KEY], lon_lat_data[A_FILE_KEY][LAT_KEY]),
+                                                                                 (lon_lat_data[B_FILE_KEY][LON_KEY], lon_lat_data[B_FILE_KEY][LAT_KEY]),
+                                                                                 runInfo[LON_LAT_EPSILON_KEY],
+                                                                                 invalidAMask=lon_lat_data[A_FILE_KEY][INVALID_MASK_KEY],
+                                                                                 invalidBMask=lon_lat_data[B_FILE_KEY][INVALID_MASK_KEY],
+                                                                                 greatCircleRadius=runInfo[LON_LAT_GREAT_CIRCLE_RADIUS_KEY] if LON_LAT_GREAT_CIRCLE_RADIUS_KEY in runInfo else None,
+                                                                                 cacheDirectory=colocationCacheDir)
     (colocatedLongitude, colocatedLatitude, (numMultipleMatchesInA, numMultipleMatchesInB)), \
     (unmatchedALongitude, unmatchedALatitude), \
     (unmatchedBLongitude, unmatchedBLatitude) = \
-                collocation.create_colocated_lonlat_with_lon_lat_colocation(aColocationInfomation, bColocationInformation,
+                collocation.create_colocated_lonlat_with_lon_lat_colocation(aMatchIndexes, bMatchIndexes,
                                                                             totalNumberOfMatchedPoints,
                                                                             lon_lat_data[A_FILE_KEY][LON_KEY], lon_lat_data[A_FILE_KEY][LAT_KEY],
                                                                             lon_lat_data[B_FILE_KEY][LON_KEY], lon_lat_data[B_FILE_KEY][LAT_KEY])
@@ -179,13 +210,13 @@ def colocateToFile_library_call(a_path, b_path, var_list=[ ],
                                    dataFilter = varRunInfo[FILTER_FUNCTION_A_KEY] if FILTER_FUNCTION_A_KEY in varRunInfo else None,
                                    variableToFilterOn = varRunInfo[VAR_FILTER_NAME_A_KEY] if VAR_FILTER_NAME_A_KEY in varRunInfo else None,
                                    variableBasedFilter = varRunInfo[VAR_FILTER_FUNCTION_A_KEY] if VAR_FILTER_FUNCTION_A_KEY in varRunInfo else None,
-                                   altVariableFileObject = dataobj.FileInfo(varRunInfo[VAR_FILTER_ALT_FILE_A_KEY]).file_object if VAR_FILTER_ALT_FILE_A_KEY in varRunInfo else None,
+                                   altVariableFilePath = varRunInfo[VAR_FILTER_ALT_FILE_A_KEY] if VAR_FILTER_ALT_FILE_A_KEY in varRunInfo else None,
                                    fileDescriptionForDisplay = "file A")
         bData = load_variable_data(bFile.file_object, b_variable_technical_name,
                                    dataFilter = varRunInfo[FILTER_FUNCTION_B_KEY] if FILTER_FUNCTION_B_KEY in varRunInfo else None,
                                    variableToFilterOn = varRunInfo[VAR_FILTER_NAME_B_KEY] if VAR_FILTER_NAME_B_KEY in varRunInfo else None,
                                    variableBasedFilter = varRunInfo[VAR_FILTER_FUNCTION_B_KEY] if VAR_FILTER_FUNCTION_B_KEY in varRunInfo else None,
-                                   altVariableFileObject = dataobj.FileInfo(varRunInfo[VAR_FILTER_ALT_FILE_B_KEY]).file_object if VAR_FILTER_ALT_FILE_B_KEY in varRunInfo else None,
+                                   altVariableFilePath = varRunInfo[VAR_FILTER_ALT_FILE_B_KEY] if VAR_FILTER_ALT_FILE_B_KEY in varRunInfo else None,
                                    fileDescriptionForDisplay = "file B")
         
         # colocate the data for this variable if we have longitude/latitude data
@@ -199,8 +230,9 @@ def colocateToFile_library_call(a_path, b_path, var_list=[ ],
             (aData, bData, (numberOfMultipleMatchesInA, numberOfMultipleMatchesInB)), \
             (aUnmatchedData,             unmatchedALongitude, unmatchedALatitude), \
             (bUnmatchedData,             unmatchedBLongitude, unmatchedBLatitude) = \
-                    collocation.create_colocated_data_with_lon_lat_colocation(aColocationInfomation, bColocationInformation,
-                                                                              colocatedLongitude, colocatedLatitude,
+                    collocation.create_colocated_data_with_lon_lat_colocation(aMatchIndexes, bMatchIndexes,
+                                                                              (lon_lat_data[A_FILE_KEY][LON_KEY], lon_lat_data[A_FILE_KEY][LAT_KEY]),
+                                                                              (lon_lat_data[B_FILE_KEY][LON_KEY], lon_lat_data[B_FILE_KEY][LAT_KEY]),
                                                                               aData, bData,
                                                                               missingData=varRunInfo[FILL_VALUE_KEY],
                                                                               altMissingDataInB=varRunInfo[FILL_VALUE_ALT_IN_B_KEY],
@@ -238,8 +270,8 @@ def colocateToFile_library_call(a_path, b_path, var_list=[ ],
     # the end of the loop to examine all the variables
     
     # we're done with the files, so close them up
-    aFile.file_object.close()
-    bFile.file_object.close()
+    io.release_file(aFile.file_object)
+    io.release_file(bFile.file_object)
     
     return
 
@@ -380,6 +412,7 @@ def reportGen_raw_data_simple_call (aData, bData, variableDisplayName,
                 + str(bData.shape) + ').')
         LOG.warn(message)
 
+@io.with_file_pool
 def inspect_library_call (a_path, var_list=[ ],
                           options_set={ },
                           # todo, this doesn't yet do anything
@@ -417,6 +450,15 @@ def inspect_library_call (a_path, var_list=[ ],
     # hang onto info to identify who/what/when/where/etc. the report is being run by/for 
     runInfo[MACHINE_INFO_KEY], runInfo[USER_INFO_KEY], runInfo[GLANCE_VERSION_INFO_KEY] = get_run_identification_info()
     
+    # set up how the md5 sums of the files will be found
+    dataobj.configure_checksums(cacheDirectory=runInfo[CACHE_DIR_KEY] if CACHE_DIR_KEY in runInfo else None,
+                                skipChecksums=runInfo[SKIP_CHECKSUMS_KEY] if SKIP_CHECKSUMS_KEY in runInfo else False)
+    # and where basemaps will be kept between runs
+    maps.set_basemap_cache_directory(runInfo[CACHE_DIR_KEY] if CACHE_DIR_KEY in runInfo else None)
+    # and how images will be written
+    plot.configure_image_output(compressionLevel=runInfo[PNG_COMPRESSION_KEY]       if PNG_COMPRESSION_KEY       in runInfo else None,
+                                threadedEncode=  runInfo[THREADED_IMAGE_ENCODE_KEY] if THREADED_IMAGE_ENCODE_KEY in runInfo else False)
+    
     # deal with the input and output files
     setup_dir_if_needed(pathsTemp[OUT_FILE_KEY], "output")
     # open the file
@@ -428,6 +470,9 @@ def inspect_library_call (a_path, var_list=[ ],
         LOG.warn("Unable to continue with examination because file (" + pathsTemp[A_FILE_KEY] + ") could not be opened.")
         sys.exit(1)
 
+    # if we were asked to, load all the variable attributes at once
+    _prefetch_attributes_if_requested(runInfo, aFile.file_object)
+    
     # get information about the names the user requested
     nameStats = {}
     finalNames, nameStats[POSSIBLE_NAMES_KEY] = config_organizer.resolve_names_one_file(aFile.file_object,
@@ -483,7 +528,7 @@ def inspect_library_call (a_path, var_list=[ ],
                                        dataFilter = varRunInfo[FILTER_FUNCTION_A_KEY] if FILTER_FUNCTION_A_KEY in varRunInfo else None,
                                        variableToFilterOn = varRunInfo[VAR_FILTER_NAME_A_KEY] if VAR_FILTER_NAME_A_KEY in varRunInfo else None,
                                        variableBasedFilter = varRunInfo[VAR_FILTER_FUNCTION_A_KEY] if VAR_FILTER_FUNCTION_A_KEY in varRunInfo else None,
-                                       altVariableFileObject = dataobj.FileInfo(varRunInfo[VAR_FILTER_ALT_FILE_A_KEY]).file_object if VAR_FILTER_ALT_FILE_A_KEY in varRunInfo else None,
+                                       altVariableFilePath = varRunInfo[VAR_FILTER_ALT_FILE_A_KEY] if VAR_FILTER_ALT_FILE_A_KEY in varRunInfo else None,
                                        fileDescriptionForDisplay = "file A")
         except Exception as e :
             LOG.warn(displayName + " data could not be loaded. This variable will not be included in the output report. " +
@@ -528,7 +573,8 @@ def inspect_library_call (a_path, var_list=[ ],
             
             variable_stats = statistics.StatisticalInspectionAnalysis.withSimpleData(aData,
                                                                                      missingValue=varRunInfo[FILL_VALUE_KEY],
-                                                                                     ignoreMask=mask_a_to_use).dictionary_form()
+                                                                                     ignoreMask=mask_a_to_use,
+                                                                                     quantile_sketch_accuracy=runInfo[QUANTILE_SKETCH_ACCURACY_KEY]).dictionary_form()
             
             # add a little additional info to our variable run info before we squirrel it away
             varRunInfo[TIME_INFO_KEY] = datetime.datetime.ctime(datetime.datetime.now())  # todo is this needed?
@@ -591,6 +637,11 @@ def inspect_library_call (a_path, var_list=[ ],
                              makeSmall=True,
                              doFork=runInfo[DO_MAKE_FORKS_KEY],
                              shouldClearMemoryWithThreads=runInfo[DO_CLEAR_MEM_THREADED_KEY],
+                             maxWorkers=      runInfo[MAX_FIGURE_WORKERS_KEY] if MAX_FIGURE_WORKERS_KEY in runInfo else None,
+                             figuresPerWorker=runInfo[FIGURES_PER_WORKER_KEY] if FIGURES_PER_WORKER_KEY in runInfo else None,
+                             minFreeMemoryMB= runInfo[MIN_FREE_MEMORY_KEY]    if MIN_FREE_MEMORY_KEY    in runInfo else None,
+                             sharedArrayDirectory=runInfo[SHARED_ARRAY_DIR_KEY] if SHARED_ARRAY_DIR_KEY in runInfo else None,
+                             compactMasks=runInfo[COMPACT_MASKS_KEY] if COMPACT_MASKS_KEY in runInfo else False,
                              shouldUseSharedRangeForOriginal=runInfo[USE_SHARED_ORIG_RANGE_KEY],
                              doPlotSettingsDict = varRunInfo,
                              aUData=aUData, aVData=aVData,
@@ -650,6 +701,389 @@ def inspect_library_call (a_path, var_list=[ ],
     
     return 0
 
+def _analyze_variable_for_report (displayName, varRunInfo, aFileObject, bFileObject,
+                                  files, runInfo, defaultValues, outputPath,
+                                  lon_lat_data, spatialInfo) :
+    """
+    load, analyze, plot, and make the report page for a single variable for reportGen
+    
+    varRunInfo should be a copy of the variable's run information, it will be
+    updated with the results of the analysis
+    
+    returns the comparison information for the variable's entry in the summary report
+    (or None if the variable wasn't compared or no report is being made) and whether
+    the variable passed (or None if it wasn't compared or there were no criteria set)
+    
+    if there is a cache directory, the results are kept there and a later run making the
+    same comparison (same files, settings, and glance version) will reuse them, making
+    only the variable's report page again
+    """
+    
+    # if there is an approved lon/lat shape, hang on to that for future checks
+    good_shape_from_lon_lat = None
+    if len(lon_lat_data.keys()) > 0:
+        good_shape_from_lon_lat = lon_lat_data[COMMON_KEY][LON_KEY].shape
+    
+    try:
+        # get the various names
+        technical_name, b_variable_technical_name, \
+                explanationName = _get_name_info_for_variable(displayName, varRunInfo)
+        
+        # make sure that it's possible to load this variable
+        if not(aFileObject.is_loadable_type(technical_name)) or not(bFileObject.is_loadable_type(b_variable_technical_name)) :
+            LOG.warn(displayName + " is of a type that cannot be loaded using current file handling libraries included with Glance." +
+                    " Skipping " + displayName + ".")
+            return None, None
+        
+        LOG.info('analyzing: ' + explanationName)
+        
+        # if we kept the results of this same comparison in an earlier run, reuse them
+        cacheDirectory = runInfo[CACHE_DIR_KEY] if CACHE_DIR_KEY in runInfo else None
+        resultKey      = resultcache.get_result_key(files, varRunInfo, runInfo) if cacheDirectory is not None else None
+        if resultKey is not None :
+            variableDir = os.path.join(outputPath, './' + displayName)
+            setup_dir_if_needed(variableDir, "variable")
+            savedResult = resultcache.restore_result(cacheDirectory, resultKey, variableDir)
+            if savedResult is not None :
+                LOG.info('\treusing saved results for: ' + explanationName)
+                varRunInfo.update(savedResult['run_info'])
+                varRunInfo[VARIABLE_DIRECTORY_KEY] = variableDir
+                
+                # the saved report page describes the earlier run, so make it again for this one
+                if runInfo[DO_MAKE_REPORT_KEY] :
+                    attributeInfo = {}
+                    attributeInfo[A_FILE_TITLE_KEY] = aFileObject.get_variable_attributes(technical_name)
+                    attributeInfo[B_FILE_TITLE_KEY] = bFileObject.get_variable_attributes(b_variable_technical_name)
+                    LOG.info ('\tgenerating report for: ' + explanationName)
+                    report.generate_and_save_variable_report(files,
+                                                             varRunInfo, runInfo,
+                                                             savedResult['statistics'],
+                                                             spatialInfo,
+                                                             savedResult['image_names'],
+                                                             variableDir, "index.html",
+                                                             variableAttrs=attributeInfo,)
+                
+                return savedResult['comparison_info'], savedResult['did_pass']
+        originalRunInfo = varRunInfo.copy()
+        
+        # load the variable data
+        try:
+            aData = load_variable_data(aFileObject, technical_name,
+                                       dataFilter = varRunInfo[FILTER_FUNCTION_A_KEY] if FILTER_FUNCTION_A_KEY in varRunInfo else None,
+                                       variableToFilterOn = varRunInfo[VAR_FILTER_NAME_A_KEY] if VAR_FILTER_NAME_A_KEY in varRunInfo else None,
+                                       variableBasedFilter = varRunInfo[VAR_FILTER_FUNCTION_A_KEY] if VAR_FILTER_FUNCTION_A_KEY in varRunInfo else None,
+                                       altVariableFilePath = varRunInfo[VAR_FILTER_ALT_FILE_A_KEY] if VAR_FILTER_ALT_FILE_A_KEY in varRunInfo else None,
+                                       fileDescriptionForDisplay = "file A")
+            bData = load_variable_data(bFileObject, b_variable_technical_name,
+                                       dataFilter = varRunInfo[FILTER_FUNCTION_B_KEY] if FILTER_FUNCTION_B_KEY in varRunInfo else None,
+                                       variableToFilterOn = varRunInfo[VAR_FILTER_NAME_B_KEY] if VAR_FILTER_NAME_B_KEY in varRunInfo else None,
+                                       variableBasedFilter = varRunInfo[VAR_FILTER_FUNCTION_B_KEY] if VAR_FILTER_FUNCTION_B_KEY in varRunInfo else None,
+                                       altVariableFilePath = varRunInfo[VAR_FILTER_ALT_FILE_B_KEY] if VAR_FILTER_ALT_FILE_B_KEY in varRunInfo else None,
+                                       fileDescriptionForDisplay = "file B")
+        except Exception as e:
+            LOG.warn(
+                displayName + " data could not be loaded. This variable will not be included in the output report. " +
+                "The following error was encountered while trying to load this variable:\n" + str(e))
+            return None, None
+
+        # get variable attribute information for this variable
+        attributeInfo = {}
+        attributeInfo[A_FILE_TITLE_KEY] = aFileObject.get_variable_attributes(technical_name)
+        attributeInfo[B_FILE_TITLE_KEY] = bFileObject.get_variable_attributes(b_variable_technical_name)
+
+        # pre-check if this data should be plotted and if it should be compared to the longitude and latitude
+        include_images_for_this_variable = ((not(DO_MAKE_IMAGES_KEY in runInfo)) or (runInfo[DO_MAKE_IMAGES_KEY]))
+        if DO_MAKE_IMAGES_KEY in varRunInfo :
+            include_images_for_this_variable = varRunInfo[DO_MAKE_IMAGES_KEY]
+        do_not_test_with_lon_lat = (not include_images_for_this_variable) or (len(lon_lat_data.keys()) <= 0)
+        
+        # handle vector data
+        isVectorData = ( (MAGNITUDE_VAR_NAME_KEY   in varRunInfo) and (DIRECTION_VAR_NAME_KEY   in varRunInfo) and
+                         (MAGNITUDE_B_VAR_NAME_KEY in varRunInfo) and (DIRECTION_B_VAR_NAME_KEY in varRunInfo) )
+        
+        # check if this data can be displayed but
+        # don't compare lon/lat sizes if we won't be plotting
+        if ( (aData.shape == bData.shape) 
+             and 
+             ( do_not_test_with_lon_lat
+              or
+              ((aData.shape == good_shape_from_lon_lat) and (bData.shape == good_shape_from_lon_lat)) ) ) :
+            
+            # check to see if there is a directory to put information about this variable in,
+            # if not then create it
+            variableDir = os.path.join(outputPath, './' + displayName)
+            varRunInfo[VARIABLE_DIRECTORY_KEY] = variableDir
+            varRunInfo[VAR_REPORT_PATH_KEY] = quote(os.path.join(displayName, 'index.html'))
+            LOG.debug ("Directory selected for variable information: " + varRunInfo[VAR_REPORT_PATH_KEY])
+            setup_dir_if_needed(variableDir, "variable")
+            
+            # form the doc and config paths relative to where the variable is
+            upwardPath = './'
+            for number in range(len(displayName.split('/'))) : # TODO this is not general to windows
+                upwardPath = os.path.join(upwardPath, '../')
+            varRunInfo[DOCUMENTATION_PATH_KEY]   = quote(os.path.join(upwardPath, 'doc.html'))
+            if CONFIG_FILE_NAME_KEY in runInfo :
+                varRunInfo[CONFIG_FILE_PATH_KEY] = quote(os.path.join(upwardPath, runInfo[CONFIG_FILE_NAME_KEY]))
+            
+            # figure out the masks we want, and then do our statistical analysis
+            mask_a_to_use = None if do_not_test_with_lon_lat else lon_lat_data[A_FILE_KEY][INVALID_MASK_KEY]
+            mask_b_to_use = None if do_not_test_with_lon_lat else lon_lat_data[B_FILE_KEY][INVALID_MASK_KEY]
+            LOG.debug("Analyzing " + displayName + " statistically.")
+            variable_stats = statistics.StatisticalAnalysis.withSimpleData(aData, bData,
+                                                                           varRunInfo[FILL_VALUE_KEY], varRunInfo[FILL_VALUE_ALT_IN_B_KEY],
+                                                                           mask_a_to_use, mask_b_to_use,
+                                                                           varRunInfo[EPSILON_KEY], varRunInfo[EPSILON_PERCENT_KEY],
+                                                                           quantile_sketch_accuracy=runInfo[QUANTILE_SKETCH_ACCURACY_KEY],
+                                                                           compact_masks=runInfo[COMPACT_MASKS_KEY] if COMPACT_MASKS_KEY in runInfo else False)
+            
+            # add a little additional info to our variable run info before we squirrel it away
+            varRunInfo[TIME_INFO_KEY] = datetime.datetime.ctime(datetime.datetime.now())  # todo is this needed?
+            didPass, epsilon_failed_fraction, \
+                     non_finite_fail_fraction, \
+                     r_squared_value = variable_stats.check_pass_or_fail(epsilon_failure_tolerance=varRunInfo[EPSILON_FAIL_TOLERANCE_KEY] if EPSILON_FAIL_TOLERANCE_KEY in varRunInfo else numpy.nan,
+                                                epsilon_failure_tolerance_default=defaultValues[EPSILON_FAIL_TOLERANCE_KEY],
+                                                non_finite_data_tolerance=varRunInfo[NONFINITE_TOLERANCE_KEY]  if NONFINITE_TOLERANCE_KEY in varRunInfo else numpy.nan,
+                                                non_finite_data_tolerance_default=defaultValues[NONFINITE_TOLERANCE_KEY],
+                                                total_data_failure_tolerance=varRunInfo[TOTAL_FAIL_TOLERANCE_KEY] if TOTAL_FAIL_TOLERANCE_KEY in varRunInfo else numpy.nan,
+                                                total_data_failure_tolerance_default=defaultValues[TOTAL_FAIL_TOLERANCE_KEY],
+                                                min_acceptable_r_squared=varRunInfo[MIN_OK_R_SQUARED_COEFF_KEY] if MIN_OK_R_SQUARED_COEFF_KEY in varRunInfo else numpy.nan,
+                                                min_acceptable_r_squared_default=defaultValues[MIN_OK_R_SQUARED_COEFF_KEY],
+                                                )
+            
+            varRunInfo[DID_VARIABLE_PASS_KEY] = didPass
+            
+            # based on the settings and whether the variable passsed or failed,
+            # should we include images for this variable?
+            if (DO_IMAGES_ONLY_ON_FAIL_KEY in varRunInfo) and varRunInfo[DO_IMAGES_ONLY_ON_FAIL_KEY] :
+                include_images_for_this_variable = include_images_for_this_variable and (not didPass)
+                varRunInfo[DO_MAKE_IMAGES_KEY] = include_images_for_this_variable
+            
+            # to hold the names of any images created
+            image_names = {
+                            ORIGINAL_IMAGES_KEY: [ ],
+                            COMPARED_IMAGES_KEY: [ ]
+                            }
+            
+            # create the images for this variable
+            if (include_images_for_this_variable) :
+                
+                plotFunctionGenerationObjects = [ ]
+                
+                # if there's magnitude and direction data, figure out the u and v, otherwise these will be None
+                aUData, aVData = get_UV_info_from_magnitude_direction_info (aFileObject,
+                                                                            varRunInfo[MAGNITUDE_VAR_NAME_KEY] if (MAGNITUDE_VAR_NAME_KEY) in varRunInfo else None,
+                                                                            varRunInfo[DIRECTION_VAR_NAME_KEY] if (DIRECTION_VAR_NAME_KEY) in varRunInfo else None,
+                                                                            lon_lat_data[A_FILE_KEY][INVALID_MASK_KEY]
+                                                                            if (A_FILE_KEY in lon_lat_data) and (INVALID_MASK_KEY in lon_lat_data[A_FILE_KEY]) else None)
+                bUData, bVData = get_UV_info_from_magnitude_direction_info (bFileObject,
+                                                                            varRunInfo[MAGNITUDE_B_VAR_NAME_KEY] if (MAGNITUDE_B_VAR_NAME_KEY) in varRunInfo else None,
+                                                                            varRunInfo[DIRECTION_B_VAR_NAME_KEY] if (DIRECTION_B_VAR_NAME_KEY) in varRunInfo else None,
+                                                                            lon_lat_data[B_FILE_KEY][INVALID_MASK_KEY]
+                                                                            if (B_FILE_KEY in lon_lat_data) and (INVALID_MASK_KEY in lon_lat_data[B_FILE_KEY]) else None)
+                
+                # if the data is the same size, we can always make our basic statistical comparison plots
+                if (aData.shape == bData.shape) :
+                    plotFunctionGenerationObjects.append(plotcreate.BasicComparisonPlotsFunctionFactory())
+                
+                # if the bin and tuple are defined, try to analyze the data as complex
+                # multidimentional information requiring careful sampling
+                if (BIN_INDEX_KEY in varRunInfo) and (TUPLE_INDEX_KEY in varRunInfo) :
+                    plotFunctionGenerationObjects.append(plotcreate.BinTupleAnalysisFunctionFactory())
+                    
+                else : # if it's not bin/tuple, there are lots of other posibilities
+                    
+                    # if it's vector data with longitude and latitude, quiver plot it on the Earth
+                    if isVectorData and (not do_not_test_with_lon_lat) :
+                        plotFunctionGenerationObjects.append(plotcreate.MappedQuiverPlotFunctionFactory())
+                    
+                    # if the data is one dimensional we can plot it as lines
+                    elif   (len(aData.shape) is 1) : 
+                        plotFunctionGenerationObjects.append(plotcreate.LinePlotsFunctionFactory())
+                    
+                    # if the data is 2D we have some options based on the type of data
+                    elif (len(aData.shape) is 2) :
+                        
+                        # if the data is not mapped to a longitude and latitude, just show it as an image
+                        if (do_not_test_with_lon_lat) :
+                            plotFunctionGenerationObjects.append(plotcreate.IMShowPlotFunctionFactory())
+                        
+                        # if it's 2D and mapped to the Earth, contour plot it on the earth
+                        else :
+                            plotFunctionGenerationObjects.append(plotcreate.MappedContourPlotFunctionFactory())
+                
+                # plot our lon/lat related info
+                image_names[ORIGINAL_IMAGES_KEY], image_names[COMPARED_IMAGES_KEY] = \
+                    plot.plot_and_save_comparison_figures \
+                            (aData, bData,
+                             plotFunctionGenerationObjects,
+                             varRunInfo[VARIABLE_DIRECTORY_KEY],
+                             displayName,
+                             varRunInfo[EPSILON_KEY],
+                             varRunInfo[FILL_VALUE_KEY],
+                             missingValueAltInB = varRunInfo[FILL_VALUE_ALT_IN_B_KEY] if FILL_VALUE_ALT_IN_B_KEY in varRunInfo else None,
+                             lonLatDataDict=lon_lat_data,
+                             dataRanges     = varRunInfo[DISPLAY_RANGES_KEY]       if DISPLAY_RANGES_KEY       in varRunInfo else None,
+                             dataRangeNames = varRunInfo[DISPLAY_RANGE_NAMES_KEY]  if DISPLAY_RANGE_NAMES_KEY  in varRunInfo else None,
+                             dataColors     = varRunInfo[DISPLAY_RANGE_COLORS_KEY] if DISPLAY_RANGE_COLORS_KEY in varRunInfo else None,
+                             makeSmall=True,
+                             doFork=runInfo[DO_MAKE_FORKS_KEY],
+                             shouldClearMemoryWithThreads=runInfo[DO_CLEAR_MEM_THREADED_KEY],
+                             maxWorkers=      runInfo[MAX_FIGURE_WORKERS_KEY] if MAX_FIGURE_WORKERS_KEY in runInfo else None,
+                             figuresPerWorker=runInfo[FIGURES_PER_WORKER_KEY] if FIGURES_PER_WORKER_KEY in runInfo else None,
+                             minFreeMemoryMB= runInfo[MIN_FREE_MEMORY_KEY]    if MIN_FREE_MEMORY_KEY    in runInfo else None,
+                             sharedArrayDirectory=runInfo[SHARED_ARRAY_DIR_KEY] if SHARED_ARRAY_DIR_KEY in runInfo else None,
+                             compactMasks=runInfo[COMPACT_MASKS_KEY] if COMPACT_MASKS_KEY in runInfo else False,
+                             shouldUseSharedRangeForOriginal=runInfo[USE_SHARED_ORIG_RANGE_KEY],
+                             doPlotSettingsDict = varRunInfo,
+                             aUData=aUData, aVData=aVData,
+                             bUData=bUData, bVData=bVData,
+                             binIndex=      varRunInfo[BIN_INDEX_KEY]       if BIN_INDEX_KEY       in varRunInfo else None,
+                             tupleIndex=    varRunInfo[TUPLE_INDEX_KEY]     if TUPLE_INDEX_KEY     in varRunInfo else None,
+                             binName=       varRunInfo[BIN_NAME_KEY]        if BIN_NAME_KEY        in varRunInfo else 'bin',
+                             tupleName=     varRunInfo[TUPLE_NAME_KEY]      if TUPLE_NAME_KEY      in varRunInfo else 'tuple',
+                             epsilonPercent=varRunInfo[EPSILON_PERCENT_KEY] if EPSILON_PERCENT_KEY in varRunInfo else None,
+                             fullDPI=       runInfo[DETAIL_DPI_KEY],
+                             thumbDPI=      runInfo[THUMBNAIL_DPI_KEY],
+                             units_a=       varRunInfo[VAR_UNITS_A_KEY]     if VAR_UNITS_A_KEY     in varRunInfo else None,
+                             units_b=       varRunInfo[VAR_UNITS_B_KEY]     if VAR_UNITS_B_KEY     in varRunInfo else None,
+                            )#histRange=     varRunInfo[HISTOGRAM_RANGE_KEY] if HISTOGRAM_RANGE_KEY in varRunInfo else None)
+                
+                LOG.info("\tfinished creating figures for: " + explanationName)
+            
+            # create the report page for this variable
+            comparisonInfo = None
+            if (runInfo[DO_MAKE_REPORT_KEY]) :
+                
+                # hang on to our good % and other info to describe our comparison
+                epsilonPassedPercent = (1.0 -  epsilon_failed_fraction) * 100.0
+                finitePassedPercent  = (1.0 - non_finite_fail_fraction) * 100.0 
+                comparisonInfo = {
+                                  PASSED_EPSILON_PERCENT_KEY: epsilonPassedPercent,
+                                  FINITE_SIMILAR_PERCENT_KEY: finitePassedPercent,
+                                  R_SQUARED_COEFF_VALUE_KEY:  r_squared_value,
+                                  }
+                
+                LOG.info ('\tgenerating report for: ' + explanationName) 
+                report.generate_and_save_variable_report(files,
+                                                         varRunInfo, runInfo,
+                                                         variable_stats.dictionary_form(),
+                                                         spatialInfo,
+                                                         image_names,
+                                                         varRunInfo[VARIABLE_DIRECTORY_KEY], "index.html",
+                                                         variableAttrs=attributeInfo,)
+            
+            # keep the results so a later run can reuse them
+            if resultKey is not None :
+                changedRunInfo = dict((key, value) for key, value in varRunInfo.items()
+                                      if (key not in originalRunInfo) or (originalRunInfo[key] is not value))
+                resultcache.save_result(cacheDirectory, resultKey, varRunInfo[VARIABLE_DIRECTORY_KEY],
+                                        comparisonInfo, didPass, changedRunInfo,
+                                        variable_stats.dictionary_form(), image_names)
+            
+            return comparisonInfo, didPass
+        
+        # if we can't compare the variable, we should tell the user 
+        else :
+            message = (explanationName + ' ' + 
+                     'could not be compared. This may be because the data for this variable does not match in shape ' +
+                     'between the two files (file A data shape: ' + str(aData.shape) + '; file B data shape: '
+                     + str(bData.shape) + ')')
+            if do_not_test_with_lon_lat :
+                message = message + '.'
+            else :
+                message = (message + ' or the data may not match the shape of the selected '
+                     + 'longitude ' + str(good_shape_from_lon_lat) + ' and '
+                     + 'latitude '  + str(good_shape_from_lon_lat) + ' variables.')
+            LOG.warn(message)
+    except ValueErrorStringToFloat as e:
+        LOG.warn("Unable to compare "+displayName+": "+str(e))
+    
+    return None, None
+
+# information shared with the reportGen worker processes; the workers are forked from
+# the process running reportGen, so they get this (including any lon/lat data, which
+# they only read) without it being pickled or copied up front
+_report_worker_context = { }
+
+def _init_report_worker (aPath, bPath) :
+    """
+    set up a reportGen worker process by opening its own copies of the files
+    (open file handles shouldn't be shared between processes, so the worker
+    also gets its own file pool for any other files it opens)
+    """
+    
+    io.close_inherited_file_pools()
+    io.FilePool().activate()
+    _report_worker_context['a_file'] = io.acquire_file(aPath)
+    _report_worker_context['b_file'] = io.acquire_file(bPath)
+
+def _report_worker (displayName) :
+    """
+    analyze a single variable in a reportGen worker process
+    
+    returns the display name, the comparison information and pass status for the
+    variable (see _analyze_variable_for_report), and the entries of the variable's
+    run information that the analysis changed (the rest of the run information is
+    already in the parent process and may not be picklable, ex. filter functions)
+    """
+    
+    originalRunInfo = _report_worker_context['final_names'][displayName]
+    varRunInfo      = originalRunInfo.copy()
+    
+    comparisonInfo, didPass = _analyze_variable_for_report(displayName, varRunInfo,
+                                                           _report_worker_context['a_file'],
+                                                           _report_worker_context['b_file'],
+                                                           **_report_worker_context['arguments'])
+    
+    changedRunInfo = dict((key, value) for key, value in varRunInfo.items()
+                          if (key not in originalRunInfo) or (originalRunInfo[key] is not value))
+    
+    return displayName, comparisonInfo, didPass, changedRunInfo
+
+def _analyze_variables_for_report (finalNames, aFile, bFile, numJobs=1, **kwargs) :
+    """
+    analyze each of the variables for reportGen, either one at a time or, if numJobs
+    is more than 1, spread across a pool of that many worker processes
+    
+    aFile and bFile should be glance.data.FileInfo objects and the remaining keyword
+    arguments are passed on to _analyze_variable_for_report
+    
+    yields the display name, comparison information, pass status, and updated run
+    information for each variable (in the order the variables finish)
+    """
+    
+    # if we only have one process to work with, just analyze the variables in order
+    if (numJobs <= 1) or (len(finalNames) <= 1) :
+        for displayName in finalNames :
+            varRunInfo = finalNames[displayName].copy()
+            comparisonInfo, didPass = _analyze_variable_for_report(displayName, varRunInfo,
+                                                                   aFile.file_object, bFile.file_object,
+                                                                   **kwargs)
+            yield displayName, comparisonInfo, didPass, varRunInfo
+        return
+    
+    LOG.info("Analyzing variables with " + str(numJobs) + " worker processes.")
+    # find the md5 sums for the reports now, so the workers don't each hash the files
+    if 'files' in kwargs :
+        dataobj.resolve_deferred_checksums(kwargs['files'])
+    _report_worker_context['final_names'] = finalNames
+    _report_worker_context['arguments']   = kwargs
+    pool = multiprocessing.Pool(processes=min(numJobs, len(finalNames)),
+                                initializer=_init_report_worker, initargs=(aFile.path, bFile.path))
+    try :
+        for displayName, comparisonInfo, didPass, changedRunInfo in pool.imap_unordered(_report_worker, list(finalNames)) :
+            varRunInfo = finalNames[displayName].copy()
+            varRunInfo.update(changedRunInfo)
+            yield displayName, comparisonInfo, didPass, varRunInfo
+        pool.close()
+    except :
+        pool.terminate()
+        raise
+    finally :
+        pool.join()
+        _report_worker_context.clear()
+
+@io.with_file_pool
 def reportGen_library_call (a_path, b_path, var_list=[ ],
                             options_set={ },
                             # todo, this doesn't yet do anything
@@ -694,6 +1128,15 @@ def reportGen_library_call (a_path, b_path, var_list=[ ],
     # hang onto info to identify who/what/when/where/etc. the report is being run by/for 
     runInfo[MACHINE_INFO_KEY], runInfo[USER_INFO_KEY], runInfo[GLANCE_VERSION_INFO_KEY] = get_run_identification_info()
     
+    # set up how the md5 sums of the files will be found
+    dataobj.configure_checksums(cacheDirectory=runInfo[CACHE_DIR_KEY] if CACHE_DIR_KEY in runInfo else None,
+                                skipChecksums=runInfo[SKIP_CHECKSUMS_KEY] if SKIP_CHECKSUMS_KEY in runInfo else False)
+    # and where basemaps will be kept between runs
+    maps.set_basemap_cache_directory(runInfo[CACHE_DIR_KEY] if CACHE_DIR_KEY in runInfo else None)
+    # and how images will be written
+    plot.configure_image_output(compressionLevel=runInfo[PNG_COMPRESSION_KEY]       if PNG_COMPRESSION_KEY       in runInfo else None,
+                                threadedEncode=  runInfo[THREADED_IMAGE_ENCODE_KEY] if THREADED_IMAGE_ENCODE_KEY in runInfo else False)
+    
     # deal with the input and output files
     setup_dir_if_needed(pathsTemp[OUT_FILE_KEY], "output")
     # open the files
@@ -711,6 +1154,9 @@ def reportGen_library_call (a_path, b_path, var_list=[ ],
         LOG.warn("Unable to continue with comparison because file b (" + pathsTemp[B_FILE_KEY] + ") could not be opened.")
         sys.exit(1)
     
+    # if we were asked to, load all the variable attributes at once
+    _prefetch_attributes_if_requested(runInfo, aFile.file_object, bFile.file_object)
+    
     # get information about the names the user requested
     finalNames, nameStats = config_organizer.resolve_names(aFile.file_object,
                                                            bFile.file_object,
@@ -743,11 +1189,6 @@ def reportGen_library_call (a_path, b_path, var_list=[ ],
         LOG.warn(str(vce))
         exit(1)
     
-    # if there is an approved lon/lat shape, hang on to that for future checks
-    good_shape_from_lon_lat = None
-    if len(lon_lat_data.keys()) > 0:
-        good_shape_from_lon_lat = lon_lat_data[COMMON_KEY][LON_KEY].shape
-    
     # this will hold information for the summary report
     # it will be in the form
     # [displayName] =  {
@@ -760,241 +1201,22 @@ def reportGen_library_call (a_path, b_path, var_list=[ ],
     
     # go through each of the possible variables in our files
     # and make a report section with images for whichever ones we can
-    for displayName in finalNames:
-        try:
-            # pull out the information for this variable analysis run
-            varRunInfo = finalNames[displayName].copy()
-            
-            # get the various names
-            technical_name, b_variable_technical_name, \
-                    explanationName = _get_name_info_for_variable(displayName, varRunInfo)
-            
-            # make sure that it's possible to load this variable
-            if not(aFile.file_object.is_loadable_type(technical_name)) or not(bFile.file_object.is_loadable_type(b_variable_technical_name)) :
-                LOG.warn(displayName + " is of a type that cannot be loaded using current file handling libraries included with Glance." +
-                        " Skipping " + displayName + ".")
-                continue
-            
-            LOG.info('analyzing: ' + explanationName)
-            
-            # load the variable data
-            try:
-                aData = load_variable_data(aFile.file_object, technical_name,
-                                           dataFilter = varRunInfo[FILTER_FUNCTION_A_KEY] if FILTER_FUNCTION_A_KEY in varRunInfo else None,
-                                           variableToFilterOn = varRunInfo[VAR_FILTER_NAME_A_KEY] if VAR_FILTER_NAME_A_KEY in varRunInfo else None,
-                                           variableBasedFilter = varRunInfo[VAR_FILTER_FUNCTION_A_KEY] if VAR_FILTER_FUNCTION_A_KEY in varRunInfo else None,
-                                           altVariableFileObject = dataobj.FileInfo(varRunInfo[VAR_FILTER_ALT_FILE_A_KEY]).file_object if VAR_FILTER_ALT_FILE_A_KEY in varRunInfo else None,
-                                           fileDescriptionForDisplay = "file A")
-                bData = load_variable_data(bFile.file_object, b_variable_technical_name,
-                                           dataFilter = varRunInfo[FILTER_FUNCTION_B_KEY] if FILTER_FUNCTION_B_KEY in varRunInfo else None,
-                                           variableToFilterOn = varRunInfo[VAR_FILTER_NAME_B_KEY] if VAR_FILTER_NAME_B_KEY in varRunInfo else None,
-                                           variableBasedFilter = varRunInfo[VAR_FILTER_FUNCTION_B_KEY] if VAR_FILTER_FUNCTION_B_KEY in varRunInfo else None,
-                                           altVariableFileObject = dataobj.FileInfo(varRunInfo[VAR_FILTER_ALT_FILE_B_KEY]).file_object if VAR_FILTER_ALT_FILE_B_KEY in varRunInfo else None,
-                                           fileDescriptionForDisplay = "file B")
-            except Exception as e:
-                LOG.warn(
-                    displayName + " data could not be loaded. This variable will not be included in the output report. " +
-                    "The following error was encountered while trying to load this variable:\n" + str(e))
-                continue
-
-            # get variable attribute information for this variable
-            attributeInfo = {}
-            attributeInfo[A_FILE_TITLE_KEY] = aFile.file_object.get_variable_attributes(technical_name)
-            attributeInfo[B_FILE_TITLE_KEY] = bFile.file_object.get_variable_attributes(b_variable_technical_name)
-
-            # pre-check if this data should be plotted and if it should be compared to the longitude and latitude
-            include_images_for_this_variable = ((not(DO_MAKE_IMAGES_KEY in runInfo)) or (runInfo[DO_MAKE_IMAGES_KEY]))
-            if DO_MAKE_IMAGES_KEY in varRunInfo :
-                include_images_for_this_variable = varRunInfo[DO_MAKE_IMAGES_KEY]
-            do_not_test_with_lon_lat = (not include_images_for_this_variable) or (len(lon_lat_data.keys()) <= 0)
-            
-            # handle vector data
-            isVectorData = ( (MAGNITUDE_VAR_NAME_KEY   in varRunInfo) and (DIRECTION_VAR_NAME_KEY   in varRunInfo) and
-                             (MAGNITUDE_B_VAR_NAME_KEY in varRunInfo) and (DIRECTION_B_VAR_NAME_KEY in varRunInfo) )
-            
-            # check if this data can be displayed but
-            # don't compare lon/lat sizes if we won't be plotting
-            if ( (aData.shape == bData.shape) 
-                 and 
-                 ( do_not_test_with_lon_lat
-                  or
-                  ((aData.shape == good_shape_from_lon_lat) and (bData.shape == good_shape_from_lon_lat)) ) ) :
-                
-                # check to see if there is a directory to put information about this variable in,
-                # if not then create it
-                variableDir = os.path.join(pathsTemp[OUT_FILE_KEY], './' + displayName)
-                varRunInfo[VARIABLE_DIRECTORY_KEY] = variableDir
-                varRunInfo[VAR_REPORT_PATH_KEY] = quote(os.path.join(displayName, 'index.html'))
-                LOG.debug ("Directory selected for variable information: " + varRunInfo[VAR_REPORT_PATH_KEY])
-                setup_dir_if_needed(variableDir, "variable")
-                
-                # form the doc and config paths relative to where the variable is
-                upwardPath = './'
-                for number in range(len(displayName.split('/'))) : # TODO this is not general to windows
-                    upwardPath = os.path.join(upwardPath, '../')
-                varRunInfo[DOCUMENTATION_PATH_KEY]   = quote(os.path.join(upwardPath, 'doc.html'))
-                if CONFIG_FILE_NAME_KEY in runInfo :
-                    varRunInfo[CONFIG_FILE_PATH_KEY] = quote(os.path.join(upwardPath, runInfo[CONFIG_FILE_NAME_KEY]))
-                
-                # figure out the masks we want, and then do our statistical analysis
-                mask_a_to_use = None if do_not_test_with_lon_lat else lon_lat_data[A_FILE_KEY][INVALID_MASK_KEY]
-                mask_b_to_use = None if do_not_test_with_lon_lat else lon_lat_data[B_FILE_KEY][INVALID_MASK_KEY]
-                LOG.debug("Analyzing " + displayName + " statistically.")
-                variable_stats = statistics.StatisticalAnalysis.withSimpleData(aData, bData,
-                                                                               varRunInfo[FILL_VALUE_KEY], varRunInfo[FILL_VALUE_ALT_IN_B_KEY],
-                                                                               mask_a_to_use, mask_b_to_use,
-                                                                               varRunInfo[EPSILON_KEY], varRunInfo[EPSILON_PERCENT_KEY])
-                
-                # add a little additional info to our variable run info before we squirrel it away
-                varRunInfo[TIME_INFO_KEY] = datetime.datetime.ctime(datetime.datetime.now())  # todo is this needed?
-                didPass, epsilon_failed_fraction, \
-                         non_finite_fail_fraction, \
-                         r_squared_value = variable_stats.check_pass_or_fail(epsilon_failure_tolerance=varRunInfo[EPSILON_FAIL_TOLERANCE_KEY] if EPSILON_FAIL_TOLERANCE_KEY in varRunInfo else numpy.nan,
-                                                    epsilon_failure_tolerance_default=defaultValues[EPSILON_FAIL_TOLERANCE_KEY],
-                                                    non_finite_data_tolerance=varRunInfo[NONFINITE_TOLERANCE_KEY]  if NONFINITE_TOLERANCE_KEY in varRunInfo else numpy.nan,
-                                                    non_finite_data_tolerance_default=defaultValues[NONFINITE_TOLERANCE_KEY],
-                                                    total_data_failure_tolerance=varRunInfo[TOTAL_FAIL_TOLERANCE_KEY] if TOTAL_FAIL_TOLERANCE_KEY in varRunInfo else numpy.nan,
-                                                    total_data_failure_tolerance_default=defaultValues[TOTAL_FAIL_TOLERANCE_KEY],
-                                                    min_acceptable_r_squared=varRunInfo[MIN_OK_R_SQUARED_COEFF_KEY] if MIN_OK_R_SQUARED_COEFF_KEY in varRunInfo else numpy.nan,
-                                                    min_acceptable_r_squared_default=defaultValues[MIN_OK_R_SQUARED_COEFF_KEY],
-                                                    )
-                
-                varRunInfo[DID_VARIABLE_PASS_KEY] = didPass
-                # update the overall pass status
-                if didPass is not None :
-                    didPassAll = didPassAll & didPass
-                
-                # based on the settings and whether the variable passsed or failed,
-                # should we include images for this variable?
-                if (DO_IMAGES_ONLY_ON_FAIL_KEY in varRunInfo) and varRunInfo[DO_IMAGES_ONLY_ON_FAIL_KEY] :
-                    include_images_for_this_variable = include_images_for_this_variable and (not didPass)
-                    varRunInfo[DO_MAKE_IMAGES_KEY] = include_images_for_this_variable
-                
-                # to hold the names of any images created
-                image_names = {
-                                ORIGINAL_IMAGES_KEY: [ ],
-                                COMPARED_IMAGES_KEY: [ ]
-                                }
-                
-                # create the images for this variable
-                if (include_images_for_this_variable) :
-                    
-                    plotFunctionGenerationObjects = [ ]
-                    
-                    # if there's magnitude and direction data, figure out the u and v, otherwise these will be None
-                    aUData, aVData = get_UV_info_from_magnitude_direction_info (aFile.file_object,
-                                                                                varRunInfo[MAGNITUDE_VAR_NAME_KEY] if (MAGNITUDE_VAR_NAME_KEY) in varRunInfo else None,
-                                                                                varRunInfo[DIRECTION_VAR_NAME_KEY] if (DIRECTION_VAR_NAME_KEY) in varRunInfo else None,
-                                                                                lon_lat_data[A_FILE_KEY][INVALID_MASK_KEY]
-                                                                                if (A_FILE_KEY in lon_lat_data) and (INVALID_MASK_KEY in lon_lat_data[A_FILE_KEY]) else None)
-                    bUData, bVData = get_UV_info_from_magnitude_direction_info (bFile.file_object,
-                                                                                varRunInfo[MAGNITUDE_B_VAR_NAME_KEY] if (MAGNITUDE_B_VAR_NAME_KEY) in varRunInfo else None,
-                                                                                varRunInfo[DIRECTION_B_VAR_NAME_KEY] if (DIRECTION_B_VAR_NAME_KEY) in varRunInfo else None,
-                                                                                lon_lat_data[B_FILE_KEY][INVALID_MASK_KEY]
-                                                                                if (B_FILE_KEY in lon_lat_data) and (INVALID_MASK_KEY in lon_lat_data[B_FILE_KEY]) else None)
-                    
-                    # if the data is the same size, we can always make our basic statistical comparison plots
-                    if (aData.shape == bData.shape) :
-                        plotFunctionGenerationObjects.append(plotcreate.BasicComparisonPlotsFunctionFactory())
-                    
-                    # if the bin and tuple are defined, try to analyze the data as complex
-                    # multidimentional information requiring careful sampling
-                    if (BIN_INDEX_KEY in varRunInfo) and (TUPLE_INDEX_KEY in varRunInfo) :
-                        plotFunctionGenerationObjects.append(plotcreate.BinTupleAnalysisFunctionFactory())
-                        
-                    else : # if it's not bin/tuple, there are lots of other posibilities
-                        
-                        # if it's vector data with longitude and latitude, quiver plot it on the Earth
-                        if isVectorData and (not do_not_test_with_lon_lat) :
-                            plotFunctionGenerationObjects.append(plotcreate.MappedQuiverPlotFunctionFactory())
-                        
-                        # if the data is one dimensional we can plot it as lines
-                        elif   (len(aData.shape) is 1) : 
-                            plotFunctionGenerationObjects.append(plotcreate.LinePlotsFunctionFactory())
-                        
-                        # if the data is 2D we have some options based on the type of data
-                        elif (len(aData.shape) is 2) :
-                            
-                            # if the data is not mapped to a longitude and latitude, just show it as an image
-                            if (do_not_test_with_lon_lat) :
-                                plotFunctionGenerationObjects.append(plotcreate.IMShowPlotFunctionFactory())
-                            
-                            # if it's 2D and mapped to the Earth, contour plot it on the earth
-                            else :
-                                plotFunctionGenerationObjects.append(plotcreate.MappedContourPlotFunctionFactory())
-                    
-                    # plot our lon/lat related info
-                    image_names[ORIGINAL_IMAGES_KEY], image_names[COMPARED_IMAGES_KEY] = \
-                        plot.plot_and_save_comparison_figures \
-                                (aData, bData,
-                                 plotFunctionGenerationObjects,
-                                 varRunInfo[VARIABLE_DIRECTORY_KEY],
-                                 displayName,
-                                 varRunInfo[EPSILON_KEY],
-                                 varRunInfo[FILL_VALUE_KEY],
-                                 missingValueAltInB = varRunInfo[FILL_VALUE_ALT_IN_B_KEY] if FILL_VALUE_ALT_IN_B_KEY in varRunInfo else None,
-                                 lonLatDataDict=lon_lat_data,
-                                 dataRanges     = varRunInfo[DISPLAY_RANGES_KEY]       if DISPLAY_RANGES_KEY       in varRunInfo else None,
-                                 dataRangeNames = varRunInfo[DISPLAY_RANGE_NAMES_KEY]  if DISPLAY_RANGE_NAMES_KEY  in varRunInfo else None,
-                                 dataColors     = varRunInfo[DISPLAY_RANGE_COLORS_KEY] if DISPLAY_RANGE_COLORS_KEY in varRunInfo else None,
-                                 makeSmall=True,
-                                 doFork=runInfo[DO_MAKE_FORKS_KEY],
-                                 shouldClearMemoryWithThreads=runInfo[DO_CLEAR_MEM_THREADED_KEY],
-                                 shouldUseSharedRangeForOriginal=runInfo[USE_SHARED_ORIG_RANGE_KEY],
-                                 doPlotSettingsDict = varRunInfo,
-                                 aUData=aUData, aVData=aVData,
-                                 bUData=bUData, bVData=bVData,
-                                 binIndex=      varRunInfo[BIN_INDEX_KEY]       if BIN_INDEX_KEY       in varRunInfo else None,
-                                 tupleIndex=    varRunInfo[TUPLE_INDEX_KEY]     if TUPLE_INDEX_KEY     in varRunInfo else None,
-                                 binName=       varRunInfo[BIN_NAME_KEY]        if BIN_NAME_KEY        in varRunInfo else 'bin',
-                                 tupleName=     varRunInfo[TUPLE_NAME_KEY]      if TUPLE_NAME_KEY      in varRunInfo else 'tuple',
-                                 epsilonPercent=varRunInfo[EPSILON_PERCENT_KEY] if EPSILON_PERCENT_KEY in varRunInfo else None,
-                                 fullDPI=       runInfo[DETAIL_DPI_KEY],
-                                 thumbDPI=      runInfo[THUMBNAIL_DPI_KEY],
-                                 units_a=       varRunInfo[VAR_UNITS_A_KEY]     if VAR_UNITS_A_KEY     in varRunInfo else None,
-                                 units_b=       varRunInfo[VAR_UNITS_B_KEY]     if VAR_UNITS_B_KEY     in varRunInfo else None,
-                                )#histRange=     varRunInfo[HISTOGRAM_RANGE_KEY] if HISTOGRAM_RANGE_KEY in varRunInfo else None)
-                    
-                    LOG.info("\tfinished creating figures for: " + explanationName)
-                
-                # create the report page for this variable
-                if (runInfo[DO_MAKE_REPORT_KEY]) :
-                    
-                    # hang on to our good % and other info to describe our comparison
-                    epsilonPassedPercent = (1.0 -  epsilon_failed_fraction) * 100.0
-                    finitePassedPercent  = (1.0 - non_finite_fail_fraction) * 100.0 
-                    variableComparisons[displayName] = {
-                                                        PASSED_EPSILON_PERCENT_KEY: epsilonPassedPercent,
-                                                        FINITE_SIMILAR_PERCENT_KEY: finitePassedPercent,
-                                                        R_SQUARED_COEFF_VALUE_KEY:  r_squared_value,
-                                                        VARIABLE_RUN_INFO_KEY:      varRunInfo
-                                                        }
-                    
-                    LOG.info ('\tgenerating report for: ' + explanationName) 
-                    report.generate_and_save_variable_report(files,
-                                                             varRunInfo, runInfo,
-                                                             variable_stats.dictionary_form(),
-                                                             spatialInfo,
-                                                             image_names,
-                                                             varRunInfo[VARIABLE_DIRECTORY_KEY], "index.html",
-                                                             variableAttrs=attributeInfo,)
-            
-            # if we can't compare the variable, we should tell the user 
-            else :
-                message = (explanationName + ' ' + 
-                         'could not be compared. This may be because the data for this variable does not match in shape ' +
-                         'between the two files (file A data shape: ' + str(aData.shape) + '; file B data shape: '
-                         + str(bData.shape) + ')')
-                if do_not_test_with_lon_lat :
-                    message = message + '.'
-                else :
-                    message = (message + ' or the data may not match the shape of the selected '
-                         + 'longitude ' + str(good_shape_from_lon_lat) + ' and '
-                         + 'latitude '  + str(good_shape_from_lon_lat) + ' variables.')
-                LOG.warn(message)
-        except ValueErrorStringToFloat as e:
-            LOG.warn("Unable to compare "+displayName+": "+str(e))
-
+    for displayName, comparisonInfo, didPass, varRunInfo in \
+            _analyze_variables_for_report(finalNames, aFile, bFile,
+                                          numJobs=runInfo[NUM_JOBS_KEY] if (NUM_JOBS_KEY in runInfo) and (runInfo[NUM_JOBS_KEY] is not None) else 1,
+                                          files=files, runInfo=runInfo, defaultValues=defaultValues,
+                                          outputPath=pathsTemp[OUT_FILE_KEY],
+                                          lon_lat_data=lon_lat_data, spatialInfo=spatialInfo) :
+        
+        # update the overall pass status
+        if didPass is not None :
+            didPassAll = didPassAll & didPass
+        
+        # hang on to the information for the summary report
+        if comparisonInfo is not None :
+            comparisonInfo[VARIABLE_RUN_INFO_KEY] = varRunInfo
+            variableComparisons[displayName]      = comparisonInfo
+    
     # the end of the loop to examine all the variables
     
     # generate our general report pages once we've analyzed all the variables
@@ -1039,6 +1261,10 @@ def stats_library_call(afn, bfn, var_list=[ ],
     epsilon_val  = options_set[EPSILON_KEY]
     missing_val  = options_set[OPTIONS_FILL_VALUE_KEY]
     do_pass_fail = options_set[DO_TEST_PASSFAIL_KEY]
+    chunk_rows   = options_set[OPTIONS_CHUNK_ROWS_KEY] if OPTIONS_CHUNK_ROWS_KEY in options_set else None
+    do_chunking  = (chunk_rows is not None) and (chunk_rows > 0)
+    sketch_accuracy = options_set[QUANTILE_SKETCH_ACCURACY_KEY] if QUANTILE_SKETCH_ACCURACY_KEY in options_set else None
+    compact_masks   = options_set[COMPACT_MASKS_KEY] if COMPACT_MASKS_KEY in options_set else False
     
     LOG.debug ("file a: " + afn)
     LOG.debug ("file b: " + bfn)
@@ -1069,8 +1295,13 @@ def stats_library_call(afn, bfn, var_list=[ ],
                     " Skipping " + name + ".")
             continue
         
-        aData = aFile[name]
-        bData = bFile[name]
+        # if we're working in chunks, only read the data as it's needed
+        if do_chunking :
+            aData = aFile.get_lazy_variable(name)
+            bData = bFile.get_lazy_variable(name)
+        else :
+            aData = aFile[name]
+            bData = bFile[name]
         if missing is None:
             amiss = aFile.missing_value(name)
             bmiss = bFile.missing_value(name)
@@ -1080,7 +1311,15 @@ def stats_library_call(afn, bfn, var_list=[ ],
         print >> output_channel, '-'*32
         print >> output_channel, name
         print >> output_channel, ''
-        variable_stats = statistics.StatisticalAnalysis.withSimpleData(aData, bData, amiss, bmiss, epsilon=epsilon)
+        if do_chunking and (len(aData.shape) > 0) :
+            LOG.debug('analyzing %s in chunks of %d rows' % (name, chunk_rows))
+            variable_stats = statistics.StatisticalAnalysis.withChunkedData(aData, bData, amiss, bmiss, epsilon=epsilon,
+                                                                            rows_per_chunk=chunk_rows,
+                                                                            quantile_sketch_accuracy=sketch_accuracy)
+        else :
+            variable_stats = statistics.StatisticalAnalysis.withSimpleData(numpy.asarray(aData), numpy.asarray(bData), amiss, bmiss, epsilon=epsilon,
+                                                                           quantile_sketch_accuracy=sketch_accuracy,
+                                                                           compact_masks=compact_masks)
         # if we're doing pass/fail testing, do that now
         if do_pass_fail :
             
@@ -1125,6 +1364,7 @@ def inspect_stats_library_call (afn, var_list=[ ], options_set={ }, do_document=
     """
     # unpack some options
     missing_val  = options_set[OPTIONS_FILL_VALUE_KEY]
+    sketch_accuracy = options_set[QUANTILE_SKETCH_ACCURACY_KEY] if QUANTILE_SKETCH_ACCURACY_KEY in options_set else None
     
     LOG.debug ("file a: " + afn)
     
@@ -1157,7 +1397,8 @@ def inspect_stats_library_call (afn, var_list=[ ], options_set={ }, do_document=
         print >> output_channel, '-'*32
         print >> output_channel, name
         print >> output_channel, ''
-        variable_stats = statistics.StatisticalInspectionAnalysis.withSimpleData(aData, amiss)
+        variable_stats = statistics.StatisticalInspectionAnalysis.withSimpleData(aData, amiss,
+                                                                                 quantile_sketch_accuracy=sketch_accuracy)
         lal = list(variable_stats.dictionary_form().items())
         lal.sort()
         for dictionary_title, dict_data in lal:
@@ -10,7 +10,7 @@ Created by evas Dec 2012.
 Copyright (c) 2012 University of Wisconsin SSEC. All rights reserved.
 """
 
-import os, sys, imp, logging, re
+import os, sys, imp, logging, re, optparse
 
 import glance.io as io
 from glance.constants import *
@@ -28,14 +28,43 @@ glance_setting_defaults = {
                            USE_SHARED_ORIG_RANGE_KEY:  False,
                            USE_NO_LON_OR_LAT_VARS_KEY: False,
                            DETAIL_DPI_KEY:             150,
-                           THUMBNAIL_DPI_KEY:          50
+                           THUMBNAIL_DPI_KEY:          50,
+                           CACHE_DIR_KEY:              None,
+                           QUANTILE_SKETCH_ACCURACY_KEY: None,
+                           COMPACT_MASKS_KEY:          False,
+                           SKIP_CHECKSUMS_KEY:         False,
+                           PREFETCH_ATTRIBUTES_KEY:    False,
+                           PNG_COMPRESSION_KEY:        None,
+                           THREADED_IMAGE_ENCODE_KEY:  False,
+                           NUM_JOBS_KEY:               1,
+                           MAX_FIGURE_WORKERS_KEY:     None,
+                           FIGURES_PER_WORKER_KEY:     10,
+                           MIN_FREE_MEMORY_KEY:        None,
+                           SHARED_ARRAY_DIR_KEY:       None
                           }
 
+# run settings that can be given on the command line or in a config file; when the user
+# gives one of these on the command line, that wins over the value in the config file
+command_line_run_settings = [
+                             CACHE_DIR_KEY,
+                             QUANTILE_SKETCH_ACCURACY_KEY,
+                             COMPACT_MASKS_KEY,
+                             SKIP_CHECKSUMS_KEY,
+                             PREFETCH_ATTRIBUTES_KEY,
+                             PNG_COMPRESSION_KEY,
+                             THREADED_IMAGE_ENCODE_KEY,
+                             NUM_JOBS_KEY,
+                             MAX_FIGURE_WORKERS_KEY,
+                             FIGURES_PER_WORKER_KEY,
+                             MIN_FREE_MEMORY_KEY,
+                            ]
+
 # these are the built in longitude/latitude defaults
 glance_lon_lat_defaults = {
                            LONGITUDE_NAME_KEY:        'pixel_longitude',
                            LATITUDE_NAME_KEY:         'pixel_latitude',
                            LON_LAT_EPSILON_KEY:       0.0,
+                           LON_LAT_GREAT_CIRCLE_RADIUS_KEY: None,
                            LON_FILTER_FUNCTION_A_KEY: None,
                            LAT_FILTER_FUNCTION_A_KEY: None,
                            LON_FILTER_FUNCTION_B_KEY: None,
@@ -310,6 +339,23 @@ def _get_missing_values_if_needed((fileA, fileB),
     
     return missing_value_A, missing_value_B
 
+def _get_given_command_line_settings (optionsSet) :
+    """
+    get the run settings (from command_line_run_settings) that the user gave on the command line,
+    an option counts as given if its value isn't the one the command line has when it's left out
+    """
+    
+    parser = optparse.OptionParser()
+    set_up_command_line_options(parser)
+    unsetValues = parser.get_default_values()
+    
+    toReturn = { }
+    for settingKey in command_line_run_settings :
+        if (settingKey in optionsSet) and (optionsSet[settingKey] != getattr(unsetValues, settingKey, None)) :
+            toReturn[settingKey] = optionsSet[settingKey]
+    
+    return toReturn
+
 # TODO, right now this is the top level function that the library functions in
 # compare.py call
 def load_config_or_options(aPath, bPath, optionsSet, requestedVars = [ ]) :
@@ -345,6 +391,33 @@ def load_config_or_options(aPath, bPath, optionsSet, requestedVars = [ ]) :
     # this is ok for the moment, may want to reconsider later (FUTURE)
     runInfo[DO_COLOCATION_KEY] = (DO_COLOCATION_KEY in optionsSet) and (optionsSet[DO_COLOCATION_KEY])
     
+    # the cache directory may come from the command line (or the config file, see command_line_run_settings)
+    runInfo[CACHE_DIR_KEY] = optionsSet[CACHE_DIR_KEY] if CACHE_DIR_KEY in optionsSet else None
+    
+    # the quantile sketch accuracy may also come from the command line
+    runInfo[QUANTILE_SKETCH_ACCURACY_KEY] = optionsSet[QUANTILE_SKETCH_ACCURACY_KEY] if QUANTILE_SKETCH_ACCURACY_KEY in optionsSet else None
+    
+    # so may the choice to keep masks bit packed
+    runInfo[COMPACT_MASKS_KEY] = optionsSet[COMPACT_MASKS_KEY] if COMPACT_MASKS_KEY in optionsSet else False
+    
+    # and the choice not to calculate md5 sums for the files
+    runInfo[SKIP_CHECKSUMS_KEY] = optionsSet[SKIP_CHECKSUMS_KEY] if SKIP_CHECKSUMS_KEY in optionsSet else False
+    
+    # and the choice to load all the variable attributes at once
+    runInfo[PREFETCH_ATTRIBUTES_KEY] = optionsSet[PREFETCH_ATTRIBUTES_KEY] if PREFETCH_ATTRIBUTES_KEY in optionsSet else False
+    
+    # and how the images should be written
+    runInfo[PNG_COMPRESSION_KEY]       = optionsSet[PNG_COMPRESSION_KEY]       if PNG_COMPRESSION_KEY       in optionsSet else None
+    runInfo[THREADED_IMAGE_ENCODE_KEY] = optionsSet[THREADED_IMAGE_ENCODE_KEY] if THREADED_IMAGE_ENCODE_KEY in optionsSet else False
+    
+    # the number of variables to analyze at once may also come from the command line
+    runInfo[NUM_JOBS_KEY] = optionsSet[NUM_JOBS_KEY] if NUM_JOBS_KEY in optionsSet else 1
+    
+    # limits on the processes used to make images may also come from the command line
+    for settingKey in (MAX_FIGURE_WORKERS_KEY, FIGURES_PER_WORKER_KEY, MIN_FREE_MEMORY_KEY) :
+        if (settingKey in optionsSet) and (optionsSet[settingKey] is not None) :
+            runInfo[settingKey] = optionsSet[settingKey]
+    
     # check to see if the user wants to use a config file and if the path exists
     requestedConfigFile = optionsSet[OPTIONS_CONFIG_FILE_KEY]
     usedConfigFile      = False
@@ -381,8 +454,9 @@ def load_config_or_options(aPath, bPath, optionsSet, requestedVars = [ ]) :
             runInfo[DO_MAKE_REPORT_KEY]         = not optionsSet[OPTIONS_NO_REPORT_KEY]      if OPTIONS_NO_REPORT_KEY      in optionsSet else False
             runInfo[USE_NO_LON_OR_LAT_VARS_KEY] =     optionsSet[USE_NO_LON_OR_LAT_VARS_KEY] if USE_NO_LON_OR_LAT_VARS_KEY in optionsSet else False
             
-            # get everything from the config file
+            # get everything from the config file, except the settings the user gave on the command line
             runInfo.update(glanceRunConfig.settings)
+            runInfo.update(_get_given_command_line_settings(optionsSet))
             if (USE_NO_LON_OR_LAT_VARS_KEY not in runInfo) or (not runInfo[USE_NO_LON_OR_LAT_VARS_KEY]) :
                 runInfo.update(glanceRunConfig.lat_lon_info) # get info on the lat/lon variables
             
@@ -457,6 +531,16 @@ def set_up_command_line_options (parser) :
     parser.add_option('-d', '--nolonlat', dest=USE_NO_LON_OR_LAT_VARS_KEY,
                       action="store_true", default=False, help="do not try to find or analyze logitude and latitude")
     
+    # memory related options
+    parser.add_option('--chunk-rows', dest=OPTIONS_CHUNK_ROWS_KEY, type='int', default=None,
+                      help="read and analyze the data this many rows at a time to limit memory use (stats only; medians will only be calculated if --quantilesketch is also used)")
+    parser.add_option('--quantilesketch', dest=QUANTILE_SKETCH_ACCURACY_KEY, type='float', default=None,
+                      help="estimate medians and the 1st, 5th, 95th, and 99th percentiles in a single pass to within this relative accuracy (ex. 0.01) instead of sorting the data")
+    parser.add_option('--compact-masks', dest=COMPACT_MASKS_KEY,
+                      action="store_true", default=False, help="keep the data masks bit packed to use less memory (masks are unpacked when they are used)")
+    parser.add_option('--prefetch-attributes', dest=PREFETCH_ATTRIBUTES_KEY,
+                      action="store_true", default=False, help="load the attributes of all the variables in each file at once (faster for files with many variables)")
+    
     # output generation related options
     parser.add_option('-p', '--outputpath', dest=OPTIONS_OUTPUT_PATH_KEY, type='string', default='./',
                     help="set path to output directory")
@@ -468,6 +552,10 @@ def set_up_command_line_options (parser) :
                       help="generate only html report files (no images)")
     parser.add_option('-c', '--configfile', dest=OPTIONS_CONFIG_FILE_KEY, type='string', default=None,
                       help="set optional configuration file")
+    parser.add_option('--cachedir', dest=CACHE_DIR_KEY, type='string', default=None,
+                      help="set path to a directory where reusable intermediate results (such as colocation mappings and variable comparison results) will be kept between runs")
+    parser.add_option('--skip-md5', dest=SKIP_CHECKSUMS_KEY,
+                      action="store_true", default=False, help="don't calculate md5 sums for the input files (they will be listed as n/a in the report)")
     
     # should pass/fail be tested?
     parser.add_option('-x', '--doPassFail', dest=DO_TEST_PASSFAIL_KEY,
@@ -476,6 +564,18 @@ def set_up_command_line_options (parser) :
     # whether or not to do multiprocessing
     parser.add_option('-f', '--fork', dest=DO_MAKE_FORKS_KEY,
                       action="store_true", default=False, help="start multiple processes to create images in parallel")
+    parser.add_option('-j', '--jobs', dest=NUM_JOBS_KEY, type='int', default=1,
+                      help="analyze, plot, and report on this many variables at once in separate processes (reportGen only)")
+    parser.add_option('--figure-workers', dest=MAX_FIGURE_WORKERS_KEY, type='int', default=None,
+                      help="the most processes that may create images at once when --fork is used (defaults to one per cpu)")
+    parser.add_option('--figures-per-worker', dest=FIGURES_PER_WORKER_KEY, type='int', default=None,
+                      help="replace each image creation process with a fresh one after it has made this many images")
+    parser.add_option('--min-free-memory', dest=MIN_FREE_MEMORY_KEY, type='float', default=None,
+                      help="don't start another image creation process unless at least this many MB of memory are available")
+    parser.add_option('--png-compression', dest=PNG_COMPRESSION_KEY, type='int', default=None,
+                      help="the zlib compression level (0 to 9) for the png images; lower levels are faster to write but make larger files")
+    parser.add_option('--threaded-encode', dest=THREADED_IMAGE_ENCODE_KEY,
+                      action="store_true", default=False, help="encode each image's thumbnail in a separate thread while the full sized image is encoded")
 
     parser.add_option('--parsable', dest=PARSABLE_OUTPUT_KEY,
                       action="store_true", default=False, help="format output to be programmatically parsed. 'info' only")
@@ -502,17 +602,31 @@ def convert_options_to_dict (options) :
     tempOptions[OPTIONS_LONLAT_EPSILON_KEY] = options.lonlatepsilon
     tempOptions[USE_NO_LON_OR_LAT_VARS_KEY] = options.noLonLatVars
     
+    # memory related options
+    tempOptions[OPTIONS_CHUNK_ROWS_KEY]     = options.chunkRows
+    tempOptions[QUANTILE_SKETCH_ACCURACY_KEY] = options.quantile_sketch_accuracy
+    tempOptions[COMPACT_MASKS_KEY]          = options.compactMasks
+    tempOptions[PREFETCH_ATTRIBUTES_KEY]    = options.prefetchAttributes
+    
     # in/out file related options
     tempOptions[OPTIONS_OUTPUT_PATH_KEY]    = clean_path(options.outputpath)
     tempOptions[OPTIONS_CONFIG_FILE_KEY]    = clean_path(options.configFile)
     tempOptions[OPTIONS_NO_REPORT_KEY]      = options.imagesOnly
     tempOptions[OPTIONS_NO_IMAGES_KEY]      = options.htmlOnly
+    tempOptions[CACHE_DIR_KEY]              = clean_path(options.cacheDirectory)
+    tempOptions[SKIP_CHECKSUMS_KEY]         = options.skipChecksums
     
     # whether or not to do pass fail testing
     tempOptions[DO_TEST_PASSFAIL_KEY]       = options.usePassFail
     
     # whether or not to do multiprocessing
     tempOptions[DO_MAKE_FORKS_KEY]          = options.doFork
+    tempOptions[NUM_JOBS_KEY]               = options.numJobs
+    tempOptions[PNG_COMPRESSION_KEY]        = options.pngCompressionLevel
+    tempOptions[THREADED_IMAGE_ENCODE_KEY]  = options.threadedImageEncode
+    tempOptions[MAX_FIGURE_WORKERS_KEY]     = options.maxFigureWorkers
+    tempOptions[FIGURES_PER_WORKER_KEY]     = options.figuresPerWorker
+    tempOptions[MIN_FREE_MEMORY_KEY]        = options.minFreeMemoryMB
     
     return tempOptions
 
@@ -25,6 +25,18 @@ USE_NO_LON_OR_LAT_VARS_KEY = 'noLonLatVars'
 SHORT_CIRCUIT_DIFFS_KEY    = 'short_circuit_diffs'
 USE_CUSTOM_PROJ_KEY        = 'use_custom_projection'
 PARSABLE_OUTPUT_KEY        = 'parsable_output'
+CACHE_DIR_KEY              = 'cacheDirectory'
+QUANTILE_SKETCH_ACCURACY_KEY = 'quantile_sketch_accuracy'
+NUM_JOBS_KEY               = 'numJobs'
+MAX_FIGURE_WORKERS_KEY     = 'maxFigureWorkers'
+FIGURES_PER_WORKER_KEY     = 'figuresPerWorker'
+MIN_FREE_MEMORY_KEY        = 'minFreeMemoryMB'
+SHARED_ARRAY_DIR_KEY       = 'sharedArrayDirectory'
+COMPACT_MASKS_KEY          = 'compactMasks'
+SKIP_CHECKSUMS_KEY         = 'skipChecksums'
+PREFETCH_ATTRIBUTES_KEY    = 'prefetchAttributes'
+PNG_COMPRESSION_KEY        = 'pngCompressionLevel'
+THREADED_IMAGE_ENCODE_KEY  = 'threadedImageEncode'
 
 # constants related to storing information from the run
 
@@ -61,6 +73,7 @@ LON_ALT_NAME_IN_B_KEY      = 'longitude_alt_name_in_b'
 LAT_ALT_NAME_IN_B_KEY      = 'latitude_alt_name_in_b'
 
 LON_LAT_EPSILON_KEY        = 'lon_lat_epsilon'
+LON_LAT_GREAT_CIRCLE_RADIUS_KEY = 'lon_lat_great_circle_radius'
 
 LON_FILTER_FUNCTION_A_KEY  = 'data_filter_function_lon_in_a'
 LAT_FILTER_FUNCTION_A_KEY  = 'data_filter_function_lat_in_a'
@@ -136,6 +149,16 @@ DO_PLOT_ABS_DIFF_KEY       = 'do_plot_abs_diff'
 DO_PLOT_SUB_DIFF_KEY       = 'do_plot_sub_diff'
 DO_PLOT_MISMATCH_KEY       = 'do_plot_mismatch'
 
+# how mapped plots should be drawn, either MAP_RENDER_CONTOUR, MAP_RENDER_RASTER, or
+# None (to draw them as rasters when there are more than the raster pixel threshold points)
+MAP_RENDER_MODE_KEY        = 'map_render_mode'
+MAP_RENDER_CONTOUR         = 'contour'
+MAP_RENDER_RASTER          = 'raster'
+# the number of data points above which mapped plots will be drawn as rasters
+RASTER_PIXEL_THRESHOLD_KEY = 'raster_pixel_threshold'
+# the number of raster cells across the longer side of the map in raster mapped plots
+RASTER_RESOLUTION_KEY      = 'raster_resolution'
+
 DETAIL_DPI_KEY             = 'detail_DPI'
 THUMBNAIL_DPI_KEY          = 'thumb_DPI'
 
@@ -222,6 +245,7 @@ OPTIONS_NO_IMAGES_KEY      = 'htmlOnly'
 OPTIONS_LAT_VAR_NAME_KEY   = 'latitudeVar'
 OPTIONS_LON_VAR_NAME_KEY   = 'longitudeVar'
 OPTIONS_LONLAT_EPSILON_KEY = 'lonlatepsilon'
+OPTIONS_CHUNK_ROWS_KEY     = 'chunkRows'
 
 # values used by the reports
 
@@ -8,7 +8,7 @@ Copyright (c) 2010 University of Wisconsin SSEC. All rights reserved.
 """
 
 import logging
-import os, subprocess, datetime
+import os, shutil, datetime, tempfile, hashlib, json, copy
 import numpy as np
 
 import glance.delta     as delta
@@ -55,6 +55,186 @@ class IncompatableDataObjects (ValueError) :
         """
         return self.message
 
+def _open_shared_array (path, dtype, shape) :
+    """
+    reopen an array that was placed in a SharedArrayStore, given its descriptor
+    (this is what a pickled SharedArray turns back into in another process)
+    """
+    
+    return SharedArray(path, dtype=np.dtype(dtype), mode='r', shape=tuple(shape))
+
+class SharedArray (np.memmap) :
+    """
+    a read only array backed by a file in a SharedArrayStore
+    
+    Every process that maps the file shares the same pages, so handing one of
+    these to worker processes does not copy the data. When pickled, a whole
+    shared array is sent as a small descriptor (path, dtype and shape) and is
+    mapped again on the other side. Views, slices and results calculated from
+    a shared array are ordinary arrays (or scalars), so they can be used and
+    pickled like the results of any other array.
+    """
+    
+    def __array_finalize__ (self, obj) :
+        np.memmap.__array_finalize__(self, obj)
+        # only the array the store hands out is described by its file;
+        # anything derived from it must be pickled the normal way
+        self.descriptor = None
+    
+    def __array_wrap__ (self, arr, context=None) :
+        # np.memmap keeps the type of its subclasses in ufunc results, so do what it does for itself:
+        # new results are plain (writable) arrays and reductions to a single value are scalars
+        arr = np.ndarray.__array_wrap__(self, arr, context)
+        if arr is self :
+            return arr
+        if arr.shape == () :
+            return arr[()]
+        return arr.view(np.ndarray)
+    
+    def __getitem__ (self, index) :
+        # slices are still read only views of the file, but they aren't the shared array itself;
+        # copies (from fancy indexing) are new arrays and can be changed like any other copy
+        result = np.memmap.__getitem__(self, index)
+        if not isinstance(result, SharedArray) :
+            return result
+        result = result.view(np.ndarray)
+        if not np.may_share_memory(result, self) :
+            result.flags.writeable = True
+        
+        return result
+    
+    def __reduce__ (self) :
+        if self.descriptor is not None :
+            return (_open_shared_array, self.descriptor)
+        return np.asarray(self).__reduce__()
+
+class SharedArrayStore (object) :
+    """
+    a temporary directory of memory mapped files used to share large arrays
+    with worker processes
+    
+    directory - the directory holding the files, None once the store is closed
+    """
+    
+    def __init__ (self, parentDirectory=None) :
+        """
+        create the store in a new temporary directory inside of the parent directory
+        (if no parent directory is given the system temporary directory will be used)
+        """
+        
+        self.directory = tempfile.mkdtemp(prefix="glance-shared-", dir=parentDirectory)
+        self._count    = 0
+        LOG.debug("Created shared array store in " + self.directory)
+    
+    def share (self, array) :
+        """
+        copy the array into the store and return a read only SharedArray with the same contents
+        
+        None, arrays that are already shared and empty arrays are returned unchanged
+        """
+        
+        if (array is None) or isinstance(array, SharedArray) :
+            return array
+        array = np.asarray(array)
+        if array.size <= 0 :
+            return array
+        
+        assert(self.directory is not None)
+        path = os.path.join(self.directory, "array" + str(self._count) + ".dat")
+        self._count += 1
+        
+        temp = np.memmap(path, dtype=array.dtype, mode='w+', shape=array.shape)
+        temp[...] = array
+        temp.flush()
+        del temp
+        
+        toReturn = _open_shared_array(path, array.dtype.str, array.shape)
+        toReturn.descriptor = (path, array.dtype.str, array.shape)
+        
+        return toReturn
+    
+    def close (self) :
+        """
+        remove the files in the store
+        
+        arrays that are still mapped stay usable until they are released,
+        but they can no longer be opened from their descriptors
+        """
+        
+        if self.directory is not None :
+            LOG.debug("Removing shared array store in " + self.directory)
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+    
+    def __enter__ (self) :
+        return self
+    
+    def __exit__ (self, excType, excValue, excTraceback) :
+        self.close()
+        return False
+    
+    def __del__ (self) :
+        # if something went wrong before the store was closed, don't leave its files behind
+        # (the forked figure workers never get here, they leave with os._exit)
+        self.close()
+
+class PackedMask (object) :
+    """
+    a boolean mask stored in a compact form, one bit per data point
+    
+    Masks that are entirely True or entirely False (which is common for ignore,
+    non-finite and missing masks) don't store any bits at all.
+    
+    shape      - the shape of the dense mask
+    size       - the number of points in the dense mask
+    true_count - how many points in the mask are True
+    bits       - the packed bits of the mask (None if the mask is uniform)
+    """
+    
+    def __init__ (self, mask) :
+        """
+        pack the given dense mask
+        """
+        
+        mask = np.asarray(mask, dtype=np.bool)
+        
+        self.shape      = mask.shape
+        self.size       = mask.size
+        self.true_count = int(np.count_nonzero(mask))
+        self.bits       = None
+        if (self.true_count > 0) and (self.true_count < self.size) :
+            self.bits = np.packbits(mask.ravel())
+    
+    def unpack (self) :
+        """
+        build a new dense version of this mask
+        """
+        
+        if self.bits is None :
+            return np.zeros(self.shape, dtype=np.bool) if self.true_count <= 0 else np.ones(self.shape, dtype=np.bool)
+        
+        return np.unpackbits(self.bits)[:self.size].view(np.bool).reshape(self.shape)
+    
+class _MaskAttribute (object) :
+    """
+    a mask in a mask set; if the mask set is compact the mask is stored packed
+    and a new dense mask is unpacked each time it is requested
+    """
+    
+    def __init__ (self, name) :
+        self.name = name
+    
+    def __get__ (self, maskSet, ownerClass=None) :
+        if maskSet is None :
+            return self
+        mask = maskSet._masks.get(self.name, None)
+        return mask.unpack() if isinstance(mask, PackedMask) else mask
+    
+    def __set__ (self, maskSet, mask) :
+        if maskSet.compact and isinstance(mask, np.ndarray) and (mask.size > 0) :
+            mask = PackedMask(mask)
+        maskSet._masks[self.name] = mask
+
 class BasicMaskSetObject (object) :
     """
     This class represents a basic set of masks that a data set may have.
@@ -69,14 +249,26 @@ class BasicMaskSetObject (object) :
     non_finite_mask - a mask of non-finite values
     missing_mask - a mask of where the data's fill value is present instead of
                    actual data values
+    
+    compact - if True the masks are bit packed (see PackedMask) and each time one of
+              them is requested a new dense copy is unpacked, so consumers that use
+              a mask more than once should keep it in a local variable
     """
     
+    ignore_mask     = _MaskAttribute('ignore_mask')
+    valid_mask      = _MaskAttribute('valid_mask')
+    non_finite_mask = _MaskAttribute('non_finite_mask')
+    missing_mask    = _MaskAttribute('missing_mask')
+    
     def __init__(self, ignoreMask,
-                 validMask=None, nonFiniteMask=None, missingMask=None) :
+                 validMask=None, nonFiniteMask=None, missingMask=None,
+                 compact=False) :
         """
         create the mask set with at least the ignore mask
         (the others are optional)
         """
+        self._masks  = { }
+        self.compact = compact
         self._reset_all_masks()
         
         self.ignore_mask     = ignoreMask
@@ -92,6 +284,38 @@ class BasicMaskSetObject (object) :
         self.valid_mask      = None
         self.non_finite_mask = None
         self.missing_mask    = None
+    
+    def count_true (self, name) :
+        """
+        count the True points in the named mask without building a dense version of it
+        """
+        
+        mask = self._masks.get(name, None)
+        if isinstance(mask, PackedMask) :
+            return mask.true_count
+        
+        return int(np.count_nonzero(mask)) if mask is not None else 0
+    
+    def pack (self) :
+        """
+        switch this mask set to compact storage, packing any masks it already has
+        """
+        
+        self.compact = True
+        for name, mask in self._masks.items() :
+            setattr(self, name, mask)
+    
+    def share_masks (self, store) :
+        """
+        move all of the masks in this set into the given SharedArrayStore
+        """
+        
+        for mask in self._masks.values() :
+            if isinstance(mask, PackedMask) and (mask.bits is not None) :
+                mask.bits = store.share(mask.bits)
+        for name, mask in self._masks.items() :
+            if isinstance(mask, np.ndarray) :
+                self._masks[name] = store.share(mask)
 
 class DiffMaskSetObject (BasicMaskSetObject) :
     """
@@ -108,10 +332,15 @@ class DiffMaskSetObject (BasicMaskSetObject) :
                            tolerance testing
     """
     
-    def __init__(self, ignoreMask, validInBothMask, mismatchMask, epsilonMask) :
+    mismatch_mask        = _MaskAttribute('mismatch_mask')
+    outside_epsilon_mask = _MaskAttribute('outside_epsilon_mask')
+    
+    def __init__(self, ignoreMask, validInBothMask, mismatchMask, epsilonMask, compact=False) :
         """
         create a more complex mask, including additional difference information
         """
+        self._masks  = { }
+        self.compact = compact
         self._reset_all_masks()
         
         self.ignore_mask          = ignoreMask
@@ -133,10 +362,12 @@ class DataObject (object) :
     override_fill_value - should the fill_value be used rather than the default_fill_value
                           (this defaults to True so the fill_value is used, insuring backwards compatability)
     default_fill_value  - the default fill value that will be used if override_fill_value is False
+    compact_masks       - should the masks be stored bit packed (see BasicMaskSetObject)
     """
     
     def __init__(self, dataArray, fillValue=None, ignoreMask=None,
-                 overrideFillValue=True, defaultFillValue=None) :
+                 overrideFillValue=True, defaultFillValue=None,
+                 compactMasks=False) :
         """
         Create the data object.
         
@@ -147,7 +378,8 @@ class DataObject (object) :
         """
         self.data       = dataArray if type(dataArray) == np.ndarray else np.array([dataArray])
         self.fill_value = fillValue
-        self.masks      = BasicMaskSetObject(ignoreMask)
+        self.compact_masks = compactMasks
+        self.masks      = BasicMaskSetObject(ignoreMask, compact=compactMasks)
         
         self.override_fill_value = overrideFillValue
         self.default_fill_value  = defaultFillValue
@@ -162,7 +394,7 @@ class DataObject (object) :
             ignore_mask_temp = ignoreMask
             if ignore_mask_temp is not None:
                 ignore_mask_temp = np.array([self.masks.ignore_mask.item()])
-            self.masks = BasicMaskSetObject(ignore_mask_temp)
+            self.masks = BasicMaskSetObject(ignore_mask_temp, compact=compactMasks)
 
     def copy (self) :
         """
@@ -170,7 +402,8 @@ class DataObject (object) :
         """
 
         copy_temp = DataObject(self.data.copy(), fillValue=self.fill_value, ignoreMask=self.masks.ignore_mask,
-                 overrideFillValue=self.override_fill_value, defaultFillValue=self.default_fill_value)
+                 overrideFillValue=self.override_fill_value, defaultFillValue=self.default_fill_value,
+                 compactMasks=self.compact_masks)
         copy_temp.is_scalar = self.is_scalar
 
         return copy_temp
@@ -190,11 +423,12 @@ class DataObject (object) :
             shape = self.data.shape
             
             # if there isn't an ignore mask, make an empty one
-            if self.masks.ignore_mask is None :
-                self.masks.ignore_mask = np.zeros(shape, dtype=np.bool)
+            ignore_mask = self.masks.ignore_mask
+            if ignore_mask is None :
+                ignore_mask = np.zeros(shape, dtype=np.bool)
             
             # find the non-finite values
-            non_finite_mask = ~ (np.isfinite(self.data) | self.masks.ignore_mask)
+            non_finite_mask = ~ (np.isfinite(self.data) | ignore_mask)
 
             # find and mark the missing values
             missing_mask = np.zeros(shape, dtype=np.bool)
@@ -202,7 +436,7 @@ class DataObject (object) :
             tempFillValue = self.select_fill_value()
             if tempFillValue is not None :
                 missing_mask[self.data == tempFillValue] = True
-                missing_mask[self.masks.ignore_mask]     = False
+                missing_mask[ignore_mask]                = False
             
             # define the valid mask as places where the data is not missing,
             # nonfinite, or ignored
@@ -210,14 +444,15 @@ class DataObject (object) :
             valid_mask = np.zeros(shape, dtype=np.bool)
             if len(shape) > 0 :
                 np.logical_or(missing_mask, non_finite_mask, valid_mask)
-                np.logical_or(self.masks.ignore_mask, valid_mask, valid_mask)
+                np.logical_or(ignore_mask, valid_mask, valid_mask)
                 np.logical_not(valid_mask, valid_mask)
             else :
                 valid_mask = np.array([ ], dtype=np.bool)
             
             # set our masks
-            self.masks = BasicMaskSetObject(self.masks.ignore_mask, valid_mask,
-                                            non_finite_mask, missing_mask)
+            self.masks = BasicMaskSetObject(ignore_mask, valid_mask,
+                                            non_finite_mask, missing_mask,
+                                            compact=self.compact_masks)
             
             self.have_analyzed = True
     
@@ -263,6 +498,17 @@ class DataObject (object) :
             shape_msg += " = " + str(self.data.item())
 
         return shape_msg
+    
+    def share_arrays (self, store) :
+        """
+        move the data and masks of this data object into the given SharedArrayStore,
+        so that worker processes can use them without copying them
+        
+        Note: the shared arrays are read only.
+        """
+        
+        self.data = store.share(self.data)
+        self.masks.share_masks(store)
 
 class DiffInfoObject (object) :
     """
@@ -309,6 +555,9 @@ class DiffInfoObject (object) :
                     #np.float128: 1.189731495357231765e+4932,
                    }
     
+    # the epsilon tests work through the data this many points at a time
+    EPSILON_BLOCK_SIZE = 2 ** 16
+    
     def __init__(self, aDataObject, bDataObject,
                  epsilonValue=0.0, epsilonPercent=None) :
         """
@@ -326,6 +575,16 @@ class DiffInfoObject (object) :
         self.diff_data_object = DiffInfoObject.analyze(aDataObject, bDataObject,
                                                        epsilonValue, epsilonPercent)
     
+    def share_arrays (self, store) :
+        """
+        move the data and masks of the A, B and difference data objects into the
+        given SharedArrayStore, so that worker processes can use them without copying them
+        """
+        
+        self.a_data_object.share_arrays(store)
+        self.b_data_object.share_arrays(store)
+        self.diff_data_object.share_arrays(store)
+    
     @staticmethod
     def _get_shared_type_and_fill_value(data1, data2, fill1=None, fill2=None) :
         """
@@ -385,6 +644,52 @@ class DiffInfoObject (object) :
         
         return type_to_return, fill_value_to_return
     
+    @staticmethod
+    def _find_outside_epsilon(raw_diff, a_data, valid_in_both, epsilonValue=0.0, epsilonPercent=None) :
+        """
+        build a mask of the valid points where the difference is larger than the epsilon value
+        or larger than the epsilon percent of the A data
+        
+        The data is worked through EPSILON_BLOCK_SIZE points at a time, so the absolute
+        differences (shared by both tests) and the percentage tolerances only ever need
+        small preallocated buffers rather than full size temporary arrays.
+        """
+        
+        outside_epsilon_mask = np.zeros(raw_diff.shape, dtype=np.bool)
+        if ((epsilonValue is None) and (epsilonPercent is None)) or (raw_diff.size <= 0) :
+            return outside_epsilon_mask
+        
+        diff_flat    = raw_diff.reshape(-1)
+        a_flat       = a_data.reshape(-1)
+        valid_flat   = valid_in_both.reshape(-1)
+        outside_flat = outside_epsilon_mask.reshape(-1)
+        
+        block_size   = min(DiffInfoObject.EPSILON_BLOCK_SIZE, diff_flat.size)
+        abs_buffer   = np.empty(block_size, dtype=raw_diff.dtype)
+        if epsilonPercent is not None :
+            percent        = float(epsilonPercent) / 100.0
+            tol_buffer     = np.empty(block_size, dtype=np.result_type(a_data, percent))
+            percent_buffer = np.empty(block_size, dtype=np.bool)
+        
+        for start in range(0, diff_flat.size, block_size) :
+            end      = min(start + block_size, diff_flat.size)
+            size     = end - start
+            abs_diff = abs_buffer[:size]
+            outside  = outside_flat[start:end]
+            
+            np.absolute(diff_flat[start:end], out=abs_diff)
+            if epsilonValue is not None :
+                np.greater(abs_diff, epsilonValue, out=outside)
+            if epsilonPercent is not None :
+                tolerance = tol_buffer[:size]
+                np.multiply(a_flat[start:end], percent, out=tolerance)
+                np.absolute(tolerance, out=tolerance)
+                np.greater(abs_diff, tolerance, out=percent_buffer[:size])
+                np.logical_or(outside, percent_buffer[:size], out=outside)
+            np.logical_and(outside, valid_flat[start:end], out=outside)
+        
+        return outside_epsilon_mask
+    
     @staticmethod
     def analyze(aDataObject, bDataObject,
                 epsilonValue=0.0, epsilonPercent=None):
@@ -402,6 +707,9 @@ class DiffInfoObject (object) :
         aDataObject.self_analysis()
         bDataObject.self_analysis()
         
+        # should the difference masks be stored compactly?
+        compact_masks  = aDataObject.compact_masks or bDataObject.compact_masks
+        
         # where is the shared valid data?
         valid_in_both  = aDataObject.masks.valid_mask  & bDataObject.masks.valid_mask
         ignore_in_both = aDataObject.masks.ignore_mask | bDataObject.masks.ignore_mask
@@ -415,29 +723,28 @@ class DiffInfoObject (object) :
         # we can't continue if we don't have a fill value
         assert(fill_data_value is not None)
 
-        # construct our diff'ed data set
-        raw_diff = np.zeros(shape, dtype=sharedType)
-        raw_diff[~valid_in_both] = fill_data_value # throw away invalid data
-        # compute difference, using shared type in computation
-        raw_diff[valid_in_both] = bDataObject.data[valid_in_both].astype(sharedType) -  \
-                                  aDataObject.data[valid_in_both].astype(sharedType)
+        # construct our diff'ed data set, starting with the fill value everywhere
+        # and then subtracting in the shared type only where both sets are valid
+        # (the inputs are cast a buffer at a time, so no full size copies are made)
+        raw_diff = np.empty(shape, dtype=sharedType)
+        raw_diff.fill(fill_data_value)
+        np.subtract(bDataObject.data, aDataObject.data, out=raw_diff, where=valid_in_both,
+                    dtype=sharedType, casting='unsafe')
         
         # the valid data which is too different between the two sets according to the given epsilon
-        outside_epsilon_mask = np.zeros(shape, dtype=np.bool)
-        if (epsilonValue   is not None) :
-            outside_epsilon_mask |= (abs(raw_diff) > epsilonValue) & valid_in_both
-        if (epsilonPercent is not None) :
-            outside_epsilon_mask |= (abs(raw_diff) > abs(aDataObject.data * (float(epsilonPercent) / 100.0))) & valid_in_both
+        outside_epsilon_mask = DiffInfoObject._find_outside_epsilon(raw_diff, aDataObject.data, valid_in_both,
+                                                                    epsilonValue, epsilonPercent)
         
         # mismatch points = mismatched nans, mismatched missing-values, differences that are too large 
-        mismatch_pt_mask = ( (aDataObject.masks.non_finite_mask ^ bDataObject.masks.non_finite_mask) |
-                             (aDataObject.masks.missing_mask    ^ bDataObject.masks.missing_mask)    |
-                             outside_epsilon_mask )
+        mismatch_pt_mask  = aDataObject.masks.non_finite_mask ^ bDataObject.masks.non_finite_mask
+        mismatch_pt_mask |= aDataObject.masks.missing_mask    ^ bDataObject.masks.missing_mask
+        mismatch_pt_mask |= outside_epsilon_mask
         
         # make our diff data object
-        diff_data_object = DataObject(raw_diff, fillValue=fill_data_value)
+        diff_data_object = DataObject(raw_diff, fillValue=fill_data_value, compactMasks=compact_masks)
         diff_data_object.masks = DiffMaskSetObject(ignore_in_both, valid_in_both,
-                                                   mismatch_pt_mask, outside_epsilon_mask)
+                                                   mismatch_pt_mask, outside_epsilon_mask,
+                                                   compact=compact_masks)
         
         return diff_data_object
     
@@ -457,6 +764,170 @@ class DiffInfoObject (object) :
         
         return
 
+# the size of the pieces files are read in when their md5 sums are calculated
+CHECKSUM_READ_SIZE       = 4 * 1024 * 1024
+# the name of the file in the cache directory where md5 sums are kept between runs
+CHECKSUM_CACHE_FILE_NAME = 'glance-checksums.json'
+# what's reported in place of an md5 sum when checksums are being skipped
+SKIPPED_CHECKSUM_TEXT    = 'n/a'
+
+# how the md5 sums of files are being handled (see configure_checksums)
+_checksum_settings = {'cacheDirectory': None, 'skip': False}
+# the md5 sums we've already found in this process, keyed on the identity of the file
+_checksum_cache    = { }
+
+def configure_checksums (cacheDirectory=None, skipChecksums=False) :
+    """
+    set how the md5 sums of files will be found
+    
+    if a cacheDirectory is given, the md5 sums will be kept there between runs and a file
+    will only be hashed again if its size, modification time, or inode changes; if
+    skipChecksums is True, files will not be hashed at all
+    """
+    
+    _checksum_settings['cacheDirectory'] = cacheDirectory
+    _checksum_settings['skip']           = skipChecksums
+
+def _get_file_identity (pathToFile) :
+    """
+    get the absolute path, size, modification time, and inode of a file
+    
+    these identify a particular version of a file well enough that we don't need to hash it again
+    """
+    
+    tempPath  = os.path.abspath(os.path.expanduser(pathToFile))
+    fileStats = os.stat(tempPath)
+    
+    return (tempPath, fileStats.st_size, fileStats.st_mtime, fileStats.st_ino)
+
+def _load_saved_checksums (cacheDirectory) :
+    """
+    load the md5 sums saved in the cache directory, returns a dictionary in the form
+    {file path: [size, modification time, inode, md5 sum]} (this will be empty if
+    nothing could be loaded)
+    """
+    
+    checksumPath = os.path.join(cacheDirectory, CHECKSUM_CACHE_FILE_NAME)
+    if not os.path.exists(checksumPath) :
+        return { }
+    
+    try :
+        with open(checksumPath, 'r') as checksumFile :
+            return json.load(checksumFile)
+    except (IOError, ValueError), err :
+        LOG.warn("Unable to load saved md5 sums from " + checksumPath + ": " + str(err))
+    
+    return { }
+
+def _save_checksum (cacheDirectory, fileIdentity, md5sum) :
+    """
+    save the md5 sum for this version of a file in the cache directory
+    """
+    
+    tempPath, fileSize, modifiedTime, inode = fileIdentity
+    
+    try :
+        if not os.path.isdir(cacheDirectory) :
+            os.makedirs(cacheDirectory)
+        
+        # reload what's saved right before we update it, another process may have added to it
+        savedChecksums           = _load_saved_checksums(cacheDirectory)
+        savedChecksums[tempPath] = [fileSize, modifiedTime, inode, md5sum]
+        
+        # write to a temporary file first so that no one ever sees a half written file
+        checksumPath = os.path.join(cacheDirectory, CHECKSUM_CACHE_FILE_NAME)
+        fileHandle, tempFilePath = tempfile.mkstemp(dir=cacheDirectory, prefix=CHECKSUM_CACHE_FILE_NAME + '.')
+        with os.fdopen(fileHandle, 'w') as checksumFile :
+            json.dump(savedChecksums, checksumFile)
+        os.rename(tempFilePath, checksumPath)
+    except (IOError, OSError), err :
+        LOG.warn("Unable to save the md5 sum for " + tempPath + ": " + str(err))
+
+def _calculate_md5 (pathToFile) :
+    """
+    calculate the md5 sum of a file, reading it a piece at a time
+    """
+    
+    hasher = hashlib.md5()
+    with open(pathToFile, 'rb') as fileToHash :
+        for piece in iter(lambda : fileToHash.read(CHECKSUM_READ_SIZE), b'') :
+            hasher.update(piece)
+    
+    return hasher.hexdigest()
+
+def get_file_md5 (pathToFile) :
+    """
+    get the md5 sum of a file, reusing any md5 sum we've already found for this
+    version of the file (in this process or, if there's a cache directory, in an
+    earlier run)
+    
+    returns None if checksums are being skipped
+    """
+    
+    if _checksum_settings['skip'] :
+        return None
+    
+    fileIdentity = _get_file_identity(pathToFile)
+    if fileIdentity in _checksum_cache :
+        return _checksum_cache[fileIdentity]
+    
+    md5sum         = None
+    cacheDirectory = _checksum_settings['cacheDirectory']
+    
+    # see if we saved the md5 sum for this version of the file in an earlier run
+    if cacheDirectory is not None :
+        savedInfo = _load_saved_checksums(cacheDirectory).get(fileIdentity[0], None)
+        if (savedInfo is not None) and (tuple(savedInfo[:3]) == fileIdentity[1:]) :
+            md5sum = str(savedInfo[3])
+    
+    # if we didn't have it, calculate it
+    if md5sum is None :
+        LOG.debug("Calculating md5sum for " + fileIdentity[0])
+        md5sum = _calculate_md5(fileIdentity[0])
+        if cacheDirectory is not None :
+            _save_checksum(cacheDirectory, fileIdentity, md5sum)
+    
+    LOG.info("File md5sum: " + md5sum)
+    _checksum_cache[fileIdentity] = md5sum
+    
+    return md5sum
+
+class DeferredChecksum (object) :
+    """
+    This class stands in for the md5 sum of a file in the information given to the reports,
+    the md5 sum isn't found until the report is rendered (when this is turned into a string).
+    """
+    
+    def __init__ (self, fileInfo) :
+        """
+        create the deferred checksum for a glance.data.FileInfo object
+        """
+        
+        self.file_info = fileInfo
+    
+    def get (self) :
+        """
+        get the md5 sum, or the text we show in it's place if checksums are being skipped
+        """
+        
+        md5sum = self.file_info.md5_sum
+        
+        return md5sum if md5sum is not None else SKIPPED_CHECKSUM_TEXT
+    
+    def __str__ (self) :
+        return self.get()
+
+def resolve_deferred_checksums (files) :
+    """
+    find any md5 sums that are still deferred in a files dictionary (in the form given
+    to the reports); this is useful before forking processes that will all render reports,
+    so that they don't each hash the same files
+    """
+    
+    for fileInfo in files.values() :
+        if isinstance(fileInfo.get(constants.MD5SUM_KEY, None), DeferredChecksum) :
+            fileInfo[constants.MD5SUM_KEY].get()
+
 class FileInfo (object) :
     """
     This class represents information about a file object. It may or may not include the actual file object.
@@ -464,7 +935,8 @@ class FileInfo (object) :
     The following member variables are available from this class:
     
     path          - the file path to reach the original file on disk
-    md5_sum       - an md5 sum calculated from the original file
+    md5_sum       - an md5 sum calculated from the original file (this is only calculated
+                    the first time it's used and will be None if checksums are being skipped)
     last_modified - the time that the file was last modified (TODO, what form should this be in?)
     file_object   - the file object that can be used to access the data in the file, may be None
     """
@@ -473,8 +945,10 @@ class FileInfo (object) :
         """
         Create the file info object using the values given.
         
-        If the md5 sum and last modified time aren't given, the initialization will figure them out.
-        Note: if the md5 sum is not given, the file object will also be loaded.
+        If the md5 sum and last modified time aren't given, the initialization will figure them out
+        (the md5 sum won't be calculated until it is needed).
+        Note: if the file object is not given, the file will be opened (through the active
+        glance.io.FilePool, if there is one).
         """
         
         self.path = pathToFile
@@ -483,26 +957,21 @@ class FileInfo (object) :
         # TODO, is this the right strategy?
         if not os.path.exists(self.path) :
             LOG.warn("Requested file " + self.path + " could not be opened because it does not exist.")
-            self.md5_sum       = None
+            self._md5_sum      = None
             self.last_modified = None
             self.file_object   = None
             return
         
-        # if the md5 sum isn't given, load the file and figure it out
-        if md5sum is None:
+        # if the file object isn't given, load the file
+        if fileObject is None:
             
             # open the file
             LOG.info("Opening " + self.path)
             tempPath       = os.path.abspath(os.path.expanduser(self.path))
             LOG.debug("Provided path after normalization and symbol expansion: " + tempPath)
-            fileObject     = io.open(tempPath, allowWrite=allowWrite)
+            fileObject     = io.acquire_file(tempPath, allowWrite=allowWrite)
             
-            # figure out the md5 sum
-            tempSubProcess = subprocess.Popen("md5sum \'" + tempPath + "\'", shell=True, stdout=subprocess.PIPE)
-            md5sum         = tempSubProcess.communicate()[0].split()[0]
-            LOG.info("File md5sum: " + str(md5sum))
-            
-        self.md5_sum       = md5sum
+        self._md5_sum      = md5sum
         self.file_object   = fileObject
         
         # if the last modified time isn't given, figure it out
@@ -514,6 +983,17 @@ class FileInfo (object) :
             
         self.last_modified = lastModifiedTime
     
+    @property
+    def md5_sum (self) :
+        """
+        the md5 sum of the file, this is calculated the first time it's used
+        """
+        
+        if (self._md5_sum is None) and os.path.exists(self.path) :
+            self._md5_sum = get_file_md5(self.path)
+        
+        return self._md5_sum
+    
     def get_version_without_file_object (self) :
         """
         get a version of this object without a file object
@@ -524,7 +1004,8 @@ class FileInfo (object) :
         if self.file_object is None:
             toReturn = self
         else:
-            toReturn = FileInfo(self.path, self.md5_sum, self.last_modified)
+            toReturn = copy.copy(self)
+            toReturn.file_object = None
         
         return toReturn
     
@@ -532,14 +1013,17 @@ class FileInfo (object) :
         """
         get a dictionary of information about this file in the older format
         
+        the md5 sum in the dictionary is deferred, it won't be calculated until the
+        report showing it is rendered
+        
         note: this is being used for compatability with the old code and should
         eventually be removed FUTURE
         """
         
         fileInfo = {constants.PATH_KEY: self.path}
         
-        if self.md5_sum is not None :
-            fileInfo[constants.MD5SUM_KEY] = self.md5_sum
+        if os.path.exists(self.path) :
+            fileInfo[constants.MD5SUM_KEY] = DeferredChecksum(self)
         if self.last_modified is not None:
             fileInfo[constants.LAST_MODIFIED_KEY] = self.last_modified
         
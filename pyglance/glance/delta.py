@@ -8,7 +8,6 @@ Copyright (c) 2009 University of Wisconsin SSEC. All rights reserved.
 """
 
 import logging
-import math
 import numpy as numpy
 from numpy import * # todo, remove this line
 
@@ -20,6 +19,10 @@ LOG = logging.getLogger(__name__)
 # assume that the spherical model of the earth has, in km
 SPHERICAL_EARTH_RADIUS = 6373.0
 
+# when calculating moments, data is worked through this many values at a time
+# so that each block (and the work buffers for it) stays in cache
+MOMENTS_BLOCK_SIZE = 2 ** 16
+
 # -------------- generic data manipulation and analysis --------------
 
 # TODO have someone double check the math here
@@ -28,19 +31,24 @@ def great_circle_distance (latitudeA, longitudeA, latitudeB, longitudeB) :
     Calculate the great circle distance (in km) between the A and B points
     given in the input parameters, the inputs are expected to be in degrees
     
+    the inputs may be single values or numpy arrays of matching shape
+    
     note: This method uses the spherical law of cosines, and is best suited
     for smaller distances.
     """
     
     # convert to radians
-    latARad = math.radians(latitudeA)
-    lonARad = math.radians(longitudeA)
-    latBRad = math.radians(latitudeB)
-    lonBRad = math.radians(longitudeB)
-    
-    distToReturn = math.acos(math.sin(latARad) * math.sin(latBRad) +
-                             math.cos(latARad) * math.cos(latBRad) *
-                             math.cos(lonBRad - lonARad)) * SPHERICAL_EARTH_RADIUS
+    latARad = numpy.radians(latitudeA)
+    lonARad = numpy.radians(longitudeA)
+    latBRad = numpy.radians(latitudeB)
+    lonBRad = numpy.radians(longitudeB)
+    
+    # floating point error can push the cosine slightly outside [-1, 1] for
+    # identical or antipodal points, so clip it before taking the arccos
+    cosineOfAngle = (numpy.sin(latARad) * numpy.sin(latBRad) +
+                     numpy.cos(latARad) * numpy.cos(latBRad) *
+                     numpy.cos(lonBRad - lonARad))
+    distToReturn  = numpy.arccos(numpy.clip(cosineOfAngle, -1.0, 1.0)) * SPHERICAL_EARTH_RADIUS
     
     return distToReturn
 
@@ -132,7 +140,8 @@ def calculate_root_mean_square (data, goodMask=None) :
     if goodMask is not None:
         numGoodPoints = numpy.sum(goodMask)
     
-    rootMeanSquare = numpy.sqrt( numpy.sum( data[goodMask] ** 2 ) / numGoodPoints )
+    # square in float64, so integer data isn't truncated (or overflowed) along the way
+    rootMeanSquare = numpy.sqrt( numpy.sum( numpy.square(data[goodMask], dtype=numpy.float64) ) / numGoodPoints )
     
     return rootMeanSquare
 
@@ -162,6 +171,479 @@ def convert_mag_dir_to_U_V_vector(magnitude_data, direction_data, invalidMask=No
     
     return uData, vData
 
+# ------------- streaming statistics --------------------
+
+class StreamingMoments (object) :
+    """
+    Accumulates the count, mean, variance, minimum, and maximum of a data set
+    that is seen a piece at a time. The pieces are combined using the pairwise
+    update of Chan et al. (the parallel form of Welford's method), so the results
+    don't lose precision the way naive running sums of squares do.
+    
+    Two StreamingMoments built from separate parts of a data set can be merged.
+    
+    count - the number of values seen
+    mean  - the mean of the values seen
+    m2    - the sum of the squared differences from the mean
+    min   - the minimum value seen (or None)
+    max   - the maximum value seen (or None)
+    """
+    
+    def __init__ (self) :
+        """
+        create an empty accumulator
+        """
+        
+        self.count = 0
+        self.mean  = 0.0
+        self.m2    = 0.0
+        self.min   = None
+        self.max   = None
+    
+    def add (self, values) :
+        """
+        add a set of values (any shape) to the accumulated moments
+        """
+        
+        values = values.ravel()
+        buffer = numpy.empty(min(MOMENTS_BLOCK_SIZE, values.size), dtype=numpy.float64)
+        
+        # work through the values a block at a time, so the block stays in cache while we use it
+        for start in range(0, values.size, MOMENTS_BLOCK_SIZE) :
+            block      = values[start:start + MOMENTS_BLOCK_SIZE]
+            centered   = buffer[:block.size]
+            blockMean  = numpy.mean(block, dtype=numpy.float64)
+            numpy.subtract(block, blockMean, out=centered)
+            
+            self._combine(block.size, blockMean, numpy.dot(centered, centered), numpy.min(block), numpy.max(block))
+    
+    def merge (self, other) :
+        """
+        merge the moments from another StreamingMoments into this one
+        """
+        
+        if other.count > 0 :
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+    
+    def _combine (self, count, mean, m2, minimum, maximum) :
+        """
+        combine the moments of another set of values with ours
+        """
+        
+        total      = self.count + count
+        meanChange = mean - self.mean
+        
+        self.m2    = self.m2 + m2 + (meanChange * meanChange) * (float(self.count) * count / total)
+        self.mean  = self.mean + meanChange * (float(count) / total)
+        self.count = total
+        self.min   = minimum if (self.min is None) or (minimum < self.min) else self.min
+        self.max   = maximum if (self.max is None) or (maximum > self.max) else self.max
+    
+    def variance (self) :
+        """
+        the (population) variance of the values, or nan if there aren't any
+        """
+        
+        return self.m2 / self.count if self.count > 0 else numpy.nan
+    
+    def std (self) :
+        """
+        the (population) standard deviation of the values, or nan if there aren't any
+        """
+        
+        return numpy.sqrt(self.variance())
+    
+    def root_mean_square (self) :
+        """
+        the root mean square of the values, or nan if there aren't any
+        """
+        
+        return numpy.sqrt(self.variance() + self.mean * self.mean) if self.count > 0 else numpy.nan
+
+class StreamingCorrelation (object) :
+    """
+    Accumulates the co-moments needed for the Pearson correlation coefficient
+    of two data sets that are seen a piece at a time. Like StreamingMoments, the
+    pieces are combined pairwise and two accumulators can be merged.
+    """
+    
+    def __init__ (self) :
+        """
+        create an empty accumulator
+        """
+        
+        self.count  = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.m2_x   = 0.0
+        self.m2_y   = 0.0
+        self.c_xy   = 0.0
+    
+    def add (self, xValues, yValues) :
+        """
+        add a set of paired values to the accumulated co-moments
+        """
+        
+        assert(xValues.shape == yValues.shape)
+        
+        if xValues.size <= 0 :
+            return
+        
+        meanX  = numpy.mean(xValues, dtype=numpy.float64)
+        meanY  = numpy.mean(yValues, dtype=numpy.float64)
+        xDiffs = numpy.subtract(xValues, meanX, dtype=numpy.float64)
+        yDiffs = numpy.subtract(yValues, meanY, dtype=numpy.float64)
+        
+        self._combine(xValues.size, meanX, meanY,
+                      numpy.dot(xDiffs.ravel(), xDiffs.ravel()),
+                      numpy.dot(yDiffs.ravel(), yDiffs.ravel()),
+                      numpy.dot(xDiffs.ravel(), yDiffs.ravel()))
+    
+    def merge (self, other) :
+        """
+        merge the co-moments from another StreamingCorrelation into this one
+        """
+        
+        if other.count > 0 :
+            self._combine(other.count, other.mean_x, other.mean_y, other.m2_x, other.m2_y, other.c_xy)
+    
+    def _combine (self, count, meanX, meanY, m2X, m2Y, cXY) :
+        """
+        combine the co-moments of another set of values with ours
+        """
+        
+        total       = self.count + count
+        weight      = float(self.count) * count / total
+        xMeanChange = meanX - self.mean_x
+        yMeanChange = meanY - self.mean_y
+        
+        self.m2_x   = self.m2_x + m2X + xMeanChange * xMeanChange * weight
+        self.m2_y   = self.m2_y + m2Y + yMeanChange * yMeanChange * weight
+        self.c_xy   = self.c_xy + cXY + xMeanChange * yMeanChange * weight
+        self.mean_x = self.mean_x + xMeanChange * (float(count) / total)
+        self.mean_y = self.mean_y + yMeanChange * (float(count) / total)
+        self.count  = total
+    
+    def correlation (self) :
+        """
+        the Pearson correlation r-coefficient of the paired values,
+        or nan if there are fewer than two pairs or either set is constant
+        """
+        
+        if (self.count < 2) or (self.m2_x <= 0.0) or (self.m2_y <= 0.0) :
+            return numpy.nan
+        
+        # like scipy's pearsonr, keep round off from pushing us outside [-1, 1]
+        return max(min(self.c_xy / numpy.sqrt(self.m2_x * self.m2_y), 1.0), -1.0)
+
+def _add_difference_block (diffValues, deltaMoments, absDiffMoments, centered, absolute) :
+    """
+    add a block of differences to the StreamingMoments of the differences and
+    of their absolute values, using the given float64 work buffers (which must
+    be the same size as the block)
+    
+    the sum of squares of the absolute values is the same as that of the
+    differences, so the second moment of the absolute values doesn't need its own pass
+    """
+    
+    count     = diffValues.size
+    deltaMean = numpy.mean(diffValues, dtype=numpy.float64)
+    numpy.subtract(diffValues, deltaMean, out=centered)
+    deltaM2   = numpy.dot(centered, centered)
+    deltaMin  = numpy.min(diffValues)
+    deltaMax  = numpy.max(diffValues)
+    deltaMoments._combine(count, deltaMean, deltaM2, deltaMin, deltaMax)
+    
+    numpy.absolute(diffValues, out=absolute)
+    absMean = numpy.mean(absolute)
+    # sum(|d|^2) == sum(d^2) == m2 + n * mean^2
+    absM2   = max(deltaM2 + count * (deltaMean * deltaMean - absMean * absMean), 0.0)
+    absMin  = numpy.min(absolute) if (deltaMin < 0) and (deltaMax > 0) else min(abs(deltaMin), abs(deltaMax))
+    absDiffMoments._combine(count, absMean, absM2, absMin, max(abs(deltaMin), abs(deltaMax)))
+
+def calculate_difference_moments (diffValues, blockSize=MOMENTS_BLOCK_SIZE) :
+    """
+    calculate StreamingMoments of a set of differences and of their absolute values
+    
+    the differences are worked through blockSize values at a time, so that each block
+    stays in cache while everything is calculated from it and the only temporary arrays
+    are two block sized work buffers
+    
+    returns the moments of the differences and the moments of the absolute differences
+    """
+    
+    deltaMoments   = StreamingMoments()
+    absDiffMoments = StreamingMoments()
+    
+    diffValues = diffValues.ravel()
+    centered   = numpy.empty(min(blockSize, diffValues.size), dtype=numpy.float64)
+    absolute   = numpy.empty(min(blockSize, diffValues.size), dtype=numpy.float64)
+    
+    for start in range(0, diffValues.size, blockSize) :
+        diffBlock = diffValues[start:start + blockSize]
+        _add_difference_block(diffBlock, deltaMoments, absDiffMoments,
+                              centered[:diffBlock.size], absolute[:diffBlock.size])
+    
+    return deltaMoments, absDiffMoments
+
+def calculate_comparison_moments (aValues, bValues, diffValues, blockSize=MOMENTS_BLOCK_SIZE) :
+    """
+    calculate everything needed for the moment based comparison statistics of two data
+    sets from their paired values (generally the values that are valid in both sets)
+    and the differences between them, in a single traversal of the values
+    
+    the values are worked through blockSize values at a time; in each block the A and B
+    values are centered into two float64 work buffers, their co-moments are taken as dot
+    products of those buffers, and then the buffers are reused for the moments of the
+    differences, so the only temporary arrays are the two block sized buffers
+    
+    returns the number of perfect matches, a StreamingCorrelation of the A and B values,
+    and the StreamingMoments of the differences and of the absolute differences
+    """
+    
+    assert(aValues.size == bValues.size)
+    assert(aValues.size == diffValues.size)
+    
+    perfectMatchCount = 0
+    correlation       = StreamingCorrelation()
+    deltaMoments      = StreamingMoments()
+    absDiffMoments    = StreamingMoments()
+    
+    aValues    = aValues.ravel()
+    bValues    = bValues.ravel()
+    diffValues = diffValues.ravel()
+    aBuffer    = numpy.empty(min(blockSize, aValues.size), dtype=numpy.float64)
+    bBuffer    = numpy.empty(min(blockSize, aValues.size), dtype=numpy.float64)
+    
+    for start in range(0, aValues.size, blockSize) :
+        aBlock    = aValues[start:start + blockSize]
+        bBlock    = bValues[start:start + blockSize]
+        count     = aBlock.size
+        aCentered = aBuffer[:count]
+        bCentered = bBuffer[:count]
+        
+        perfectMatchCount += numpy.count_nonzero(aBlock == bBlock)
+        
+        aMean = numpy.mean(aBlock, dtype=numpy.float64)
+        bMean = numpy.mean(bBlock, dtype=numpy.float64)
+        numpy.subtract(aBlock, aMean, out=aCentered)
+        numpy.subtract(bBlock, bMean, out=bCentered)
+        correlation._combine(count, aMean, bMean,
+                             numpy.dot(aCentered, aCentered),
+                             numpy.dot(bCentered, bCentered),
+                             numpy.dot(aCentered, bCentered))
+        
+        _add_difference_block(diffValues[start:start + blockSize], deltaMoments, absDiffMoments, aCentered, bCentered)
+    
+    return perfectMatchCount, correlation, deltaMoments, absDiffMoments
+
+class QuantileSketch (object) :
+    """
+    A small, mergeable sketch of a data set's distribution that can estimate
+    quantiles (such as the median) in a single pass without sorting the data.
+    
+    Values are counted in logarithmically spaced buckets, with bucket edges at
+    powers of gamma = (1 + relative_accuracy) / (1 - relative_accuracy), so every
+    quantile estimate is within relative_accuracy (relative to its own magnitude)
+    of a value that truly has that rank in the data. Positive and negative values
+    are kept in separate sets of buckets and zeros are counted separately. The
+    sketch is deterministic: the same values give the same sketch in any order.
+    
+    Two QuantileSketches with the same accuracy built from separate parts of a
+    data set can be merged.
+    
+    relative_accuracy - the relative accuracy of the quantile estimates
+    count             - the number of values seen
+    zero_count        - the number of values seen that were (effectively) zero
+    min               - the minimum value seen (or None); for a sketch made by
+                        absolute_value this may only be a lower bound
+    max               - the maximum value seen (or None)
+    """
+    
+    # values are converted to bucket keys this many at a time, to bound the temporary memory used
+    ADD_BLOCK_SIZE = 2 ** 20
+    
+    def __init__ (self, relative_accuracy=0.01) :
+        """
+        create an empty sketch with the given relative accuracy
+        """
+        
+        assert((relative_accuracy > 0.0) and (relative_accuracy < 1.0))
+        
+        self.relative_accuracy = float(relative_accuracy)
+        self.gamma             = (1.0 + self.relative_accuracy) / (1.0 - self.relative_accuracy)
+        self._log_gamma        = numpy.log(self.gamma)
+        
+        self.count      = 0
+        self.zero_count = 0
+        self.min        = None
+        self.max        = None
+        
+        # the bucket keys (sorted) and counts for the magnitudes of the positive and negative values
+        self._positive_keys   = numpy.zeros(0, dtype=numpy.int64)
+        self._positive_counts = numpy.zeros(0, dtype=numpy.int64)
+        self._negative_keys   = numpy.zeros(0, dtype=numpy.int64)
+        self._negative_counts = numpy.zeros(0, dtype=numpy.int64)
+    
+    def add (self, values) :
+        """
+        add a set of values (any shape, assumed to be finite) to the sketch
+        """
+        
+        values = numpy.asarray(values).ravel()
+        
+        if values.size <= 0 :
+            return
+        
+        for start in range(0, values.size, QuantileSketch.ADD_BLOCK_SIZE) :
+            block = values[start:start + QuantileSketch.ADD_BLOCK_SIZE].astype(numpy.float64)
+            
+            # anything too small to take a log of is counted as a zero
+            isPositive = block >=  numpy.finfo(numpy.float64).tiny
+            isNegative = block <= -numpy.finfo(numpy.float64).tiny
+            
+            keys, counts = self._make_buckets(block[isPositive])
+            self._positive_keys, self._positive_counts = QuantileSketch._merge_buckets(self._positive_keys, self._positive_counts, keys, counts)
+            keys, counts = self._make_buckets(-block[isNegative])
+            self._negative_keys, self._negative_counts = QuantileSketch._merge_buckets(self._negative_keys, self._negative_counts, keys, counts)
+            
+            self.zero_count += block.size - numpy.sum(isPositive) - numpy.sum(isNegative)
+        
+        self._combine_range(values.size, numpy.min(values), numpy.max(values))
+    
+    def merge (self, other) :
+        """
+        merge the values from another QuantileSketch into this one
+        """
+        
+        assert(self.gamma == other.gamma)
+        
+        if other.count <= 0 :
+            return
+        
+        self._positive_keys, self._positive_counts = QuantileSketch._merge_buckets(self._positive_keys, self._positive_counts,
+                                                                                   other._positive_keys, other._positive_counts)
+        self._negative_keys, self._negative_counts = QuantileSketch._merge_buckets(self._negative_keys, self._negative_counts,
+                                                                                   other._negative_keys, other._negative_counts)
+        self.zero_count += other.zero_count
+        self._combine_range(other.count, other.min, other.max)
+    
+    def absolute_value (self) :
+        """
+        get a new sketch of the absolute values of the values in this sketch
+        
+        the bucket keys depend only on magnitude, so this doesn't need the original data
+        """
+        
+        toReturn = QuantileSketch(self.relative_accuracy)
+        
+        if self.count <= 0 :
+            return toReturn
+        
+        toReturn._positive_keys, toReturn._positive_counts = QuantileSketch._merge_buckets(self._positive_keys, self._positive_counts,
+                                                                                           self._negative_keys, self._negative_counts)
+        toReturn.zero_count = self.zero_count
+        toReturn.count      = self.count
+        toReturn.max        = max(abs(self.min), abs(self.max))
+        # if there are values on both sides of zero, we only know the smallest magnitude is at least zero
+        toReturn.min        = self.min if self.min >= 0 else (-self.max if self.max <= 0 else 0.0)
+        
+        return toReturn
+    
+    def quantile (self, fraction) :
+        """
+        estimate the value at the given quantile (0.0 to 1.0) of the data,
+        or nan if there isn't any data
+        """
+        
+        return self.quantiles([fraction])[0]
+    
+    def median (self) :
+        """
+        estimate the median of the data, or nan if there isn't any data
+        """
+        
+        return self.quantile(0.5)
+    
+    def quantiles (self, fractions) :
+        """
+        estimate the values at a list of quantiles (0.0 to 1.0) of the data,
+        the estimates will be nan if there isn't any data
+        """
+        
+        fractions = numpy.asarray(fractions, dtype=numpy.float64)
+        
+        if self.count <= 0 :
+            return numpy.zeros(fractions.shape, dtype=numpy.float64) + numpy.nan
+        
+        # line up all the buckets from the most negative values to the most positive ones
+        # note: the zero bucket is given a representative value of 0.0
+        values = numpy.concatenate((-self._bucket_values(self._negative_keys[::-1]),
+                                    numpy.zeros(1, dtype=numpy.float64),
+                                    self._bucket_values(self._positive_keys)))
+        counts = numpy.concatenate((self._negative_counts[::-1],
+                                    numpy.array([self.zero_count], dtype=numpy.int64),
+                                    self._positive_counts))
+        
+        # find the bucket that holds the value of each requested rank
+        ranks     = numpy.clip(fractions, 0.0, 1.0) * (self.count - 1)
+        positions = numpy.searchsorted(numpy.cumsum(counts), ranks, side='right')
+        positions = numpy.minimum(positions, values.size - 1)
+        
+        # the exact extremes are known, so no estimate should fall outside them
+        return numpy.clip(values[positions], self.min, self.max)
+    
+    def _make_buckets (self, magnitudes) :
+        """
+        get the sorted bucket keys and counts for some positive values
+        """
+        
+        if magnitudes.size <= 0 :
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+        
+        # a value x falls in the bucket with key k when gamma^(k-1) < x <= gamma^k
+        keys     = numpy.ceil(numpy.log(magnitudes) / self._log_gamma).astype(numpy.int64)
+        minKey   = numpy.min(keys)
+        counts   = numpy.bincount(keys - minKey)
+        usedKeys = numpy.nonzero(counts)[0]
+        
+        return usedKeys + minKey, counts[usedKeys].astype(numpy.int64)
+    
+    def _bucket_values (self, keys) :
+        """
+        get the representative value of each of the buckets with the given keys
+        
+        the value 2 gamma^k / (gamma + 1) is within relative_accuracy of everything in bucket k
+        """
+        
+        return 2.0 * numpy.exp(keys * self._log_gamma) / (self.gamma + 1.0)
+    
+    @staticmethod
+    def _merge_buckets (keysA, countsA, keysB, countsB) :
+        """
+        merge two sets of sorted bucket keys and their counts
+        """
+        
+        if keysB.size <= 0 :
+            return keysA, countsA
+        if keysA.size <= 0 :
+            return keysB, countsB
+        
+        mergedKeys, inverse = numpy.unique(numpy.concatenate((keysA, keysB)), return_inverse=True)
+        mergedCounts        = numpy.zeros(mergedKeys.size, dtype=numpy.int64)
+        numpy.add.at(mergedCounts, inverse, numpy.concatenate((countsA, countsB)))
+        
+        return mergedKeys, mergedCounts
+    
+    def _combine_range (self, count, minimum, maximum) :
+        """
+        combine the count and range of another set of values with ours
+        """
+        
+        self.count += count
+        self.min    = minimum if (self.min is None) or (minimum < self.min) else self.min
+        self.max    = maximum if (self.max is None) or (maximum > self.max) else self.max
+
 # ------------- bin/tuple related functions --------------------
 
 class BinTupleMapping (object) :
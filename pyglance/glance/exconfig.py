@@ -14,6 +14,9 @@ Copyright (c) 2009 University of Wisconsin SSEC. All rights reserved.
 import glance.constants as constants
 
 # various general settings to control how reports are created
+# (the settings below that also have command line options, such as the cache directory,
+# the number of jobs, or the image process limits, can still be given on the command
+# line; a value given there is used instead of the one in this file)
 settings = {}
 # whether or not images should be generated and shown in the report
 settings[constants.DO_MAKE_IMAGES_KEY] = True
@@ -28,10 +31,55 @@ settings[constants.DO_CLEAR_MEM_THREADED_KEY] = False
 # enough), but will speed up image generation in cases where your data set is
 # relatively small or your machine is very powerful
 settings[constants.DO_MAKE_FORKS_KEY] = False
+# when images are being created in separate processes, these limit the resources used:
+# the most processes that will make images at once (None means one per cpu), how many
+# images a process may make before it is replaced with a fresh one (to keep memory
+# use from creeping upward), and how many MB of memory must be free before another
+# process will be started (None means don't check)
+settings[constants.MAX_FIGURE_WORKERS_KEY] = None
+settings[constants.FIGURES_PER_WORKER_KEY] = 10
+settings[constants.MIN_FREE_MEMORY_KEY] = None
+# while those processes are making images, the data being plotted is kept in memory
+# mapped files so that all the processes share one copy of it; this is the directory
+# where those files will be made (None means use the system temporary directory)
+settings[constants.SHARED_ARRAY_DIR_KEY] = None
+# how many variables should be analyzed (loaded, compared, plotted, and reported on)
+# at once? each variable will be handled by a separate process, so like the option
+# above, a large number here can use a very large amount of memory
+settings[constants.NUM_JOBS_KEY] = 1
+# the zlib compression level (0 to 9) used when writing the png images (None means use
+# the default); lower levels write faster but make larger files, the images look the same
+settings[constants.PNG_COMPRESSION_KEY] = None
+# should each image's thumbnail be encoded in a separate thread while the full sized
+# image is being encoded? (both are made from one drawing of the figure either way)
+settings[constants.THREADED_IMAGE_ENCODE_KEY] = False
 # should the two original data sets for a variable be plotted in the same range?
 # by default each data set will be plotted in it's own range, if you set this
 # value to True, then the maximum of the two ranges will be used to plot both
 settings[constants.USE_SHARED_ORIG_RANGE_KEY] = False
+# a directory where glance can keep intermediate results (such as the mapping between
+# points found during colocation, the analyzed longitude and latitude, the basemaps used
+# to draw maps, or the statistics, images and report page for each variable reportGen
+# compares) so that later runs over the same data can reuse them; if this is None,
+# colocation mappings will be kept in the output directory and nothing else will be saved
+settings[constants.CACHE_DIR_KEY] = None
+# should glance skip calculating the md5 sums of the input files? md5 sums are only
+# calculated when the report is made and, if there is a cache directory, are kept there
+# between runs, but hashing very large files can still take a while; if this is True,
+# the md5 sums will be listed as n/a in the report
+settings[constants.SKIP_CHECKSUMS_KEY] = False
+# if this is set to a relative accuracy (such as 0.01), the medians of the data and
+# differences will be estimated in a single pass (rather than by sorting the data) to within
+# that relative accuracy, and the 1st, 5th, 95th, and 99th percentiles will also be reported;
+# this can make the statistics for very large variables much faster to calculate
+settings[constants.QUANTILE_SKETCH_ACCURACY_KEY] = None
+# should the masks describing the data (valid, missing, non-finite, mismatched, etc.)
+# be kept bit packed? this uses about an eighth of the memory for the masks of large
+# variables, at the cost of unpacking each mask when it is needed
+settings[constants.COMPACT_MASKS_KEY] = False
+# should the attributes of all the variables in each file be loaded at once, rather
+# than as each variable is looked at? this is faster for files with many variables
+settings[constants.PREFETCH_ATTRIBUTES_KEY] = False
 
 # the names of the latitude and longitude variables that will be used
 lat_lon_info = {}
@@ -71,6 +119,11 @@ lat_lon_info[constants.LONLAT_ALT_FILE_B_KEY] = '/path/to/alternate/file/for/lon
 # the various comparison plots may contain misleading data
 lat_lon_info[constants.LON_LAT_EPSILON_KEY] = 0.0001
 
+# when colocating data, points can optionally be matched by the great circle distance between them
+# instead of by the lon_lat_epsilon; if this value (in km) is set, points in A and B that are within
+# this distance of each other will be matched and the lon_lat_epsilon will not be used for matching
+#lat_lon_info[constants.LON_LAT_GREAT_CIRCLE_RADIUS_KEY] = 1.5
+
 # per variable defaults
 # these default variables will only apply if you don't define them in a given variable
 # description in the setOfVariables
@@ -103,6 +156,15 @@ defaultValues = {constants.EPSILON_KEY: 0.0,            # the acceptable differe
                                                         # perVariable version of DO_MAKE_IMAGES_KEY to false
                                                         # (then plots will never be created for that variable)
                  
+                 # mapped plots are drawn by contouring the data, unless there are more points than the
+                 # raster pixel threshold (1e6 by default), then the data is binned into a raster with
+                 # the raster resolution (1000 by default) cells across the longer side of the map;
+                 # these can also be set for individual variables, the render mode can be set to
+                 # constants.MAP_RENDER_CONTOUR or constants.MAP_RENDER_RASTER to always draw that way
+    #            constants.MAP_RENDER_MODE_KEY:        None,
+    #            constants.RASTER_PIXEL_THRESHOLD_KEY: 1e6,
+    #            constants.RASTER_RESOLUTION_KEY:      1000,
+                 
                  # the following two functions can be defined in order to filter the variable data,
                  # for example, these could be used to compensate
                  # for differening data types (like ints/floats or float32/float64)
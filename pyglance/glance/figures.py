@@ -22,6 +22,7 @@ import glance.graphics as maps
 import glance.delta    as delta
 import glance.report   as report
 import glance.stats    as statistics
+from glance.constants import MAP_RENDER_CONTOUR, MAP_RENDER_RASTER
 
 LOG = logging.getLogger(__name__)
 
@@ -30,8 +31,16 @@ LOG = logging.getLogger(__name__)
 offsetToRange = 0.0000000000000000001
 
 # how much data are we willing to put into the matplotlib functions?
-MAX_SCATTER_PLOT_DATA = 1e6 # FUTURE: this limit was determined experimentally on Eva's laptop, may need to revisit this
-MAX_HEX_PLOT_DATA     = 1e7 # FUTURE: this limit was determined experimentally on Eva's laptop, may need to revisit this
+# scatter plots of more points than this will show a sample of the points (see BinnedScatterData)
+MAX_SCATTER_PLOT_POINTS = 1e6 # FUTURE: this limit was determined experimentally on Eva's laptop, may need to revisit this
+# the number of bins along each axis of the histogram shared by the density scatter and hexbin plots
+NUM_SCATTER_HISTOGRAM_BINS = 400
+# the seed used to pick the sample of points for scatter plots, so the same data always gives the same plot
+SCATTER_SAMPLE_SEED = 0
+
+# mapped figures with more data points than this will be drawn as rasters rather than contoured
+# (unless the caller asks for a specific render mode)
+DEFAULT_RASTER_PIXEL_THRESHOLD = 1e6
 
 # make a custom medium grayscale color map for putting our bad data on top of
 mediumGrayColorMapData = {
@@ -219,31 +228,190 @@ def _plot_tag_data_mapped(bMap, tagData, x, y, addExplinationLabel=True) :
     
     return numMismatchPoints
 
+def _find_bin_quota (binCounts, maxPoints) :
+    """
+    find the number of points to keep from each bin so that about maxPoints are kept in all,
+    bins with fewer points than the quota keep all of their points
+    """
+    
+    sortedCounts = np.sort(binCounts[binCounts > 0]).astype(np.float64)
+    if sortedCounts.size <= 0 :
+        return 0.0
+    
+    # if the quota were the count of one of the bins, how many points would be kept?
+    numBinsAtOrAbove = np.arange(sortedCounts.size, 0, -1)
+    keptBelow        = np.concatenate(([0.0], np.cumsum(sortedCounts)[:-1]))
+    totalKept        = keptBelow + (sortedCounts * numBinsAtOrAbove)
+    
+    index = np.searchsorted(totalKept, maxPoints)
+    if index >= sortedCounts.size :
+        return sortedCounts[-1]
+    
+    return (maxPoints - keptBelow[index]) / numBinsAtOrAbove[index]
+
+def _get_flat_bins (dataX, xMin, xBinWidth, dataY, yMin, yBinWidth, numBins) :
+    """
+    figure out which bin of a numBins by numBins histogram each x/y point falls in,
+    returned as the index into the flattened histogram (the max value goes in the last
+    bin, like histogram2d, and an axis with a bin width of 0 has all its points in the first bin)
+    """
+    
+    xBins = np.clip(((dataX - xMin) / xBinWidth).astype(np.intp), 0, numBins - 1) if xBinWidth > 0 else np.zeros(dataX.shape, dtype=np.intp)
+    yBins = np.clip(((dataY - yMin) / yBinWidth).astype(np.intp), 0, numBins - 1) if yBinWidth > 0 else np.zeros(dataY.shape, dtype=np.intp)
+    
+    return (xBins * numBins) + yBins
+
+class BinnedScatterData (object) :
+    """
+    2D histograms of x vs y data and a sample of the x/y points, made in one pass over the data,
+    so that the scatter, density scatter, and hexbin plots of the same data can share them and the
+    cost of drawing those plots doesn't depend on how much data there is.
+    
+    There are two histograms with numBins bins along each axis: counts covers the range of both
+    the x and y data on both axes (for the density scatter plot) and axisCounts covers the x range
+    along the x axis and the y range along the y axis (for the hexbin plot).
+    If there are more than maxSamplePoints points not selected by the bad mask, those points are
+    thinned out within each axisCounts bin (so crowded areas are thinned and sparse ones are kept);
+    the points selected by the bad mask are always kept. If maxSamplePoints is None, all of the
+    points are kept.
+    """
+    
+    def __init__ (self, dataX, dataY, badMask=None,
+                  numBins=NUM_SCATTER_HISTOGRAM_BINS, maxSamplePoints=MAX_SCATTER_PLOT_POINTS) :
+        """
+        bin and sample the data
+        """
+        
+        dataX = np.asarray(dataX).ravel()
+        dataY = np.asarray(dataY).ravel()
+        if badMask is not None :
+            badMask = np.asarray(badMask, dtype=bool).ravel()
+        
+        self.numPoints     = dataX.size
+        self.numBins       = numBins
+        self.counts        = np.zeros((numBins, numBins), dtype=np.int64)
+        self.axisCounts    = np.zeros((numBins, numBins), dtype=np.int64)
+        self.minValue      = None
+        self.maxValue      = None
+        self.xRange        = None
+        self.yRange        = None
+        self.sampleX       = dataX
+        self.sampleY       = dataY
+        self.sampleBadMask = badMask
+        
+        if self.numPoints <= 0 :
+            return
+        
+        self.xRange   = (dataX.min(), dataX.max())
+        self.yRange   = (dataY.min(), dataY.max())
+        self.minValue = min(self.xRange[0], self.yRange[0])
+        self.maxValue = max(self.xRange[1], self.yRange[1])
+        
+        # bin the points over the shared range
+        sharedWidth = self.get_bin_width()
+        flatBins    = _get_flat_bins(dataX, self.minValue, sharedWidth, dataY, self.minValue, sharedWidth, numBins)
+        self.counts = np.bincount(flatBins, minlength=numBins * numBins).reshape((numBins, numBins))
+        
+        # and over the range of each axis
+        xWidth, yWidth  = self.get_axis_bin_widths()
+        flatBins        = _get_flat_bins(dataX, self.xRange[0], xWidth, dataY, self.yRange[0], yWidth, numBins)
+        self.axisCounts = np.bincount(flatBins, minlength=numBins * numBins).reshape((numBins, numBins))
+        
+        # if there are too many points, keep a sample of them
+        numGood = self.numPoints - (badMask.sum() if badMask is not None else 0)
+        if (maxSamplePoints is not None) and (numGood > maxSamplePoints) :
+            goodBins   = flatBins[~badMask] if badMask is not None else flatBins
+            goodCounts = np.bincount(goodBins, minlength=numBins * numBins)
+            quota      = _find_bin_quota(goodCounts, maxSamplePoints)
+            keepChance = np.minimum(1.0, quota / np.maximum(goodCounts, 1))
+            toKeep     = np.random.RandomState(SCATTER_SAMPLE_SEED).random_sample(self.numPoints) < keepChance[flatBins]
+            if badMask is not None :
+                toKeep |= badMask
+                self.sampleBadMask = badMask[toKeep]
+            self.sampleX = dataX[toKeep]
+            self.sampleY = dataY[toKeep]
+            LOG.debug("Sampled " + str(self.sampleX.size) + " of " + str(self.numPoints) + " points for scatter plotting.")
+    
+    def is_sampled (self) :
+        """
+        are only some of the points in the sample?
+        """
+        
+        return self.sampleX.size < self.numPoints
+    
+    def get_bin_width (self) :
+        """
+        get the width of the bins in the shared range histogram (counts)
+        """
+        
+        if (self.minValue is None) or (self.maxValue <= self.minValue) :
+            return 0.0
+        
+        return float(self.maxValue - self.minValue) / self.numBins
+    
+    def get_axis_bin_widths (self) :
+        """
+        get the (x, y) widths of the bins in the per axis histogram (axisCounts)
+        """
+        
+        if self.xRange is None :
+            return 0.0, 0.0
+        
+        return (float(self.xRange[1] - self.xRange[0]) / self.numBins,
+                float(self.yRange[1] - self.yRange[0]) / self.numBins)
+    
+    def get_axis_bin_centers (self) :
+        """
+        get the x centers, y centers, and counts of all the bins in the per axis histogram
+        (axisCounts), including the empty ones
+        """
+        
+        xWidth, yWidth = self.get_axis_bin_widths()
+        xIndex, yIndex = np.indices(self.axisCounts.shape).reshape((2, -1))
+        
+        return (self.xRange[0] + ((xIndex + 0.5) * xWidth),
+                self.yRange[0] + ((yIndex + 0.5) * yWidth),
+                self.axisCounts[xIndex, yIndex])
+    
+    def get_counts (self, numBins=None) :
+        """
+        get the shared range histogram counts (x along the first axis, y along the second), if
+        numBins is given and evenly divides the number of bins we have the bins will be combined
+        to that many
+        """
+        
+        if (numBins is None) or (numBins == self.numBins) or (self.numBins % numBins != 0) :
+            return self.counts
+        
+        factor = self.numBins / numBins
+        return self.counts.reshape((numBins, factor, numBins, factor)).sum(axis=3).sum(axis=1)
+
 # build a scatter plot of the x,y points
-def create_scatter_plot(dataX, dataY, title, xLabel, yLabel, badMask=None, epsilon=None, units_x=None, units_y=None) :
+def create_scatter_plot(dataX, dataY, title, xLabel, yLabel, badMask=None, epsilon=None, units_x=None, units_y=None,
+                        binnedData=None) :
     """
     build a scatter plot of the data
     if a bad mask is given the points selected by that mask will be plotted in a different color
     if an epsilon is given the lines for +/- epsilon will be drawn on the plot
+    if binnedData (a BinnedScatterData made from the same data and bad mask) is given its sample will be
+    plotted, otherwise one will be made; for large data sets only a sample of the points will be shown
     
     by default this plot uses blue for data points and red for data marked by the bad mask
     """
-
-    to_return = None
-
-    # make a regular scatter plot if we don't have too much data
-    if dataX.size < MAX_SCATTER_PLOT_DATA :
-        to_return = create_complex_scatter_plot ([(dataX, dataY, badMask,
-                                                 'b', 'r',
-                                                 'within\nepsilon', 'outside\nepsilon')],
-                                                 title,
-                                                 xLabel, yLabel,
-                                                 epsilon=epsilon,
-                                                 units_x=units_x, units_y=units_y)
-    else :
-        LOG.warn("Too much data present to allow creation of scatter plot for \"" + title + "\". Plot will not be created.")
-
-    return to_return
+    
+    if binnedData is None :
+        binnedData = BinnedScatterData(dataX, dataY, badMask)
+    if binnedData.is_sampled() :
+        LOG.info("Showing " + str(binnedData.sampleX.size) + " of " + str(binnedData.numPoints)
+                 + " points in scatter plot for \"" + title + "\".")
+    
+    return create_complex_scatter_plot ([(binnedData.sampleX, binnedData.sampleY, binnedData.sampleBadMask,
+                                          'b', 'r',
+                                          'within\nepsilon', 'outside\nepsilon')],
+                                        title,
+                                        xLabel, yLabel,
+                                        epsilon=epsilon,
+                                        units_x=units_x, units_y=units_y)
 
 def create_complex_scatter_plot(dataList, title, xLabel, yLabel, epsilon=None, units_x=None, units_y=None) :
     """
@@ -333,9 +501,10 @@ def create_density_scatter_plot(dataX, dataY,
                                 xLabel, yLabel,
                                 epsilon=None,
                                 units_x=None, units_y=None,
-                                num_bins=200) :
+                                num_bins=200, binnedData=None) :
     """
     build a density scatter plot of the X data vs the Y data
+    if binnedData (a BinnedScatterData made from the same data) is given its histogram will be used
     """
 
     if (dataX is None) or (dataX.size <= 1) :
@@ -355,18 +524,12 @@ def create_density_scatter_plot(dataX, dataY,
         LOG.warn ("The X and Y data given to create scatter plot \"" + "\" were different sizes and could not be compared." )
         return figure
 
-    # figure out the range of the data
-    min_value = min(np.min(dataX), np.min(dataY))
-    max_value = max(np.max(dataX), np.max(dataY))
-    # bounds should be defined in the form [[xmin, xmax], [ymin, ymax]]
-    bounds = [[min_value, max_value], [min_value, max_value]]
-
-    # make our data flat if needed
-    dataX = dataX.ravel if len(dataX.shape) > 1 else dataX
-    dataY = dataY.ravel if len(dataY.shape) > 1 else dataY
-
-    # make the binned density map for this data set
-    density_map, _, _ = np.histogram2d(dataX, dataY, bins=num_bins, range=bounds)
+    # make the binned density map for this data set (the range of the data is used for both axes)
+    if binnedData is None :
+        binnedData = BinnedScatterData(dataX, dataY, numBins=num_bins, maxSamplePoints=None)
+    min_value   = binnedData.minValue
+    max_value   = binnedData.maxValue
+    density_map = binnedData.get_counts(num_bins)
     # mask out zero counts; flip because y goes the opposite direction in an imshow graph
     density_map = np.flipud(np.transpose(np.ma.masked_array(density_map, mask=density_map == 0)))
 
@@ -403,17 +566,15 @@ def create_density_scatter_plot(dataX, dataY,
     return figure
 
 # build a hexbin plot of the x,y points and show the density of the point distribution
-def create_hexbin_plot(dataX, dataY, title, xLabel, yLabel, epsilon=None, units_x=None, units_y=None) :
+# if binnedData (a BinnedScatterData made from the same data) is given, the hexagons will
+# be filled from its histogram rather than from the individual points
+def create_hexbin_plot(dataX, dataY, title, xLabel, yLabel, epsilon=None, units_x=None, units_y=None,
+                       binnedData=None) :
 
     if (dataX is None) or (dataX.size <= 1) :
         LOG.debug("Not enough data to make a meaningful hexbin figure.")
         return None
 
-    # if we have too much data, stop now
-    if dataX.size > MAX_HEX_PLOT_DATA :
-        LOG.warn("Too much data present to allow creation of hex plot for \"" + title + "\". Plot will not be created.")
-        return None
-
     # make the figure
     figure = plt.figure()
     axes = figure.add_subplot(111)
@@ -423,9 +584,17 @@ def create_hexbin_plot(dataX, dataY, title, xLabel, yLabel, epsilon=None, units_
          ((dataX.max() == dataX.min()) and (dataY.max() == dataY.min())) ):
         return figure
     
-    # the hexbin plot of the good data 
-    plt.hexbin(dataX, dataY, bins='log', cmap=cm.jet)
-    plt.axis([dataX.min(), dataX.max(), dataY.min(), dataY.max()])
+    # the hexbin plot of the good data, using the centers of the histogram bins weighted by their counts
+    # (the empty bins are included so that hexagons with no data are still drawn with a count of 0)
+    if binnedData is None :
+        binnedData = BinnedScatterData(dataX, dataY, maxSamplePoints=None)
+    xRange, yRange = binnedData.xRange, binnedData.yRange
+    xCenters, yCenters, binCounts = binnedData.get_axis_bin_centers()
+    plt.hexbin(xCenters, yCenters,
+               C=binCounts, reduce_C_function=np.sum,
+               extent=(xRange[0], xRange[1], yRange[0], yRange[1]),
+               bins='log', cmap=cm.jet)
+    plt.axis([xRange[0], xRange[1], yRange[0], yRange[1]])
     #heatmap, xedges, yedges = np.histogram2d(dataX, dataY, bins=100) #todo, testing
     #heatmap = log(heatmap + 1)
     #plt.imshow(heatmap, extent=[xedges[0], xedges[-1], yedges[0], yedges[-1]], cmap=cm.jet)
@@ -566,9 +735,13 @@ def create_histogram(data, bins, title, xLabel, yLabel, displayStats=False, unit
 # the colorMap parameter can be used to control the colors the figure is drawn in
 # if any masks are passed in the tagData list they will be plotted as an overlays
 # set on the existing image
+# the renderMode can be MAP_RENDER_CONTOUR or MAP_RENDER_RASTER, if it's None the data will
+# be drawn as a raster (with rasterResolution cells across the map) when it has more than
+# rasterPixelThreshold points and contoured otherwise
 def create_mapped_figure(data, latitude, longitude, baseMapInstance, boundingAxes, title,
                           invalidMask=None, colorMap=None, tagData=None,
-                          dataRanges=None, dataRangeNames=None, dataRangeColors=None, units=None, **kwargs) :
+                          dataRanges=None, dataRangeNames=None, dataRangeColors=None, units=None,
+                          renderMode=None, rasterPixelThreshold=None, rasterResolution=None, **kwargs) :
 
     # build the plot
     figure = plt.figure()
@@ -578,6 +751,12 @@ def create_mapped_figure(data, latitude, longitude, baseMapInstance, boundingAxe
         LOG.debug("Not enough data to make a meaningful mapped figure.")
         return figure
 
+    # figure out how we're going to draw the data
+    if renderMode is None :
+        rasterPixelThreshold = rasterPixelThreshold if rasterPixelThreshold is not None else DEFAULT_RASTER_PIXEL_THRESHOLD
+        renderMode = MAP_RENDER_RASTER if data.size > rasterPixelThreshold else MAP_RENDER_CONTOUR
+    LOG.debug("Drawing mapped figure with " + str(data.size) + " points using render mode: " + str(renderMode))
+    
     # make a clean version of our lon/lat
     latitudeClean = ma.array(latitude, mask=~invalidMask)
     longitudeClean = ma.array(longitude, mask=~invalidMask)
@@ -603,7 +782,12 @@ def create_mapped_figure(data, latitude, longitude, baseMapInstance, boundingAxe
     
     # draw our data placed on a map
     maps.draw_basic_features(baseMapInstance, boundingAxes)
-    bMap, x, y = maps.show_lon_lat_data(longitudeClean, latitudeClean, baseMapInstance, data=data, **kwargs)
+    if renderMode == MAP_RENDER_RASTER :
+        x, y = maps.get_projected_coordinates(baseMapInstance, longitude, latitude)
+        bMap, x, y = maps.show_x_y_data_raster(x, y, baseMapInstance, data=data, validMask=~invalidMask,
+                                               resolution=rasterResolution, **kwargs)
+    else :
+        bMap, x, y = maps.show_lon_lat_data(longitudeClean, latitudeClean, baseMapInstance, data=data, **kwargs)
     
     # and some informational stuff
     axes.set_title(title)
@@ -665,9 +849,11 @@ def create_quiver_mapped_figure(data, latitude, longitude, baseMapInstance, boun
         LOG.debug("Not enough data to make a meaningful quiver mapped figure.")
         return None
 
-    # make a clean version of our lon/lat/data
-    latitudeClean  =  latitude[~invalidMask]
-    longitudeClean = longitude[~invalidMask]
+    # project the full lon/lat (so the projection can be shared with our other figures)
+    # and make a clean version of our x/y/data
+    x, y           = maps.get_projected_coordinates(baseMapInstance, longitude, latitude)
+    xClean         = x[~invalidMask]
+    yClean         = y[~invalidMask]
     colorData      = None
     if (data is not None) :
         colorData  =      data[~invalidMask]
@@ -686,7 +872,7 @@ def create_quiver_mapped_figure(data, latitude, longitude, baseMapInstance, boun
     
     # draw our data placed on a map
     maps.draw_basic_features(baseMapInstance, boundingAxes)
-    bMap, x, y = maps.show_quiver_plot (longitudeClean, latitudeClean, baseMapInstance, (uDataClean, vDataClean), colordata=colorData)
+    bMap, x, y = maps.show_x_y_quiver_plot (xClean, yClean, baseMapInstance, (uDataClean, vDataClean), colordata=colorData)
     
     # show the title
     axes.set_title(title)
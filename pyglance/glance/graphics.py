@@ -9,12 +9,121 @@ interface to support more modular interactions with the basemap object.
 ~ Eva Schiffer, August 20th, 2009
 """
 
+import os, logging, hashlib, tempfile, weakref
+import cPickle as pickle
+from collections import OrderedDict
+
+import mpl_toolkits.basemap
 from mpl_toolkits.basemap import Basemap, shiftgrid
-from numpy import arange, array, reshape, concatenate, nan
+from numpy import arange, array, reshape, concatenate, nan, floor, ceil, ascontiguousarray, uint8
+from numpy import asarray, isfinite, empty, sqrt, clip
+import numpy.ma as ma
+from matplotlib.colors import BoundaryNorm, ListedColormap
+import matplotlib.cm as cm
+
+LOG = logging.getLogger(__name__)
 
 # the value that will denote "bad" longitudes and latitudes
 badLonLat = 1.0E30
 
+# the bounding axes of basemaps are rounded outward to a multiple of this many degrees,
+# so that data sets with nearly the same navigation can share a basemap
+BASEMAP_AXIS_PRECISION = 0.01
+
+# the most basemaps that will be kept in memory for reuse within one process
+BASEMAP_CACHE_SIZE = 8
+
+# saved basemap files in the basemap cache directory are named like this
+BASEMAP_FILE_PREFIX = 'basemap-'
+BASEMAP_FILE_SUFFIX = '.pickle'
+
+# basemaps we've already made, keyed on (rounded axis, projection, resolution),
+# with the most recently used at the end
+_basemap_cache = OrderedDict()
+
+# where basemaps are saved between runs (None means they aren't saved)
+_basemap_settings = {'cacheDirectory': None}
+
+# the default number of raster cells across the longer side of the map for raster plots
+DEFAULT_RASTER_RESOLUTION = 1000
+
+# the most sets of projected coordinates that will be kept in memory for reuse within one process
+# (each set holds two double arrays the size of the longitude/latitude)
+PROJECTION_CACHE_SIZE = 4
+
+# projected x/y coordinates we've already calculated, keyed on (basemap id, lon fingerprint, lat fingerprint),
+# the values are (weak reference to the basemap, x, y) with the most recently used at the end
+_projection_cache = OrderedDict()
+
+# fingerprints of the longitude/latitude arrays we've seen, keyed on the id of the array,
+# the values are (weak reference to the array, fingerprint)
+_array_fingerprints = { }
+
+def set_basemap_cache_directory (cacheDirectory) :
+    """
+    set the directory where basemaps will be saved so later runs can reuse them
+    (None means basemaps will only be reused within this process)
+    """
+    
+    _basemap_settings['cacheDirectory'] = cacheDirectory
+
+def _round_axis (axis) :
+    """
+    round the [lon min, lon max, lat min, lat max] axis outward to the basemap axis precision
+    (values already on a multiple of the precision are left alone and latitudes stay on the earth)
+    """
+    
+    # the small tolerance keeps floating point error from pushing values out a step
+    roundDown = lambda value : float(round(floor(value / BASEMAP_AXIS_PRECISION + 1.0e-6) * BASEMAP_AXIS_PRECISION, 6))
+    roundUp   = lambda value : float(round(ceil (value / BASEMAP_AXIS_PRECISION - 1.0e-6) * BASEMAP_AXIS_PRECISION, 6))
+    
+    return [roundDown(axis[0]), roundUp(axis[1]),
+            max(roundDown(axis[2]), -90.0), min(roundUp(axis[3]), 90.0)]
+
+def _get_basemap_file_path (cacheDirectory, cacheKey) :
+    """
+    get the path where the basemap for this key would be saved
+    """
+    
+    hasher = hashlib.md5()
+    hasher.update("basemap version " + str(mpl_toolkits.basemap.__version__) + "\n")
+    hasher.update("key " + repr(cacheKey) + "\n")
+    
+    return os.path.join(cacheDirectory, BASEMAP_FILE_PREFIX + hasher.hexdigest() + BASEMAP_FILE_SUFFIX)
+
+def _load_basemap (pathToFile) :
+    """
+    load a saved basemap, returns None if it couldn't be loaded
+    """
+    
+    try :
+        with open(pathToFile, 'rb') as basemapFile :
+            return pickle.load(basemapFile)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError), err :
+        LOG.warn("Unable to load saved basemap (" + pathToFile + "): " + str(err))
+    
+    return None
+
+def _save_basemap (pathToFile, baseMapInstance) :
+    """
+    save a basemap (writing to a temporary file first so that no one ever sees a half written file)
+    """
+    
+    tempPath = None
+    try :
+        if not os.path.isdir(os.path.dirname(pathToFile)) :
+            os.makedirs(os.path.dirname(pathToFile))
+        tempFileDescriptor, tempPath = tempfile.mkstemp(suffix=BASEMAP_FILE_SUFFIX, dir=os.path.dirname(pathToFile))
+        with os.fdopen(tempFileDescriptor, 'wb') as basemapFile :
+            pickle.dump(baseMapInstance, basemapFile, pickle.HIGHEST_PROTOCOL)
+        os.rename(tempPath, pathToFile)
+        tempPath = None
+    except (IOError, OSError, pickle.PicklingError), err :
+        LOG.warn("Unable to save basemap (" + pathToFile + "): " + str(err))
+    finally :
+        if tempPath is not None and os.path.exists(tempPath) :
+            os.remove(tempPath)
+
 def create_basemap (lon, lat=None, axis=None, projection='lcc', resolution='i') :
     """
     Create an instance of basemap using either the specified axis info or the
@@ -24,6 +133,11 @@ def create_basemap (lon, lat=None, axis=None, projection='lcc', resolution='i')
     
     Note: There are known viewing area problems with conic projections that
     may cause "rectangular" data to be clipped.
+    
+    The axis is rounded outward (see BASEMAP_AXIS_PRECISION) and the basemaps are
+    reused for later calls in this process with the same rounded axis, projection,
+    and resolution (and, if there is a basemap cache directory, saved for later
+    runs), so the returned basemap may be shared and should not be modified.
     """
     
     if lat is None:
@@ -45,6 +159,25 @@ def create_basemap (lon, lat=None, axis=None, projection='lcc', resolution='i')
     if  axis[3] is None:
         axis[3] = lat.max()
     
+    # reuse the basemap if we've already made this one
+    axis     = _round_axis(axis)
+    cacheKey = (tuple(axis), projection, resolution)
+    if cacheKey in _basemap_cache :
+        LOG.debug("Reusing basemap for " + str(cacheKey))
+        m = _basemap_cache.pop(cacheKey)
+        _basemap_cache[cacheKey] = m
+        return m, axis
+    
+    # or if we saved it in an earlier run
+    savedPath = None
+    if _basemap_settings['cacheDirectory'] is not None :
+        savedPath = _get_basemap_file_path(_basemap_settings['cacheDirectory'], cacheKey)
+        m = _load_basemap(savedPath) if os.path.exists(savedPath) else None
+        if m is not None :
+            LOG.debug("Loaded saved basemap for " + str(cacheKey) + ": " + savedPath)
+            _remember_basemap(cacheKey, m)
+            return m, axis
+    
     # pull out the longitude/latitude info
     lon_left   = axis[0] 
     lat_bottom = axis[2] 
@@ -65,8 +198,84 @@ def create_basemap (lon, lat=None, axis=None, projection='lcc', resolution='i')
                     resolution=resolution, area_thresh=10000., projection=projection,
                     lat_1=lat_mid,lon_0=lon_mid)
     
+    # keep the basemap for later
+    _remember_basemap(cacheKey, m)
+    if savedPath is not None :
+        _save_basemap(savedPath, m)
+    
     return m, axis
 
+def _remember_basemap (cacheKey, baseMapInstance) :
+    """
+    keep a basemap in memory for reuse, forgetting the least recently used if there are too many
+    """
+    
+    _basemap_cache[cacheKey] = baseMapInstance
+    while len(_basemap_cache) > BASEMAP_CACHE_SIZE :
+        _basemap_cache.popitem(last=False)
+
+def _get_array_fingerprint (anArray) :
+    """
+    get a fingerprint of the contents of an array, so that arrays with the same contents
+    (such as the same navigation loaded for different variables) share projected coordinates
+    
+    the fingerprint of each array object is only calculated once while that array exists
+    """
+    
+    arrayId = id(anArray)
+    if arrayId in _array_fingerprints :
+        arrayRef, fingerprint = _array_fingerprints[arrayId]
+        if arrayRef() is anArray :
+            return fingerprint
+        del _array_fingerprints[arrayId]
+    
+    fingerprint = (str(anArray.dtype), anArray.shape,
+                   hashlib.md5(ascontiguousarray(anArray).view(uint8)).hexdigest())
+    
+    # forget the fingerprint when the array goes away, so a new array with the same id won't match it
+    try :
+        arrayRef = weakref.ref(anArray, lambda ref, arrayId=arrayId : _array_fingerprints.pop(arrayId, None))
+        _array_fingerprints[arrayId] = (arrayRef, fingerprint)
+    except TypeError :
+        pass
+    
+    return fingerprint
+
+def get_projected_coordinates (baseMapInstance, lon, lat) :
+    """
+    translate the longitude and latitude into the coordinate system of the basemap,
+    if either the lon or lat is masked the matching x or y will have the same mask
+    
+    the projected coordinates are kept and reused for later calls in this process with
+    the same basemap and lon/lat contents, so the returned arrays are read only
+    """
+    
+    lonData = ma.getdata(lon)
+    latData = ma.getdata(lat)
+    
+    cacheKey = (id(baseMapInstance), _get_array_fingerprint(lonData), _get_array_fingerprint(latData))
+    cached   = _projection_cache.pop(cacheKey, None)
+    if (cached is not None) and (cached[0]() is baseMapInstance) :
+        LOG.debug("Reusing projected coordinates for " + str(lonData.shape) + " points.")
+        _, x, y = cached
+    else :
+        x, y = baseMapInstance(lonData, latData)
+        # some projections hand back the lon/lat themselves, so protect views rather than the originals
+        x = x.view()
+        y = y.view()
+        x.flags.writeable = False
+        y.flags.writeable = False
+    _projection_cache[cacheKey] = (weakref.ref(baseMapInstance), x, y)
+    while len(_projection_cache) > PROJECTION_CACHE_SIZE :
+        _projection_cache.popitem(last=False)
+    
+    if ma.isMaskedArray(lon) :
+        x = ma.array(x, mask=ma.getmask(lon))
+    if ma.isMaskedArray(lat) :
+        y = ma.array(y, mask=ma.getmask(lat))
+    
+    return x, y
+
 def draw_basic_features(baseMapInstance, axis) :
     """
     Draw the basic outlines of the earth's features.
@@ -96,7 +305,7 @@ def show_lon_lat_data(lon, lat, baseMapInstance, data=None, levelsToUse=None, **
     Show data corresponding to the longitude and latitude set provided on the earth using the provided basemap.
     levelsToUse is a list of numbers representing data ranges that will be used
     """
-    x, y = baseMapInstance(lon, lat) # translate into the coordinate system of the basemap
+    x, y = get_projected_coordinates(baseMapInstance, lon, lat) # translate into the coordinate system of the basemap
     
     return show_x_y_data(x, y, baseMapInstance, data, levelsToUse, **kwargs)
 
@@ -122,12 +331,83 @@ def show_x_y_data(x, y, baseMapInstance, data=None, levelsToUse=None, **kwargs)
     # return the original x and y so the caller can match any external data in shape
     return baseMapInstance, x, y
 
+def show_x_y_data_raster(x, y, baseMapInstance, data=None, levelsToUse=None, validMask=None,
+                         resolution=None, colors=None, cmap=None, **kwargs) :
+    """
+    Show data corresponding to a given x, y using the provided basemap by binning the data into a
+    raster in the coordinate system of the basemap, rather than contouring it (this is much faster
+    and uses less memory for large data sets, and the data doesn't need to be 2D).
+    
+    resolution is the number of raster cells across the longer side of the map (the cells are made
+    larger if there isn't enough data to fill them), when several points fall in the same cell one
+    of them is shown; levelsToUse is a list of numbers representing data ranges that will be used,
+    data outside those ranges (or not in the validMask) will not be shown
+    """
+    
+    # only try to plot the data if there is some
+    if data is not None:
+        
+        resolution = resolution if resolution is not None else DEFAULT_RASTER_RESOLUTION
+        
+        xFlat    = asarray(ma.getdata(x), dtype=float).ravel()
+        yFlat    = asarray(ma.getdata(y), dtype=float).ravel()
+        dataFlat = asarray(ma.getdata(data)).ravel()
+        
+        # figure out which points can be shown
+        xMin, xMax = baseMapInstance.llcrnrx, baseMapInstance.urcrnrx
+        yMin, yMax = baseMapInstance.llcrnry, baseMapInstance.urcrnry
+        toShow     = isfinite(xFlat) & isfinite(yFlat) & isfinite(dataFlat)
+        toShow    &= (xFlat >= xMin) & (xFlat <= xMax) & (yFlat >= yMin) & (yFlat <= yMax)
+        if validMask is not None :
+            toShow &= asarray(validMask).ravel()
+        if levelsToUse is not None :
+            toShow &= (dataFlat >= levelsToUse[0]) & (dataFlat <= levelsToUse[-1])
+        numPoints = toShow.sum()
+        
+        # pick the size of the cells, but don't make more cells than we have points
+        width    = float(xMax - xMin)
+        height   = float(yMax - yMin)
+        cellSize = max(width, height) / resolution
+        if numPoints > 0 :
+            cellSize = max(cellSize, sqrt(width * height / numPoints))
+        numCols  = max(int(ceil(width  / cellSize)), 1)
+        numRows  = max(int(ceil(height / cellSize)), 1)
+        
+        # put the data in the raster, imshow will stretch the raster over the whole map,
+        # so size each cell to fit its share of the map along each axis
+        cols   = clip(((xFlat[toShow] - xMin) / (width  / numCols)).astype(int), 0, numCols - 1)
+        rows   = clip(((yFlat[toShow] - yMin) / (height / numRows)).astype(int), 0, numRows - 1)
+        raster = empty(numRows * numCols, dtype=float)
+        raster.fill(nan)
+        raster[(rows * numCols) + cols] = dataFlat[toShow]
+        raster = ma.masked_invalid(reshape(raster, (numRows, numCols)))
+        
+        # color the raster the way contourf would have
+        if colors is not None :
+            cmap = ListedColormap(colors)
+        elif cmap is None :
+            cmap = cm.get_cmap()
+        if levelsToUse is not None :
+            kwargs['norm'] = BoundaryNorm(levelsToUse, cmap.N)
+        
+        baseMapInstance.imshow(raster, cmap=cmap, interpolation='nearest', **kwargs)
+    
+    # return the original x and y so the caller can match any external data in shape
+    return baseMapInstance, x, y
+
 def show_quiver_plot (lon, lat, baseMapInstance, (uData, vData)=(None,None), colordata=None, **kwargs) :
     """
     Show a quiver plot of the given vector data at the given longitude and latitude
     """
     
-    x, y = baseMapInstance(lon, lat) # translate into the coordinate system of the basemap
+    x, y = get_projected_coordinates(baseMapInstance, lon, lat) # translate into the coordinate system of the basemap
+    
+    return show_x_y_quiver_plot(x, y, baseMapInstance, (uData, vData), colordata=colordata, **kwargs)
+
+def show_x_y_quiver_plot (x, y, baseMapInstance, (uData, vData)=(None,None), colordata=None, **kwargs) :
+    """
+    Show a quiver plot of the given vector data at the given x, y using the provided basemap
+    """
     
     # show the quiver plot if there is data
     
@@ -9,6 +9,7 @@ Copyright (c) 2009 University of Wisconsin SSEC. All rights reserved.
 
 import os, logging
 import numpy as np
+from collections import OrderedDict, namedtuple
 
 LOG = logging.getLogger(__name__)
 
@@ -86,6 +87,12 @@ SIGNED_TO_UNSIGNED_DTYPES = {
                                 np.dtype(np.int64):   np.dtype(np.uint64),
                             }
 
+# the variable attributes the CaseInsensitiveAttributeCache keeps in its index
+# (these are the fill value, units, and scaling attributes the file types look up
+# for every variable they load or whose names are resolved)
+INDEXED_ATTRIBUTES = (fillValConst1, fillValConst2, UNITS_CONSTANT,
+                      ADD_OFFSET_STR, SCALE_FACTOR_STR, SCALE_METHOD_STR, UNSIGNED_ATTR_STR)
+
 class IOUnimplimentedError(Exception):
     """
     The exception raised when a requested io operation is not yet available.
@@ -106,7 +113,10 @@ class CaseInsensitiveAttributeCache (object) :
     When variable or global attribute sets are not yet loaded and something
     from that part of the file is requested the cache will transparently load
     attributes from the file behind the scenes and build the cache for that
-    part of the file.
+    part of the file. The attributes for all the variables can also be loaded
+    up front in one sweep (see prefetch_variable_attributes).
+    The fill value, units, and scaling attributes (INDEXED_ATTRIBUTES) of each
+    cached variable are also kept in an index so they can be answered directly.
     """
     
     def __init__(self, fileObject) :
@@ -117,6 +127,8 @@ class CaseInsensitiveAttributeCache (object) :
         self.fileToCache             = fileObject
         self.globalAttributesLower   = None
         self.variableAttributesLower = { }
+        self.attributeIndex          = { }
+        self.allVariablesLoaded      = False
     
     def _load_global_attributes_if_needed (self) :
         """
@@ -138,11 +150,29 @@ class CaseInsensitiveAttributeCache (object) :
         tempVariableName = variableName.lower()
         
         # load the variable's attributes from the file if they aren't cached
-        if tempVariableName not in self.variableAttributesLower.keys() :
+        if tempVariableName not in self.variableAttributesLower :
             LOG.debug ("Loading attributes for variable \"" + variableName + "\" into case-insensitive cache.")
             tempAttrs = self.fileToCache.get_variable_attributes(variableName, caseInsensitive=False)
             # now if there are any attributes, make a case insensitive version
             self.variableAttributesLower[tempVariableName] = dict((k.lower(), v) for k, v in tempAttrs.items())
+            
+            # index the attributes we'll be asked for most often
+            tempAttrs = self.variableAttributesLower[tempVariableName]
+            self.attributeIndex[tempVariableName] = dict((attrName, tempAttrs.get(attrName.lower())) for attrName in INDEXED_ATTRIBUTES)
+    
+    def prefetch_variable_attributes (self) :
+        """
+        load (and index) the attributes for all of the file's variables in one sweep,
+        so that later requests for variable attributes won't need to go to the file
+        """
+        
+        if self.allVariablesLoaded :
+            return
+        
+        LOG.debug ("Loading attributes for all variables into case-insensitive cache.")
+        for variableName in self.fileToCache() :
+            self._load_variable_attributes_if_needed(variableName)
+        self.allVariablesLoaded = True
     
     def get_variable_attribute (self, variableName, attributeName) :
         """
@@ -155,6 +185,11 @@ class CaseInsensitiveAttributeCache (object) :
         
         toReturn = None
         tempVariableName  =  variableName.lower()
+        
+        # the attributes we index can be answered directly
+        if attributeName in self.attributeIndex[tempVariableName] :
+            return self.attributeIndex[tempVariableName][attributeName]
+        
         tempAttributeName = attributeName.lower()
         if (tempVariableName in self.variableAttributesLower) and (tempAttributeName in self.variableAttributesLower[tempVariableName]) :
             toReturn = self.variableAttributesLower[tempVariableName][tempAttributeName]
@@ -163,6 +198,17 @@ class CaseInsensitiveAttributeCache (object) :
         
         return toReturn
     
+    def get_indexed_attributes (self, variableName) :
+        """
+        get the index entry for the variable name given, this is a dictionary
+        with each of the INDEXED_ATTRIBUTES names and the variable's value for
+        that attribute (or None if the variable doesn't have it)
+        """
+        
+        self._load_variable_attributes_if_needed(variableName)
+        
+        return self.attributeIndex[variableName.lower()]
+    
     def get_variable_attributes (self, variableName) :
         """
         get the variable attributes for the variable name given
@@ -204,6 +250,92 @@ class CaseInsensitiveAttributeCache (object) :
         # TODO, are there any bad types for these files?
         return True
 
+class LazyVariableArray (object) :
+    """
+    A read only, array-like stand in for a variable in a file.
+    No data is read until the proxy is sliced, and then only the requested
+    hyperslab is read from the file and scaled. Slicing (or numpy.asarray)
+    returns a plain numpy array.
+    
+    This allows large variables to be worked through a chunk at a time
+    (see iter_chunks) without ever holding the whole variable in memory.
+    """
+    
+    def __init__ (self, shape, readFunction, scaleFunction=None, dtype=None) :
+        """
+        readFunction(key) must return the raw data for the hyperslab selected by key
+        and scaleFunction(rawData), if given, must return the scaled version of that data
+        
+        if the dtype isn't given, it will be figured out from the data the first time it is needed
+        """
+        
+        self.shape          = tuple(shape)
+        self._readFunction  = readFunction
+        self._scaleFunction = scaleFunction
+        self._dtype         = None if dtype is None else np.dtype(dtype)
+    
+    @property
+    def ndim (self) :
+        return len(self.shape)
+    
+    @property
+    def size (self) :
+        return int(np.prod(self.shape))
+    
+    @property
+    def dtype (self) :
+        # read the smallest piece of the variable we can to find out the type
+        if self._dtype is None :
+            self._dtype = self[(slice(0, 1),) * self.ndim].dtype if self.size > 0 else self[:].dtype
+        return self._dtype
+    
+    def __len__ (self) :
+        if self.ndim <= 0 :
+            raise TypeError("len() of unsized object")
+        return self.shape[0]
+    
+    def __getitem__ (self, key) :
+        """
+        read and scale the hyperslab selected by key
+        """
+        
+        data = np.asarray(self._readFunction(key))
+        if self._scaleFunction is not None :
+            data = self._scaleFunction(data)
+        
+        return data
+    
+    def __array__ (self, dtype=None) :
+        data = self[:]
+        
+        return data if dtype is None else data.astype(dtype)
+    
+    def iter_chunks (self, rowsPerChunk) :
+        """
+        yield the data a chunk at a time along the first dimension
+        in the form (startRow, endRow, chunkData)
+        """
+        
+        return iter_chunks(self, rowsPerChunk)
+
+def iter_chunks (data, rowsPerChunk) :
+    """
+    yield the data (a numpy array, LazyVariableArray, or anything else that can be
+    sliced like them and has a shape) a chunk at a time along the first dimension
+    in the form (startRow, endRow, chunkData), each chunk is a numpy array
+    """
+    
+    assert(rowsPerChunk > 0)
+    
+    # there's no way to chunk a scalar
+    if len(data.shape) <= 0 :
+        yield 0, 1, np.asarray(data[...])
+        return
+    
+    for startRow in range(0, data.shape[0], rowsPerChunk) :
+        endRow = min(startRow + rowsPerChunk, data.shape[0])
+        yield startRow, endRow, np.asarray(data[startRow:endRow])
+
 class hdf (object):
     """wrapper for HDF4 dataset for comparison
     __call__ yields sequence of variable names
@@ -233,6 +365,15 @@ class hdf (object):
     # for scaling it will be (so the return type may not reflect the
     # type found in the original file)
     def __getitem__(self, name):
+        
+        return self.get_lazy_variable(name)[:]
+    
+    def get_lazy_variable(self, name):
+        """
+        get a LazyVariableArray for this variable, the data will only be read
+        (and scaled) from the file a hyperslab at a time as it is sliced
+        """
+        
         # defaults
         scale_factor = 1.0
         add_offset = 0.0
@@ -240,28 +381,37 @@ class hdf (object):
         scaling_method = None
         
         # get the variable object and use it to
-        # get our raw data and scaling info
+        # get our shape and scaling info
         variable_object = self.get_variable_object(name)
-        raw_data_copy = variable_object[:]
+        shape = variable_object.info()[2]
+        shape = (shape,) if isinstance(shape, int) else tuple(shape)
         try :
             # TODO, this currently won't work with geocat data, work around it for now
             scale_factor, scale_factor_error, add_offset, add_offset_error, data_type = SDS.getcal(variable_object)
         except HDF4Error:
             # load just the scale factor and add offset information by hand
-            temp = self.attributeCache.get_variable_attributes(name)
-            if ADD_OFFSET_STR in temp.keys() :
+            temp = self.attributeCache.get_indexed_attributes(name)
+            if temp[ADD_OFFSET_STR] is not None :
                 add_offset = temp[ADD_OFFSET_STR]
                 data_type = np.dtype(type(add_offset))
-            if SCALE_FACTOR_STR in temp.keys() :
+            if temp[SCALE_FACTOR_STR] is not None :
                 scale_factor = temp[SCALE_FACTOR_STR]
                 data_type = np.dtype(type(scale_factor))
-            if SCALE_METHOD_STR in temp.keys() :
+            if temp[SCALE_METHOD_STR] is not None :
                 scaling_method = temp[SCALE_METHOD_STR]
         SDS.endaccess(variable_object)
         
+        # only hold the variable open while we are reading from it
+        def read_hyperslab (key) :
+            temp_variable_object = self.get_variable_object(name)
+            try :
+                return temp_variable_object[key]
+            finally :
+                SDS.endaccess(temp_variable_object)
+        
         # don't do lots of work if we don't need to scale things
         if (scale_factor == 1.0) and (add_offset == 0.0) :
-            return raw_data_copy
+            return LazyVariableArray(shape, read_hyperslab)
         
         # at the moment geocat has several scaling methods that don't match the normal standards for hdf
         """
@@ -272,7 +422,7 @@ class hdf (object):
             INTEGER(kind=int1) :: SQRT_SCALE            ! 3 
         """
         if (scaling_method == 0) :
-            return raw_data_copy
+            return LazyVariableArray(shape, read_hyperslab)
         if not ((scaling_method is None) or (int(scaling_method) <= 1)) :
             LOG.warn ('Scaling method of \"' + str(scaling_method) + '\" will be ignored in favor of hdf standard method. '
                       + 'This may cause problems with data consistency')
@@ -280,16 +430,25 @@ class hdf (object):
         # if we don't have a data type something strange has gone wrong
         assert(not (data_type is None))
         
-        # get information about where the data is the missing value
         missing_val = self.missing_value(name)
-        missing_mask = np.zeros(raw_data_copy.shape, dtype=np.bool)
-        missing_mask[raw_data_copy == missing_val] = True
         
-        # create the scaled version of the data
-        scaled_data_copy                = np.array(raw_data_copy, dtype=data_type)
-        scaled_data_copy[~missing_mask] = (scaled_data_copy[~missing_mask] * scale_factor) + add_offset #TODO, type truncation issues?
+        def scale_hyperslab (raw_data_copy) :
+            
+            # get information about where the data is the missing value
+            missing_mask = np.zeros(raw_data_copy.shape, dtype=np.bool)
+            missing_mask[raw_data_copy == missing_val] = True
+            
+            # create the scaled version of the data
+            scaled_data_copy                = np.array(raw_data_copy, dtype=data_type)
+            scaled_data_copy[~missing_mask] = (scaled_data_copy[~missing_mask] * scale_factor) + add_offset #TODO, type truncation issues?
+            
+            return scaled_data_copy
         
-        return scaled_data_copy 
+        return LazyVariableArray(shape, read_hyperslab, scaleFunction=scale_hyperslab)
+    
+    def close (self) :
+        self._hdf.end()
+        self._hdf = None
     
     def get_variable_object(self, name):
         return self._hdf.select(name)
@@ -420,67 +579,57 @@ class nc (object):
         
         #print ("*** opening variable: " + name)
         
+        return self.get_lazy_variable(name)[:]
+    
+    def get_lazy_variable(self, name):
+        """
+        get a LazyVariableArray for this variable, the data will only be read
+        (and scaled) from the file a hyperslab at a time as it is sliced
+        """
+        
         # defaults
-        scale_factor = 1.0
-        add_offset = 0.0
         data_type = np.float32 # TODO temporary
         
-        # get the variable object and use it to
-        # get our raw data and scaling info
+        # get the variable object and use it to get our shape
+        # note: the library automatically handles scaling
         variable_object = self.get_variable_object(name)
-
-        """ # This scaling code is no longer required because the library automatically handles scaling
-        raw_data_copy = variable_object[:]
-        # load the scale factor and add offset
-        temp = self.attributeCache.get_variable_attributes(name)
-        if SCALE_FACTOR_STR in temp.keys() :
-            scale_factor = temp[SCALE_FACTOR_STR]
-        if ADD_OFFSET_STR in temp.keys() :
-            add_offset = temp[ADD_OFFSET_STR]
-        
-        # don't do lots of work if we don't need to scale things
-        if (scale_factor == 1.0) and (add_offset == 0.0) :
-            return raw_data_copy
         
-        # get information about where the data is the missing value
-        missing_val = self.missing_value(name)
-        missing_mask = np.zeros(raw_data_copy.shape, dtype=np.bool)
-        missing_mask[raw_data_copy == missing_val] = True
-
-        # create the scaled version of the data
-        scaled_data_copy = np.array(raw_data_copy, dtype=data_type)
-        scaled_data_copy[~missing_mask] = (scaled_data_copy[~missing_mask] * scale_factor) + add_offset #TODO, type truncation issues?
-        """
-
-        # get our data, save the dtype, and make sure it's a more flexible dtype for now
-        scaled_data_copy = np.array(variable_object[:], dtype=data_type)
-
-        temp = self.attributeCache.get_variable_attributes(name)
-        if UNSIGNED_ATTR_STR in temp.keys() and str(temp[UNSIGNED_ATTR_STR]).lower() == ( "true" ) :
-
-            LOG.debug("fixing unsigned values in variable " + name)
-
+        # figure out if we will need to fix unsigned values that the library
+        # read as signed; if we do, get the info we need to do that up front
+        needed_dtype = None
+        temp = self.attributeCache.get_indexed_attributes(name)
+        if str(temp[UNSIGNED_ATTR_STR]).lower() == ( "true" ) :
+            
             # load the scale factor and add offset
             scale_factor = 1.0
             add_offset = 0.0
-            temp = self.attributeCache.get_variable_attributes(name)
-            if SCALE_FACTOR_STR in temp.keys() :
+            if temp[SCALE_FACTOR_STR] is not None :
                 scale_factor = temp[SCALE_FACTOR_STR]
-            if ADD_OFFSET_STR in temp.keys() :
+            if temp[ADD_OFFSET_STR] is not None :
                 add_offset = temp[ADD_OFFSET_STR]
-
+            
             # get the missing value and figure out the dtype of the original data
             missing_val  = self.missing_value(name)
             orig_dtype   = np.array([missing_val,]).dtype
-            needed_dtype = SIGNED_TO_UNSIGNED_DTYPES[orig_dtype] if orig_dtype in SIGNED_TO_UNSIGNED_DTYPES.keys() else None
-
+            needed_dtype = SIGNED_TO_UNSIGNED_DTYPES[orig_dtype] if orig_dtype in SIGNED_TO_UNSIGNED_DTYPES else None
+        
+        def scale_hyperslab (raw_data) :
+            
+            # save the dtype, and make sure it's a more flexible dtype for now
+            scaled_data_copy = np.array(raw_data, dtype=data_type)
+            
             if needed_dtype is not None :
+                LOG.debug("fixing unsigned values in variable " + name)
+                
                 # now figure out where all the corrupted values are, and shift them up to be positive
                 needs_fix_mask = (scaled_data_copy < add_offset) & (scaled_data_copy != missing_val)
                 # we are adding the 2's complement, but first we're scaling it appropriately
                 scaled_data_copy[needs_fix_mask] += ((np.iinfo(np.uint16).max + 1.0) * scale_factor)
-
-        return scaled_data_copy
+            
+            return scaled_data_copy
+        
+        return LazyVariableArray(variable_object.shape, variable_object.__getitem__,
+                                 scaleFunction=scale_hyperslab, dtype=data_type)
     
     # TODO, this hasn't been supported in other file types
     def close (self) :
@@ -495,13 +644,11 @@ class nc (object):
         
         toReturn = None
         
-        temp = self.attributeCache.get_variable_attribute(name, fillValConst1)
-        if temp is not None :
-            toReturn = temp
-        else :
-            temp = self.attributeCache.get_variable_attribute(name, fillValConst2)
-            if temp is not None :
-                toReturn = temp
+        temp = self.attributeCache.get_indexed_attributes(name)
+        if temp[fillValConst1] is not None :
+            toReturn = temp[fillValConst1]
+        elif temp[fillValConst2] is not None :
+            toReturn = temp[fillValConst2]
         
         return toReturn
 
@@ -517,7 +664,7 @@ class nc (object):
         self._nc.nc_redef()
         
         # if the variable already exists, stop with a warning
-        if variablename in self._nc.variables.keys() :
+        if variablename in self._nc.variables :
             LOG.warn("New variable name requested (" + variablename + ") is already present in file. " +
                      "Skipping generation of new variable.")
             return None
@@ -670,10 +817,26 @@ cdf = nc
 # TODO remove
 #FIXME_IDPS = [ '/All_Data/CrIS-SDR_All/ES' + ri + band for ri in ['Real','Imaginary'] for band in ['LW','MW','SW'] ] 
 
+# what we know about each of the datasets in an h5 file (see h5._get_inventory)
+H5DatasetInfo = namedtuple('H5DatasetInfo', ['dataset', 'shape', 'dtype', 'chunks', 'attributes'])
+
+def _read_h5_attributes(attributeSet):
+    """
+    read an h5py attribute set into a dictionary, skipping any attributes h5py can't read
+    """
+    toReturn = { }
+    for attributeName in attributeSet :
+        try :
+            toReturn[attributeName] = attributeSet[attributeName]
+        except (IOError, OSError, TypeError, ValueError) as err :
+            LOG.debug('Unable to read attribute ' + attributeName + ': ' + str(err))
+    return toReturn
+
 class h5(object):
     """wrapper for HDF5 datasets
     """
     _h5 = None
+    _inventory = None
     
     def __init__(self, filename, allowWrite=False):
         self.attributeCache = CaseInsensitiveAttributeCache(self)
@@ -686,24 +849,39 @@ class h5(object):
             assert(h5py is not None)
         self._h5 = h5py.File(filename, mode)
     
-    def __call__(self):
+    def _get_inventory(self):
+        """
+        get the inventory of the datasets in the file, an OrderedDict of H5DatasetInfo
+        keyed on the dataset names; the file is only walked to build this the first
+        time it's needed, after that it's kept with the file
+        """
         
-        variableList = [ ]
-        def testFn (name, obj) :
-            #print ('checking name: ' + name)
-            #print ('object: ' + str(obj))
+        if self._inventory is None :
+            
+            inventory = OrderedDict()
+            def testFn (name, obj) :
+                #print ('checking name: ' + name)
+                #print ('object: ' + str(obj))
+                
+                if isinstance(obj, h5py.Dataset) :
+                    try :
+                        tempType = obj.dtype # this is required to provoke a type error for closed data sets
+                        
+                        #LOG.debug ('type: ' + str(tempType))
+                        inventory[name] = H5DatasetInfo(obj, obj.shape, tempType, obj.chunks,
+                                                        _read_h5_attributes(obj.attrs))
+                    except TypeError :
+                        LOG.debug('TypeError prevents the use of variable ' + name
+                                  + '. This variable will be ignored')
             
-            if isinstance(obj, h5py.Dataset) :
-                try :
-                    tempType = obj.dtype # this is required to provoke a type error for closed data sets
-                    
-                    #LOG.debug ('type: ' + str(tempType))
-                    variableList.append(name)
-                except TypeError :
-                    LOG.debug('TypeError prevents the use of variable ' + name
-                              + '. This variable will be ignored')
-        
-        self._h5.visititems(testFn)
+            self._h5.visititems(testFn)
+            self._inventory = inventory
+        
+        return self._inventory
+    
+    def __call__(self):
+        
+        variableList = list(self._get_inventory().keys())
         
         LOG.debug('variables from visiting h5 file structure: ' + str(variableList))
         
@@ -719,44 +897,76 @@ class h5(object):
     # type found in the original file)
     def __getitem__(self, name):
         
+        return self.get_lazy_variable(name)[:]
+    
+    def get_lazy_variable(self, name):
+        """
+        get a LazyVariableArray for this variable, the data will only be read
+        (and scaled) from the file a hyperslab at a time as it is sliced
+        """
+        
         # defaults
         scale_factor = 1.0
         add_offset = 0.0
         data_type = np.float32 # TODO temporary
         
         # get the variable object and use it to
-        # get our raw data and scaling info
+        # get our shape and scaling info
         variable_object = self.get_variable_object(name)
-        raw_data_copy = variable_object[:]
         
         #print ('*************************')
         #print (dir (variable_object.id)) # TODO, is there a way to get the scale and offset through this?
         #print ('*************************')
         
         # load the scale factor and add offset
-        temp = self.attributeCache.get_variable_attributes(name)
-        if (SCALE_FACTOR_STR in temp.keys()) :
+        temp = self.attributeCache.get_indexed_attributes(name)
+        if temp[SCALE_FACTOR_STR] is not None :
             scale_factor = temp[SCALE_FACTOR_STR]
-        if (ADD_OFFSET_STR in temp.keys()) :
+        if temp[ADD_OFFSET_STR] is not None :
             add_offset = temp[ADD_OFFSET_STR]
         # todo, does cdf have an equivalent of endaccess to close the variable?
         
         # don't do lots of work if we don't need to scale things
         if (scale_factor == 1.0) and (add_offset == 0.0) :
-            return raw_data_copy
+            return LazyVariableArray(variable_object.shape, variable_object.__getitem__, dtype=variable_object.dtype)
         
-        # get information about where the data is the missing value
         missing_val = self.missing_value(name)
-        missing_mask = np.zeros(raw_data_copy.shape, dtype=np.bool)
-        missing_mask[raw_data_copy == missing_val] = True
         
-        # create the scaled version of the data
-        scaled_data_copy = np.array(raw_data_copy, dtype=data_type)
-        scaled_data_copy[~missing_mask] = (scaled_data_copy[~missing_mask] * scale_factor) + add_offset #TODO, type truncation issues?
+        def scale_hyperslab (raw_data_copy) :
+            
+            # get information about where the data is the missing value
+            missing_mask = np.zeros(raw_data_copy.shape, dtype=np.bool)
+            missing_mask[raw_data_copy == missing_val] = True
+            
+            # create the scaled version of the data
+            scaled_data_copy = np.array(raw_data_copy, dtype=data_type)
+            scaled_data_copy[~missing_mask] = (scaled_data_copy[~missing_mask] * scale_factor) + add_offset #TODO, type truncation issues?
+            
+            return scaled_data_copy
         
-        return scaled_data_copy
+        return LazyVariableArray(variable_object.shape, variable_object.__getitem__,
+                                 scaleFunction=scale_hyperslab, dtype=data_type)
+    
+    def close (self) :
+        self._h5.close()
+        self._h5 = None
+        self._inventory = None
+    
+    def _get_dataset_info(self, name):
+        """
+        get the H5DatasetInfo for a dataset if we've taken inventory of the file
+        and it's there, otherwise None
+        """
+        
+        if self._inventory is None :
+            return None
+        
+        return self._inventory.get(name.lstrip('/'), None)
     
     def get_variable_object(self,name):
+        datasetInfo = self._get_dataset_info(name)
+        if datasetInfo is not None :
+            return datasetInfo.dataset
         return h5.trav(self._h5, name)
     
     def missing_value(self, name):
@@ -807,7 +1017,11 @@ class h5(object):
         if caseInsensitive :
             toReturn = self.attributeCache.get_variable_attributes(variableName)
         else :
-            toReturn = self.get_variable_object(variableName).attrs
+            datasetInfo = self._get_dataset_info(variableName)
+            if datasetInfo is not None :
+                toReturn = datasetInfo.attributes
+            else :
+                toReturn = self.get_variable_object(variableName).attrs
         
         return toReturn
     
@@ -871,6 +1085,8 @@ class aeri(object):
     _dmv = None
     _vectors = { }
     _scalars = { }
+    _nrecs = 0
+    _cache = None
     
     @staticmethod
     def _meta_mapping(fp):
@@ -885,6 +1101,14 @@ class aeri(object):
         # get list of vectors and scalars
         self._vectors = dict( (fp.queryVectorDescString(n,fp.SHORTNAME), n) for n in fp.vectorIDs() )
         self._scalars = self._meta_mapping(fp)
+        # get the record count once, the DMV_RECORDS environment variable can override it
+        if 'DMV_RECORDS' in os.environ:
+            self._nrecs = int(os.environ['DMV_RECORDS'])
+            LOG.warning('overriding dmv record count to %d' % self._nrecs)
+        else:
+            self._nrecs = fp.recordCount()
+        # the variables we've already read, by name
+        self._cache = { }
 
     def __init__(self, filename, allowWrite=False):
         assert(allowWrite==False)
@@ -902,25 +1126,55 @@ class aeri(object):
     def __call__(self):
         return list(self._vectors.keys()) + list(self._scalars.keys())
         
+    def _read_vector(self, vid):
+        """
+        read a vector variable for all the records into one preallocated array
+        (the dmv module only gives us one record at a time)
+        """
+        fp = self._dmv
+        if self._nrecs <= 0:
+            return np.array([ ])
+        first = np.asarray(fp.vectorDepValues(1, vid))
+        vdata = np.empty((self._nrecs,) + first.shape, dtype=first.dtype)
+        vdata[0] = first
+        for rec in range(2, self._nrecs+1):
+            vdata[rec-1] = fp.vectorDepValues(rec, vid)
+        return vdata
+    
     def __getitem__(self, name):
+        """
+        get the data for a variable, the data is kept so later requests for the same
+        variable don't read it again (so the array returned is read only)
+        """
         fp = self._dmv
         assert(fp is not None)
-        if 'DMV_RECORDS' in os.environ:
-            nrecs = int(os.environ['DMV_RECORDS'])
-            LOG.warning('overriding dmv record count to %d' % nrecs)
-        else:
-            nrecs = self._dmv.recordCount()
-        recrange = range(1, nrecs+1)
+        if name in self._cache:
+            return self._cache[name]
         if name in self._vectors:
-            vid = self._vectors[name]
-            vdata = [ fp.vectorDepValues(rec, vid) for rec in recrange ]
-            return np.array(vdata)
+            vdata = self._read_vector(self._vectors[name])
         elif name in self._scalars:
-            vdata = fp.metaValueMatrix(recrange, [self._scalars[name]])
-            return np.array(vdata)
+            vdata = np.array(fp.metaValueMatrix(range(1, self._nrecs+1), [self._scalars[name]]))
         else:
             raise LookupError('cannot find variable %s' % name)
+        vdata.flags.writeable = False
+        self._cache[name] = vdata
+        return vdata
+    
+    def close(self):
+        # the dmv module doesn't give us a way to close the file, so just let it go
+        self._dmv = None
+        self._cache = { }
        
+    def get_lazy_variable(self, name):
+        """
+        get a LazyVariableArray for this variable
+        note: this file type can't be read in pieces, so the whole variable is loaded up front
+        """
+        
+        data = self[name]
+        
+        return LazyVariableArray(data.shape, data.__getitem__, dtype=data.dtype)
+    
     def get_variable_object(self,name):
         return None
     
@@ -1080,7 +1334,7 @@ class tiff (object):
         
         to_return = None
         
-        if name in self.revIndex.keys() :
+        if name in self.revIndex :
             to_return = self.revIndex[name]
         else :
             to_return = int(name.split(' ')[-1])
@@ -1107,7 +1361,7 @@ class tiff (object):
         num_bands = self._tiff.RasterCount
         
         to_return = [ ]
-        if self.niceNames and (num_bands in self.EXPECTED_BAND_NAME_KEY.keys()) :
+        if self.niceNames and (num_bands in self.EXPECTED_BAND_NAME_KEY) :
             to_return = self.EXPECTED_BAND_NAME_KEY[num_bands][:]
         else :
             for bandNumber in range(1, num_bands + 1) :
@@ -1134,6 +1388,16 @@ class tiff (object):
         
         return temp_data
     
+    def get_lazy_variable(self, name):
+        """
+        get a LazyVariableArray for this variable
+        note: this file type can't be read in pieces, so the whole variable is loaded up front
+        """
+        
+        data = self[name]
+        
+        return LazyVariableArray(data.shape, data.__getitem__, dtype=data.dtype)
+    
     # TODO, this hasn't been supported in other file types
     def close (self) :
         # Dave couldn't find any explicit way to close it other
@@ -1229,6 +1493,16 @@ def _search_xml(pathname):
     yield pathname.replace('-', '_') + xs
     yield os.path.splitext(pathname)[0].replace('-', '_') + xs
 
+def _get_ctypes_array_layout(arrayType):
+    """
+    get the shape and element type of a (possibly nested) ctypes array type
+    """
+    shape = [ ]
+    while hasattr(arrayType, '_length_'):
+        shape.append(arrayType._length_)
+        arrayType = arrayType._type_
+    return tuple(shape), arrayType
+
 class jpss_adl(object):
     """wrapper for JPSS ADL BLOBs 
     This is a somewhat unique case in that the BLOB loader requires both an XML path and a BLOB path.
@@ -1236,6 +1510,7 @@ class jpss_adl(object):
     FORMAT=jpss_adl glance stats truth/ATMS-FSDR.BE ATMS-FSDR
     """
     _blob = None
+    _byte_order = '='
 
     def __init__(self, filename, allowWrite=False):
         assert(allowWrite==False)
@@ -1252,8 +1527,10 @@ class jpss_adl(object):
             return
         if filename.lower().endswith('.be'):
             endian = adl_blob.BIG_ENDIAN
-        elif filename.lower().endswith('.be'):
+            self._byte_order = '>'
+        elif filename.lower().endswith('.le'):
             endian = adl_blob.LITTLE_ENDIAN
+            self._byte_order = '<'
         else:
             endian = adl_blob.NATIVE_ENDIAN
         LOG.debug('endianness of %s is %s' % (filename, endian))
@@ -1268,8 +1545,36 @@ class jpss_adl(object):
         if not hasattr(field,'_length_'): # FUTURE: is this rigorous? 
             LOG.info('creating numpy array out of singleton value for %s' % name)
             return np.array([field])
-        return np.array(field)
+        try:
+            return self._get_field_view(name, field)
+        except (TypeError, ValueError) as err:
+            LOG.debug('unable to view %s in place (%s), copying it instead' % (name, str(err)))
+            return np.array(field)
+    
+    def _get_field_view(self, name, field):
+        """
+        get a read only numpy array that views this field's data where it is in the
+        mapped blob (rather than copying it), in the byte order of the blob
+        """
+        shape, elementType = _get_ctypes_array_layout(type(field))
+        dtype = np.dtype(elementType)
+        if self._byte_order != '=':
+            dtype = dtype.newbyteorder(self._byte_order)
+        offset = getattr(type(self._blob), name).offset
+        view = np.frombuffer(self._blob, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        view.flags.writeable = False
+        return view
        
+    def get_lazy_variable(self, name):
+        """
+        get a LazyVariableArray for this variable
+        note: the data is a view of the mapped blob, so it's only read as it's sliced
+        """
+        
+        data = self[name]
+        
+        return LazyVariableArray(data.shape, data.__getitem__, dtype=data.dtype)
+    
     def get_variable_object(self,name):
         return None
     
@@ -1371,6 +1676,191 @@ def open(pathname, allowWrite=False):
     cls = globals()[suffix]
     return cls(pathname, allowWrite=allowWrite)
 
+# the most files that aren't being used that a FilePool will keep open
+DEFAULT_MAX_IDLE_FILES = 8
+
+# the file pools in use, the last of these is the active one used by acquire_file and release_file
+_active_file_pools = [ ]
+
+def _close_file_object (fileObject) :
+    """
+    close a file object if it's a type we know how to close
+    (otherwise it will be closed when it's garbage collected)
+    """
+    
+    if hasattr(fileObject, 'close') :
+        fileObject.close()
+
+class FilePool (object) :
+    """
+    A pool of the files opened during one run.
+    
+    Each file is opened once (by path) and the same file object is given to everyone who
+    acquires that path; the file is counted as being used until each of them releases it.
+    Files that are no longer being used are kept open in case they're needed again, but
+    once more than maxIdleFiles of them are waiting, the least recently used are closed.
+    
+    While the pool is active (see activate or use it in a with statement), acquire_file and
+    release_file will go through it. Closing the pool closes all of its files.
+    """
+    
+    def __init__ (self, maxIdleFiles=DEFAULT_MAX_IDLE_FILES) :
+        """
+        create an empty pool
+        """
+        
+        self.max_idle_files = maxIdleFiles
+        
+        # [file object, number of users] keyed on (absolute path, allowWrite), least recently used first
+        self._entries = OrderedDict()
+        # the keys for the file objects we've given out, keyed on the ids of the objects
+        self._keys    = { }
+    
+    def acquire (self, pathname, allowWrite=False) :
+        """
+        get the file object for this path, opening it if it isn't already open
+        """
+        
+        key = (os.path.abspath(os.path.expanduser(pathname)), allowWrite)
+        
+        if key in self._entries :
+            entry = self._entries.pop(key)
+        else :
+            LOG.debug("Opening pooled file: " + key[0])
+            entry = [open(key[0], allowWrite=allowWrite), 0]
+            self._keys[id(entry[0])] = key
+        
+        entry[1] += 1
+        self._entries[key] = entry
+        
+        return entry[0]
+    
+    def release (self, fileObject) :
+        """
+        note that one of the users of this file object is done with it
+        
+        returns False if the file object didn't come from this pool
+        """
+        
+        key = self._keys.get(id(fileObject), None)
+        if (key is None) or (key not in self._entries) :
+            return False
+        
+        entry    = self._entries[key]
+        entry[1] = max(entry[1] - 1, 0)
+        
+        # if too many files are waiting to be used again, close the ones that have waited longest
+        idleKeys = [tempKey for tempKey, tempEntry in self._entries.items() if tempEntry[1] <= 0]
+        for tempKey in idleKeys[:max(len(idleKeys) - self.max_idle_files, 0)] :
+            self._close_entry(tempKey)
+        
+        return True
+    
+    def _close_entry (self, key) :
+        """
+        close one of the pool's files and forget about it
+        """
+        
+        fileObject = self._entries.pop(key)[0]
+        del self._keys[id(fileObject)]
+        LOG.debug("Closing pooled file: " + key[0])
+        _close_file_object(fileObject)
+    
+    def close (self) :
+        """
+        close all the files in the pool, whether or not they're still being used
+        """
+        
+        for key in list(self._entries.keys()) :
+            self._close_entry(key)
+    
+    def activate (self) :
+        """
+        make this the pool used by acquire_file and release_file
+        """
+        
+        _active_file_pools.append(self)
+        
+        return self
+    
+    def deactivate (self) :
+        """
+        stop using this pool for acquire_file and release_file and close its files
+        """
+        
+        if self in _active_file_pools :
+            _active_file_pools.remove(self)
+        self.close()
+    
+    def __enter__ (self) :
+        return self.activate()
+    
+    def __exit__ (self, exc_type, exc_value, traceback) :
+        self.deactivate()
+
+def prefetch_attributes (fileObject) :
+    """
+    load the attributes for all the variables in a file in one sweep
+    (this does nothing for file types that don't cache their attributes)
+    """
+    
+    if hasattr(fileObject, 'attributeCache') :
+        fileObject.attributeCache.prefetch_variable_attributes()
+
+def acquire_file (pathname, allowWrite=False) :
+    """
+    open a file through the active FilePool, if there isn't one this is the same as open
+    """
+    
+    if len(_active_file_pools) > 0 :
+        return _active_file_pools[-1].acquire(pathname, allowWrite=allowWrite)
+    
+    return open(pathname, allowWrite=allowWrite)
+
+def release_file (fileObject) :
+    """
+    let the FilePool a file from acquire_file came from know it's no longer being used
+    (if the file didn't come from any of the active pools, it's simply closed)
+    
+    the file may belong to one of the pools outside the innermost one, if it was acquired
+    before the inner pool was activated, so every active pool is checked before closing it
+    """
+    
+    for filePool in reversed(_active_file_pools) :
+        if filePool.release(fileObject) :
+            return
+    
+    _close_file_object(fileObject)
+
+def close_inherited_file_pools ( ) :
+    """
+    close the files of the active file pools and forget the pools; this is meant for a
+    process forked from one with an active pool, it shouldn't use its parent's files
+    (some libraries, such as HDF5, reuse a file that's already open if it's opened again,
+    so the forked process would share the parent's file handle and read position)
+    
+    closing the files here only closes this process's copies of their handles
+    """
+    
+    for filePool in list(_active_file_pools) :
+        filePool.close()
+    del _active_file_pools[:]
+
+def with_file_pool (function) :
+    """
+    wrap a function so that each call to it uses a new FilePool,
+    any files still open in the pool are closed when the call is done
+    """
+    
+    def wrapper (*args, **kwargs) :
+        with FilePool() :
+            return function(*args, **kwargs)
+    
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__  = function.__doc__
+    
+    return wrapper
+
 if __name__=='__main__':
     import doctest
     doctest.testmod()
@@ -8,7 +8,8 @@ Created by evas Dec 2012.
 Copyright (c) 2012 University of Wisconsin SSEC. All rights reserved.
 """
 
-import logging
+import os, logging, hashlib, tempfile
+from collections import OrderedDict
 #from pycdf import CDFError
 import numpy
 
@@ -21,23 +22,113 @@ from glance.constants   import *
 
 LOG = logging.getLogger(__name__)
 
-def _get_and_analyze_lon_lat (fileObject,
-                              latitudeVariableName, longitudeVariableName,
-                              latitudeDataFilterFn=None, longitudeDataFilterFn=None,
-                              alternateFilePath=None, fileDescriptior="") :
+# the most sets of longitude/latitude that will be kept in memory for reuse within one process
+NAVIGATION_CACHE_SIZE = 4
+
+# saved longitude/latitude files in a cache directory are named like this
+NAVIGATION_FILE_PREFIX = 'navigation-'
+NAVIGATION_FILE_SUFFIX = '.npz'
+
+# change this if the contents of the saved longitude/latitude files change
+NAVIGATION_FORMAT_VERSION = 1
+
+# analyzed longitude/latitude data objects, keyed on the file's md5 sum, the variable
+# names and the filter functions, with the most recently used at the end
+_navigation_cache = OrderedDict()
+
+def clear_navigation_cache ( ) :
+    """
+    forget all the longitude/latitude data kept in memory for reuse
     """
-    get the longitude and latitude data from the given file, assuming they are in the given variable names
-    and analyze them to identify spacially invalid data (ie. data that would fall off the earth)
     
-    This may result in a ValueError if the variable cannot be loaded.
+    _navigation_cache.clear()
+
+def _compact_navigation_data (data) :
+    """
+    return a float32 version of the longitude or latitude data if that
+    holds exactly the same values, otherwise return the data unchanged
     """
     
-    # for the a file, do we have an alternate?
-    fileToUse = fileObject
-    if (alternateFilePath is not None) :
-        LOG.info("Loading alternate file (" + alternateFilePath
-                 + ") for file " + fileDescriptior + " longitude/latitude.")
-        fileToUse = dataobj.FileInfo(alternateFilePath)
+    if data.dtype != numpy.float64 :
+        return data
+    
+    compactData = data.astype(numpy.float32)
+    sameValues  = compactData == data
+    sameValues |= numpy.isnan(data)
+    
+    return compactData if numpy.all(sameValues) else data
+
+def _get_navigation_file_path (cacheDirectory, fileInfo, longitudeVariableName, latitudeVariableName) :
+    """
+    get the path where the longitude/latitude loaded from this file would be saved
+    """
+    
+    hasher = hashlib.md5()
+    hasher.update("version " + str(NAVIGATION_FORMAT_VERSION) + "\n")
+    hasher.update("file md5 " + str(fileInfo.md5_sum) + "\n")
+    hasher.update("longitude " + longitudeVariableName + "\n")
+    hasher.update("latitude "  + latitudeVariableName  + "\n")
+    
+    return os.path.join(cacheDirectory, NAVIGATION_FILE_PREFIX + hasher.hexdigest() + NAVIGATION_FILE_SUFFIX)
+
+def _save_navigation (pathToFile, lonObject, latObject) :
+    """
+    save the analyzed longitude and latitude data objects so later runs can use _load_navigation
+    rather than loading and analyzing the data again
+    
+    the file is written to a temporary name first and then moved into place, so a partially
+    written file will never be loaded
+    """
+    
+    tempFileDescriptor, tempPath = tempfile.mkstemp(suffix=NAVIGATION_FILE_SUFFIX, dir=os.path.dirname(os.path.abspath(pathToFile)))
+    try :
+        with os.fdopen(tempFileDescriptor, 'wb') as tempFile :
+            numpy.savez(tempFile,
+                        format_version=numpy.array(NAVIGATION_FORMAT_VERSION),
+                        longitude=lonObject.data, latitude=latObject.data,
+                        longitude_invalid=lonObject.masks.ignore_mask,
+                        latitude_invalid=latObject.masks.ignore_mask,
+                        longitude_fill=numpy.array(numpy.nan if lonObject.fill_value is None else lonObject.fill_value),
+                        latitude_fill=numpy.array(numpy.nan if latObject.fill_value is None else latObject.fill_value),
+                        has_longitude_fill=numpy.array(lonObject.fill_value is not None),
+                        has_latitude_fill=numpy.array(latObject.fill_value is not None))
+        os.rename(tempPath, pathToFile)
+    except :
+        if os.path.exists(tempPath) :
+            os.remove(tempPath)
+        raise
+
+def _load_navigation (pathToFile) :
+    """
+    load longitude and latitude data objects saved by _save_navigation
+    
+    returns the longitude and latitude objects, or None, None if the file could not be loaded
+    """
+    
+    try :
+        with numpy.load(pathToFile) as navigationFile :
+            if int(navigationFile['format_version']) != NAVIGATION_FORMAT_VERSION :
+                LOG.debug("Ignoring saved longitude/latitude in an old format: " + pathToFile)
+                return None, None
+            lonFill = navigationFile['longitude_fill'].item() if bool(navigationFile['has_longitude_fill']) else None
+            latFill = navigationFile['latitude_fill'].item()  if bool(navigationFile['has_latitude_fill'])  else None
+            lonObject = dataobj.DataObject(navigationFile['longitude'], fillValue=lonFill,
+                                           ignoreMask=navigationFile['longitude_invalid'])
+            latObject = dataobj.DataObject(navigationFile['latitude'],  fillValue=latFill,
+                                           ignoreMask=navigationFile['latitude_invalid'])
+    except (IOError, OSError, KeyError, ValueError), err :
+        LOG.warn("Unable to load saved longitude/latitude (" + pathToFile + "): " + str(err))
+        return None, None
+    
+    return lonObject, latObject
+
+def _load_and_check_lon_lat (fileToUse,
+                             latitudeVariableName, longitudeVariableName,
+                             latitudeDataFilterFn=None, longitudeDataFilterFn=None) :
+    """
+    load the longitude and latitude data and build data objects for them
+    with the data outside the valid longitude/latitude ranges marked as invalid
+    """
     
     # get the longitude
     LOG.info ('longitude name: ' + longitudeVariableName)
@@ -55,6 +146,93 @@ def _get_and_analyze_lon_lat (fileObject,
                                   forceDType=numpy.float,
                                   dataFilter=latitudeDataFilterFn)
     
+    # keep the data in a smaller type if that doesn't change it
+    lonObject.data = _compact_navigation_data(lonObject.data)
+    latObject.data = _compact_navigation_data(latObject.data)
+    
+    return lonObject, latObject
+
+def _find_lon_lat (fileToUse,
+                   latitudeVariableName, longitudeVariableName,
+                   latitudeDataFilterFn=None, longitudeDataFilterFn=None,
+                   fileDescriptior="", cacheDirectory=None) :
+    """
+    get the longitude and latitude data objects for this file, reusing them if we've
+    kept them in memory or in the cache directory (see _get_and_analyze_lon_lat)
+    """
+    
+    # figure out how this longitude/latitude would have been kept if we've seen it before
+    memoryKey = None
+    savedPath = None
+    if fileToUse.md5_sum is not None :
+        memoryKey = (fileToUse.md5_sum, longitudeVariableName, latitudeVariableName,
+                     longitudeDataFilterFn, latitudeDataFilterFn)
+        if (cacheDirectory is not None) and (longitudeDataFilterFn is None) and (latitudeDataFilterFn is None) :
+            savedPath = _get_navigation_file_path(cacheDirectory, fileToUse, longitudeVariableName, latitudeVariableName)
+    
+    lonObject, latObject = None, None
+    if (memoryKey is not None) and (memoryKey in _navigation_cache) :
+        LOG.info("Reusing longitude/latitude already loaded for file " + fileDescriptior)
+        lonObject, latObject = _navigation_cache.pop(memoryKey)
+    elif (savedPath is not None) and os.path.exists(savedPath) :
+        LOG.info("Loading saved longitude/latitude for file " + fileDescriptior + ": " + savedPath)
+        lonObject, latObject = _load_navigation(savedPath)
+    
+    # if we couldn't reuse anything, load the data
+    if lonObject is None :
+        lonObject, latObject = _load_and_check_lon_lat(fileToUse, latitudeVariableName, longitudeVariableName,
+                                                       latitudeDataFilterFn=latitudeDataFilterFn,
+                                                       longitudeDataFilterFn=longitudeDataFilterFn)
+        if savedPath is not None :
+            try :
+                LOG.debug("Saving longitude/latitude: " + savedPath)
+                _save_navigation(savedPath, lonObject, latObject)
+            except (IOError, OSError), err :
+                LOG.warn("Unable to save longitude/latitude (" + savedPath + "): " + str(err))
+    
+    # remember this longitude/latitude for next time
+    if memoryKey is not None :
+        _navigation_cache[memoryKey] = (lonObject, latObject)
+        while len(_navigation_cache) > NAVIGATION_CACHE_SIZE :
+            _navigation_cache.popitem(last=False)
+    
+    return lonObject, latObject
+
+def _get_and_analyze_lon_lat (fileObject,
+                              latitudeVariableName, longitudeVariableName,
+                              latitudeDataFilterFn=None, longitudeDataFilterFn=None,
+                              alternateFilePath=None, fileDescriptior="",
+                              cacheDirectory=None) :
+    """
+    get the longitude and latitude data from the given file, assuming they are in the given variable names
+    and analyze them to identify spacially invalid data (ie. data that would fall off the earth)
+    
+    The analyzed longitude and latitude are kept in memory, so later calls in this process for
+    the same file contents, variable names, and filter functions will reuse them. If a
+    cacheDirectory is given and there are no filter functions, they will also be saved there
+    for later runs. The reused data objects are shared, so they should not be modified.
+    
+    This may result in a ValueError if the variable cannot be loaded.
+    """
+    
+    # for the a file, do we have an alternate?
+    # (it's opened through the active glance.io.FilePool, so it's only opened once per run)
+    fileToUse = fileObject
+    if (alternateFilePath is not None) :
+        LOG.info("Loading alternate file (" + alternateFilePath
+                 + ") for file " + fileDescriptior + " longitude/latitude.")
+        fileToUse = dataobj.FileInfo(alternateFilePath)
+    
+    try :
+        lonObject, latObject = _find_lon_lat(fileToUse, latitudeVariableName, longitudeVariableName,
+                                             latitudeDataFilterFn=latitudeDataFilterFn,
+                                             longitudeDataFilterFn=longitudeDataFilterFn,
+                                             fileDescriptior=fileDescriptior,
+                                             cacheDirectory=cacheDirectory)
+    finally :
+        if (fileToUse is not fileObject) and (fileToUse.file_object is not None) :
+            io.release_file(fileToUse.file_object)
+    
     # we are going to have issues with our comparision if they aren't the same shape
     LOG.debug('latitude  shape: ' + str(latObject.data.shape))
     LOG.debug('longitude shape: ' + str(lonObject.data.shape))
@@ -100,6 +278,9 @@ def handle_lon_lat_info (lon_lat_settings, a_file_object, b_file_object, output_
     b_longitude_name = lon_lat_settings[LON_ALT_NAME_IN_B_KEY] if LON_ALT_NAME_IN_B_KEY in lon_lat_settings else a_longitude_name
     b_latitude_name  = lon_lat_settings[LAT_ALT_NAME_IN_B_KEY] if LAT_ALT_NAME_IN_B_KEY in lon_lat_settings else a_latitude_name
     
+    # analyzed longitude/latitude may be saved in the cache directory for reuse in later runs
+    cacheDirectory = lon_lat_settings[CACHE_DIR_KEY] if CACHE_DIR_KEY in lon_lat_settings else None
+    
     # if we need to load our lon/lat from different files, open those files
     longitude_a_object, latitude_a_object, spatialInfo[A_FILE_TITLE_KEY] = \
                           _get_and_analyze_lon_lat (a_file_object,
@@ -107,14 +288,16 @@ def handle_lon_lat_info (lon_lat_settings, a_file_object, b_file_object, output_
                               latitudeDataFilterFn=lon_lat_settings[LAT_FILTER_FUNCTION_A_KEY],
                               longitudeDataFilterFn=lon_lat_settings[LON_FILTER_FUNCTION_A_KEY],
                                                     alternateFilePath=lon_lat_settings[LONLAT_ALT_FILE_A_KEY] if (LONLAT_ALT_FILE_A_KEY in lon_lat_settings) else None,
-                                                    fileDescriptior="a")
+                                                    fileDescriptior="a",
+                                                    cacheDirectory=cacheDirectory)
     longitude_b_object, latitude_b_object, spatialInfo[B_FILE_TITLE_KEY] = \
                           _get_and_analyze_lon_lat (b_file_object,
                                                     b_latitude_name, b_longitude_name,
                                                     latitudeDataFilterFn=lon_lat_settings[LAT_FILTER_FUNCTION_B_KEY],
                                                     longitudeDataFilterFn=lon_lat_settings[LON_FILTER_FUNCTION_B_KEY],
                                                     alternateFilePath=lon_lat_settings[LONLAT_ALT_FILE_B_KEY] if (LONLAT_ALT_FILE_B_KEY in lon_lat_settings) else None,
-                                                    fileDescriptior="b")
+                                                    fileDescriptior="b",
+                                                    cacheDirectory=cacheDirectory)
     
     # if we need to, test the level of equality of the "valid" values in our lon/lat
     if should_check_equality :
@@ -185,6 +368,9 @@ def handle_lon_lat_info_for_one_file (lon_lat_settings, file_object) :
     lon_name = lon_lat_settings[LONGITUDE_NAME_KEY]
     lat_name = lon_lat_settings[LATITUDE_NAME_KEY ]
     
+    # analyzed longitude/latitude may be saved in the cache directory for reuse in later runs
+    cacheDirectory = lon_lat_settings[CACHE_DIR_KEY] if CACHE_DIR_KEY in lon_lat_settings else None
+    
     # load our lon/lat data
     
     lon_object, lat_object, spatialInfo = \
@@ -192,7 +378,8 @@ def handle_lon_lat_info_for_one_file (lon_lat_settings, file_object) :
                                                   lat_name, lon_name,
                                                   latitudeDataFilterFn=lon_lat_settings[LAT_FILTER_FUNCTION_A_KEY],
                                                   longitudeDataFilterFn=lon_lat_settings[LON_FILTER_FUNCTION_A_KEY],
-                                                  alternateFilePath=lon_lat_settings[LONLAT_ALT_FILE_A_KEY] if (LONLAT_ALT_FILE_A_KEY in lon_lat_settings) else None)
+                                                  alternateFilePath=lon_lat_settings[LONLAT_ALT_FILE_A_KEY] if (LONLAT_ALT_FILE_A_KEY in lon_lat_settings) else None,
+                                                  cacheDirectory=cacheDirectory)
     
     # FUTURE, return the lon/lat objects instead?
     return {
@@ -234,11 +421,16 @@ def load_variable_data(fileObject, variableNameInFile,
                        variableBasedFilter=None,
                        altVariableFileObject=None,
                        fileDescriptionForDisplay="file",
-                       correctForAWIPS=False) :
+                       correctForAWIPS=False,
+                       altVariableFilePath=None) :
     """
     load data for a variable from a file
     optionally filter the variable data based on a data filter or another variable
     
+    the variable to filter on will be loaded from altVariableFileObject if it's given, or
+    from the file at altVariableFilePath (opened through the active glance.io.FilePool) if
+    that's given, otherwise it will come from the same file as the variable
+    
     dataFilter must be in the form of (lambda data: some manipulation returning the new data)
     variableBasedFilter must be in the form of (lambda data, filterData: some manipulation returning the new data))
     """
@@ -252,8 +444,12 @@ def load_variable_data(fileObject, variableNameInFile,
         exceptionToRaise = ValueError("File was not properly opened so variable '" + variableNameInFile + "' could not be loaded.")
     else :
         try :
-            variableData = numpy.array(fileObject[variableNameInFile]) if forceDType is None else numpy.array(fileObject[variableNameInFile], dtype=forceDType)
+            variableData = numpy.asarray(fileObject[variableNameInFile]) if forceDType is None else numpy.asarray(fileObject[variableNameInFile], dtype=forceDType)
             variableData = variableData.astype(numpy.uint8) if correctForAWIPS else variableData
+            # some file types give us read only views of their data (or of data they are caching),
+            # since the filters may change the data in place they need to work on a copy of those
+            if ((dataFilter is not None) or (variableBasedFilter is not None)) and (not variableData.flags.writeable) :
+                variableData = variableData.copy()
         except Exception, ex :
             if type(ex) is ValueError and str(ex) == "could not convert string to float: ":
                 raise ValueErrorStringToFloat(str(ex))
@@ -277,10 +473,18 @@ def load_variable_data(fileObject, variableNameInFile,
                    + " based on additional data from variable " + variableToFilterOn)
         
         fileToUseTemp = fileObject
+        pooledFile    = None
         if altVariableFileObject is not None :
             fileToUseTemp = altVariableFileObject # TODO, is this the right kind of object?
+        elif altVariableFilePath is not None :
+            pooledFile    = io.acquire_file(altVariableFilePath)
+            fileToUseTemp = pooledFile
         
-        dataToFilterOn = fileToUseTemp[variableToFilterOn]
+        try :
+            dataToFilterOn = fileToUseTemp[variableToFilterOn]
+        finally :
+            if pooledFile is not None :
+                io.release_file(pooledFile)
         variableData   = variableBasedFilter(variableData, dataToFilterOn)
     
     return variableData
@@ -293,7 +497,8 @@ def load_data_object (fileObject, variableNameInFile,
                       variableToFilterOn=None,
                       variableBasedFilter=None,
                       altVariableFileObject=None,
-                      fileDescriptionForDisplay="file") :
+                      fileDescriptionForDisplay="file",
+                      altVariableFilePath=None) :
     """
     load the data and put it into an appropriate DataObject
     
@@ -308,7 +513,8 @@ def load_data_object (fileObject, variableNameInFile,
                                  variableToFilterOn=variableToFilterOn,
                                  variableBasedFilter=variableBasedFilter,
                                  altVariableFileObject=altVariableFileObject,
-                                 fileDescriptionForDisplay=fileDescriptionForDisplay)
+                                 fileDescriptionForDisplay=fileDescriptionForDisplay,
+                                 altVariableFilePath=altVariableFilePath)
     
     # get the fill value
     fillValue = fileObject.file_object.missing_value(variableNameInFile)
@@ -98,8 +98,9 @@ def compare_spatial_invalidity(longitude_a_object, longitude_b_object,
     invalid_in_common_mask = invalid_in_a_mask | invalid_in_b_mask
     
     # make a "common" longitude/latitude based on A
-    longitude_common = longitude_a_object.data.copy()
-    latitude_common  =  latitude_a_object.data.copy()
+    # (this is only copied if it needs to be filled in with points from B below)
+    longitude_common = longitude_a_object.data
+    latitude_common  =  latitude_a_object.data
     
     # compare our spacialy invalid info
     spatial_info[PERCENT_INV_PTS_SHARED_KEY] = spatial_info[A_FILE_TITLE_KEY][PERCENT_INVALID_PTS_KEY]
@@ -117,6 +118,8 @@ def compare_spatial_invalidity(longitude_a_object, longitude_b_object,
         # so how many do they have together?
         spatial_info[PERCENT_INV_PTS_SHARED_KEY] = get_percentage_from_mask(invalid_in_common_mask)[0]
         # make a "clean" version of the lon/lat
+        longitude_common = longitude_common.copy()
+        latitude_common  =  latitude_common.copy()
         longitude_common[valid_only_in_mask_a] = longitude_a_object.data[valid_only_in_mask_a]
         longitude_common[valid_only_in_mask_b] = longitude_b_object.data[valid_only_in_mask_b]
         latitude_common [valid_only_in_mask_a] =  latitude_a_object.data[valid_only_in_mask_a]
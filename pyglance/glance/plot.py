@@ -16,10 +16,12 @@ import matplotlib
 from pylab import *
 
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
 from PIL import Image
 
-import os, sys, logging
+import logging, time, select, threading
+import multiprocessing
 import numpy as np
 
 import glance.graphics as maps
@@ -36,82 +38,434 @@ fullSizeDPI = 150 # 200
 # a constant for the thumbnail size dpi
 thumbSizeDPI = 50
 
-def _handle_fig_creation_task(child_figure_function, log_message,
-                              outputPath, fullFigName,
-                              shouldMakeSmall, doFork,
-                              fullDPI=fullSizeDPI, thumbDPI=thumbSizeDPI) :
+# how images are written, see configure_image_output
+_image_output_settings = {'compressionLevel': None, 'threadedEncode': False}
+
+def configure_image_output (compressionLevel=None, threadedEncode=False) :
     """
-    fork to do something.
-    the parent will return the child pid
-    the child will do it's work and then exit
+    set how the images are written: the zlib compression level of the png files (0 to 9, None means
+    use the default) and whether the thumbnail of an image should be encoded in a separate thread
+    while the full sized image is being encoded
     """
     
-    pid = 0
-    if (doFork) :
-        # do the fork
-        pid = os.fork()
+    _image_output_settings['compressionLevel'] = compressionLevel
+    _image_output_settings['threadedEncode']   = threadedEncode
+
+def _save_png (image, pathToFile) :
+    """
+    save a PIL image as a png with the configured compression level
+    """
     
-    # figure out if we're the parent or child
-    isParent = not (pid is 0)
-    if (isParent) :
-        return pid
+    if _image_output_settings['compressionLevel'] is None :
+        image.save(pathToFile, 'PNG')
     else :
-        plt.ioff()
-        figure = child_figure_function() 
-        LOG.info(log_message)
-        if figure is not None :
-            figure.savefig(os.path.join(outputPath, fullFigName), dpi=fullDPI)
-            if (shouldMakeSmall) :
+        image.save(pathToFile, 'PNG', compress_level=int(_image_output_settings['compressionLevel']))
+
+def _render_figure_to_image (figure, dpi) :
+    """
+    draw the figure at the given dpi (with the colors savefig would use) into an in memory
+    Agg buffer and return it as a PIL image
+    """
+    
+    originalCanvas    = figure.canvas
+    originalDPI       = figure.get_dpi()
+    originalFaceColor = figure.get_facecolor()
+    originalEdgeColor = figure.get_edgecolor()
+    try :
+        canvas = originalCanvas if isinstance(originalCanvas, FigureCanvasAgg) else FigureCanvasAgg(figure)
+        figure.set_dpi(dpi)
+        # newer versions of matplotlib use 'auto' to mean keep the figure's own colors
+        if matplotlib.rcParams['savefig.facecolor'] != 'auto' :
+            figure.set_facecolor(matplotlib.rcParams['savefig.facecolor'])
+        if matplotlib.rcParams['savefig.edgecolor'] != 'auto' :
+            figure.set_edgecolor(matplotlib.rcParams['savefig.edgecolor'])
+        imageBuffer, imageSize = canvas.print_to_buffer()
+        image = Image.frombuffer('RGBA', imageSize, imageBuffer, 'raw', 'RGBA', 0, 1)
+    finally :
+        figure.set_dpi(originalDPI)
+        figure.set_facecolor(originalFaceColor)
+        figure.set_edgecolor(originalEdgeColor)
+        figure.set_canvas(originalCanvas)
+    
+    return image
+
+def _save_figure_images (figure, fullPath, thumbPath=None, fullDPI=fullSizeDPI, thumbDPI=thumbSizeDPI) :
+    """
+    draw the figure once at the full dpi and save it to fullPath, if a thumbPath is given a
+    version of the same drawing scaled down to the thumbnail dpi will be saved there as well
+    """
+    
+    image = _render_figure_to_image(figure, fullDPI)
+    
+    thumbThread = None
+    thumbErrors = [ ]
+    if thumbPath is not None :
+        scaleFactor = float(thumbDPI) / float(fullDPI)
+        newSize     = (max(int(image.size[0] * scaleFactor), 1), max(int(image.size[1] * scaleFactor), 1))
+        
+        def _save_thumbnail ( ) :
+            try :
+                _save_png(image.resize(newSize, Image.ANTIALIAS), thumbPath)
+            except Exception, e :
+                thumbErrors.append(e)
+        
+        # the png encoder lets go of the interpreter while it compresses, so the
+        # thumbnail can be encoded at the same time as the full sized image
+        if _image_output_settings['threadedEncode'] :
+            thumbThread = threading.Thread(target=_save_thumbnail)
+            thumbThread.start()
+        else :
+            _save_thumbnail()
+    
+    try :
+        _save_png(image, fullPath)
+    finally :
+        if thumbThread is not None :
+            thumbThread.join()
+    
+    if len(thumbErrors) > 0 :
+        raise thumbErrors[0]
+
+def _render_figure (figureFunction, logMessage, outputPath, fullFigName, shouldMakeSmall,
+                    fullDPI=fullSizeDPI, thumbDPI=thumbSizeDPI) :
+    """
+    create a figure using the figure function and save it (and optionally a
+    thumbnail version of it) to the output path
+    
+    returns True if the figure was saved, False if the figure function made no figure
+    """
+    
+    plt.ioff()
+    figure = figureFunction()
+    LOG.info(logMessage)
+    if figure is None :
+        LOG.warn("Unable to create plot.")
+        return False
+    
+    _save_figure_images(figure, os.path.join(outputPath, fullFigName),
+                        thumbPath=os.path.join(outputPath, 'small.' + fullFigName) if shouldMakeSmall else None,
+                        fullDPI=fullDPI, thumbDPI=thumbDPI)
+    
+    # get rid of the figure
+    plt.close(figure)
+    del(figure)
+    
+    return True
 
-                tempImage = Image.open(os.path.join(outputPath, fullFigName))
-                scaleFactor = float(thumbDPI) / float(fullDPI)
-                originalSize = tempImage.size
-                newSize = (int(originalSize[0] * scaleFactor), int(originalSize[1] * scaleFactor))
-                tempImage = tempImage.resize(newSize, Image.ANTIALIAS)
-                tempImage.save(os.path.join(outputPath, 'small.' + fullFigName))
+def _get_available_memory_mb ( ) :
+    """
+    get the amount of memory (in MB) that is available for new processes to use
+    or None if that can't be determined on this system
+    """
+    
+    try :
+        with open('/proc/meminfo', 'r') as memInfoFile :
+            for line in memInfoFile :
+                if line.startswith('MemAvailable:') :
+                    return float(line.split()[1]) / 1024.0
+    except (IOError, OSError, ValueError, IndexError) :
+        pass
+    
+    return None
 
-            # get rid of the figure
-            plt.close(figure)
-            del(figure)
-        else:
-            LOG.warn("Unable to create plot.")
-    
-    # if we've reached this point and we did fork,
-    # then we're the child process and we should stop now
-    if (doFork) :
-        sys.exit(0) # the child is done now
-    
-    # if we didn't fork, return the 0 pid to indicate that
-    return pid
+class FigureTask (object) :
+    """
+    a single figure to be rendered by a FigureRenderScheduler, along with
+    the results of the attempt to render it
+    
+    after the scheduler runs:
+    
+    succeeded - True if the figure was saved
+    seconds   - how long the figure took to render and save (None if unknown)
+    error     - a description of why the figure failed (None if it didn't)
+    workerPid - the pid of the process that rendered the figure (None if it
+                was rendered in the calling process)
+    """
+    
+    def __init__ (self, description, figureFunction, outputPath, figName, makeSmall) :
+        self.description    = description
+        self.figureFunction = figureFunction
+        self.outputPath     = outputPath
+        self.figName        = figName
+        self.makeSmall      = makeSmall
+        
+        self.succeeded      = False
+        self.seconds        = None
+        self.error          = None
+        self.workerPid      = None
 
-def _log_spawn_and_wait_if_needed (imageDescription, childPids, 
-                                   taskFunction, taskOutputPath, taskFigName,
-                                   doMakeThumb=True, doFork=False, shouldClearMemoryWithThreads=False,
-                                   fullDPI=fullSizeDPI, thumbDPI=thumbSizeDPI) :
+class FigureRenderScheduler (object) :
     """
-    create a figure generation task, spawning a process as needed
-    save the childPid to the list of pids if the process will remain outstanding after this method ends
-    the name of the figure that was generated will be added to the image list
+    renders a list of figure tasks, either directly in this process or using a
+    bounded set of forked worker processes
+    
+    figure functions are closures over the data being plotted, so they can't be
+    sent to a process pool; instead the tasks are all gathered first and then the
+    workers are forked so that they inherit the task list and only the index of
+    each task needs to be sent to them
+    
+    useWorkers -       should worker processes be used at all? if False every figure
+                       will be rendered in the calling process
+    maxWorkers -       the most worker processes to run at once (None means one per cpu)
+    figuresPerWorker - how many figures a worker may render before it is retired and,
+                       if there is more work, replaced with a fresh process; this keeps
+                       matplotlib's memory creep in check (None means no limit)
+    minFreeMemoryMB -  don't start an additional worker unless at least this much
+                       memory is available (a worker is always allowed if none are
+                       running, so that the figures still get made)
+    
+    every task is finished (or its failure recorded) when run returns, even if a
+    worker dies in the middle of a figure:
+    
+    >>> import tempfile, shutil
+    >>> outputDir = tempfile.mkdtemp()
+    >>> scheduler = FigureRenderScheduler(useWorkers=True, maxWorkers=2, figuresPerWorker=2)
+    >>> for index in range(5) :
+    ...     task = scheduler.add_task("figure %d" % index, lambda : plt.figure(), outputDir, "fig%d.png" % index)
+    >>> task = scheduler.add_task("dying figure",  lambda : os._exit(3), outputDir, "dying.png")
+    >>> task = scheduler.add_task("broken figure", lambda : 1 / 0,       outputDir, "broken.png")
+    >>> [task.succeeded for task in scheduler.run()]
+    [True, True, True, True, True, False, False]
+    >>> scheduler.tasks[5].error.startswith("worker process")
+    True
+    >>> scheduler.tasks[6].error.startswith("ZeroDivisionError")
+    True
+    >>> len(os.listdir(outputDir))
+    10
+    >>> shutil.rmtree(outputDir)
     """
-    LOG.info("creating image of "+ imageDescription)
-    
-    # start the actual task
-    pid = _handle_fig_creation_task(taskFunction,
-                                    "saving image of " + imageDescription,
-                                    taskOutputPath, taskFigName,
-                                    doMakeThumb, doFork or shouldClearMemoryWithThreads,
-                                    fullDPI=fullDPI, thumbDPI=thumbDPI)
-    
-    # wait based on the state of the pid we received and why we would have forked
-    childPid = None
-    if not (pid is 0) :
-        if doFork :
-            childPids.append(pid)
-            LOG.debug ("Started child process (pid: " + str(pid) + ") to create image of " + imageDescription)
+    
+    # how long to wait for results before checking on the health of the workers
+    POLL_SECONDS = 1.0
+    
+    def __init__ (self, useWorkers=False, maxWorkers=None, figuresPerWorker=None, minFreeMemoryMB=None,
+                  fullDPI=fullSizeDPI, thumbDPI=thumbSizeDPI) :
+        
+        if maxWorkers is None :
+            try :
+                maxWorkers = multiprocessing.cpu_count()
+            except NotImplementedError :
+                maxWorkers = 1
+        
+        self.useWorkers       = useWorkers
+        self.maxWorkers       = max(1, int(maxWorkers))
+        self.figuresPerWorker = int(figuresPerWorker) if figuresPerWorker else None
+        self.minFreeMemoryMB  = minFreeMemoryMB
+        self.fullDPI          = fullDPI
+        self.thumbDPI         = thumbDPI
+        self.tasks            = [ ]
+    
+    def add_task (self, description, figureFunction, outputPath, figName, makeSmall=True) :
+        """
+        add a figure to the list of figures that will be rendered by run
+        """
+        
+        task = FigureTask(description, figureFunction, outputPath, figName, makeSmall)
+        self.tasks.append(task)
+        
+        return task
+    
+    def run (self) :
+        """
+        render all the figures that have been added and return the list of tasks
+        with their timing and failure information filled in
+        """
+        
+        if len(self.tasks) <= 0 :
+            return self.tasks
+        
+        if self.useWorkers :
+            self._run_with_workers()
         else :
-            os.waitpid(pid, 0)
+            for index in range(len(self.tasks)) :
+                self._record_result(index, *self._render_task(index))
+        
+        return self.tasks
     
-    return
+    def _render_task (self, index) :
+        """
+        render one task, returning (succeeded, seconds, error)
+        """
+        
+        task = self.tasks[index]
+        LOG.info("creating image of " + task.description)
+        startTime = time.time()
+        
+        try :
+            succeeded = _render_figure(task.figureFunction, "saving image of " + task.description,
+                                       task.outputPath, task.figName, task.makeSmall,
+                                       fullDPI=self.fullDPI, thumbDPI=self.thumbDPI)
+            error = None if succeeded else "no figure was created"
+        except Exception, e :
+            succeeded = False
+            error     = e.__class__.__name__ + ": " + str(e)
+        
+        return succeeded, time.time() - startTime, error
+    
+    def _record_result (self, index, succeeded, seconds, error, workerPid=None) :
+        """
+        store and log the result of a single task
+        """
+        
+        task = self.tasks[index]
+        task.succeeded = succeeded
+        task.seconds   = seconds
+        task.error     = error
+        task.workerPid = workerPid
+        
+        timeText = ("%.2f" % seconds) if seconds is not None else "unknown"
+        if succeeded :
+            LOG.debug("image of " + task.description + " took " + timeText + " seconds")
+        else :
+            LOG.warn("Unable to create image of " + task.description + " (after " + timeText + " seconds): " + str(error))
+    
+    def _can_admit_worker (self, numRunning) :
+        """
+        decide if another worker may be started right now
+        """
+        
+        if numRunning >= self.maxWorkers :
+            return False
+        if (numRunning <= 0) or (self.minFreeMemoryMB is None) :
+            return True
+        
+        available = _get_available_memory_mb()
+        if (available is not None) and (available < self.minFreeMemoryMB) :
+            LOG.debug("Not starting another figure worker; only " + str(int(available)) + " MB of memory is available")
+            return False
+        
+        return True
+    
+    def _worker_loop (self, taskReadFD, resultWriteFD) :
+        """
+        the body of a worker process; render the task index sent on each line
+        and report a result line for it, until the parent closes the task pipe
+        """
+        
+        taskFile = os.fdopen(taskReadFD, 'r', 0)
+        while True :
+            line = taskFile.readline()
+            if not line :
+                break
+            index = int(line)
+            succeeded, seconds, error = self._render_task(index)
+            # keep the message short enough that the write is atomic on the shared pipe
+            message = str(error).replace('\t', ' ').replace('\n', ' ')[:1024] if error is not None else ""
+            os.write(resultWriteFD, "%d\t%d\t%d\t%f\t%s\n" % (os.getpid(), index, 1 if succeeded else 0, seconds, message))
+    
+    def _start_worker (self, resultReadFD, resultWriteFD, workers) :
+        """
+        fork a new worker and return its pid
+        """
+        
+        taskReadFD, taskWriteFD = os.pipe()
+        pid = os.fork()
+        
+        if pid == 0 :
+            # we are the worker; let go of everything that belongs to the parent
+            exitCode = 0
+            try :
+                os.close(taskWriteFD)
+                os.close(resultReadFD)
+                for otherWorker in workers.values() :
+                    os.close(otherWorker['taskFD'])
+                self._worker_loop(taskReadFD, resultWriteFD)
+            except BaseException :
+                LOG.exception("Figure worker failed")
+                exitCode = 1
+            finally :
+                logging.shutdown()
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exitCode)
+        
+        os.close(taskReadFD)
+        workers[pid] = {
+                        'taskFD':  taskWriteFD,
+                        'current': None,
+                        'sent':    0,
+                        }
+        LOG.debug("Started figure worker (pid: " + str(pid) + ")")
+        
+        return pid
+    
+    def _run_with_workers (self) :
+        """
+        render the tasks with a bounded set of forked workers
+        """
+        
+        resultReadFD, resultWriteFD = os.pipe()
+        pending  = range(len(self.tasks))
+        pending.reverse() # so we can pop tasks off in order
+        workers  = { }
+        finished = set()
+        buffer   = ""
+        
+        try :
+            # note: pylab's any doesn't understand generators, so count the busy workers instead
+            while (len(pending) > 0) or (len([pid for pid in workers if workers[pid]['current'] is not None]) > 0) :
+                
+                # retire workers that are idle and have done their share of figures,
+                # or that aren't needed because we are out of work
+                for pid, worker in workers.items() :
+                    if (worker['current'] is None) and ((len(pending) <= 0) or
+                                                        ((self.figuresPerWorker is not None) and
+                                                         (worker['sent'] >= self.figuresPerWorker))) :
+                        os.close(worker['taskFD'])
+                        os.waitpid(pid, 0)
+                        del workers[pid]
+                
+                # start new workers if we are allowed to
+                idleCount = len([pid for pid in workers if workers[pid]['current'] is None])
+                while (len(pending) > idleCount) and self._can_admit_worker(len(workers)) :
+                    self._start_worker(resultReadFD, resultWriteFD, workers)
+                    idleCount += 1
+                
+                # give work to everyone who is idle
+                for pid, worker in workers.items() :
+                    if (worker['current'] is None) and (len(pending) > 0) :
+                        index = pending.pop()
+                        worker['current'] = index
+                        worker['sent']   += 1
+                        os.write(worker['taskFD'], str(index) + "\n")
+                
+                # wait for results to come in
+                readable = select.select([resultReadFD], [ ], [ ], self.POLL_SECONDS)[0]
+                if len(readable) > 0 :
+                    buffer += os.read(resultReadFD, 65536)
+                    while "\n" in buffer :
+                        line, buffer = buffer.split("\n", 1)
+                        pidText, indexText, successText, secondsText, message = line.split("\t", 4)
+                        pid, index = int(pidText), int(indexText)
+                        self._record_result(index, successText == "1", float(secondsText),
+                                            message if message != "" else None, workerPid=pid)
+                        finished.add(index)
+                        if pid in workers :
+                            workers[pid]['current'] = None
+                    continue
+                
+                # if nothing came in, make sure none of our workers died in the middle of a figure
+                for pid, worker in workers.items() :
+                    deadPid, status = os.waitpid(pid, os.WNOHANG)
+                    if deadPid == 0 :
+                        continue
+                    index = worker['current']
+                    if (index is not None) and (index not in finished) :
+                        self._record_result(index, False, None, "worker process " + str(pid) +
+                                            " ended unexpectedly (status " + str(status) + ")", workerPid=pid)
+                        finished.add(index)
+                    os.close(worker['taskFD'])
+                    del workers[pid]
+        finally :
+            # make sure we don't leave any workers behind
+            for pid, worker in workers.items() :
+                try :
+                    os.close(worker['taskFD'])
+                    os.waitpid(pid, 0)
+                except OSError :
+                    pass
+            os.close(resultReadFD)
+            os.close(resultWriteFD)
 
 def plot_and_save_spacial_mismatch(longitudeObject, latitudeObject, spacialMismatchMask,
                                   fileNameDiscriminator, title, fileBaseName, outputPath, makeSmall=False,
@@ -134,14 +488,11 @@ def plot_and_save_spacial_mismatch(longitudeObject, latitudeObject, spacialMisma
     spatialMismatchFig = figures.create_mapped_figure(None, latitudeObject.data, longitudeObject.data, baseMapInstance,
                                                       boundingAxes, title, invalidMask=spaciallyInvalidMask,
                                                       tagData=spacialMismatchMask, units=units)
-    # save the figure
+    # save the figure (and we may also save a smaller version of it)
     LOG.info("Saving spatial mismatch image")
-    spatialMismatchFig.savefig(outputPath + "/" + fileBaseName + "." + fileNameDiscriminator + ".png", dpi=fullDPI) 
-    
-    # we may also save a smaller versions of the figure
-    if (makeSmall) :
-        
-        spatialMismatchFig.savefig(outputPath + "/" + fileBaseName + "." + fileNameDiscriminator + ".small.png", dpi=thumbDPI)
+    _save_figure_images(spatialMismatchFig, outputPath + "/" + fileBaseName + "." + fileNameDiscriminator + ".png",
+                        thumbPath=(outputPath + "/" + fileBaseName + "." + fileNameDiscriminator + ".small.png") if makeSmall else None,
+                        fullDPI=fullDPI, thumbDPI=thumbDPI)
     
     # get rid of the figure
     spatialMismatchFig.clf()
@@ -150,6 +501,26 @@ def plot_and_save_spacial_mismatch(longitudeObject, latitudeObject, spacialMisma
     
     return
 
+def _share_lon_lat_data (lonLatDataDict, store) :
+    """
+    return a copy of the lon/lat data dictionary with its arrays moved into the given SharedArrayStore
+    (the dictionary may be nested one level deep, see plot_and_save_comparison_figures)
+    """
+    
+    if lonLatDataDict is None :
+        return None
+    
+    toReturn = { }
+    for key, value in lonLatDataDict.items() :
+        if isinstance(value, dict) :
+            toReturn[key] = _share_lon_lat_data(value, store)
+        elif isinstance(value, np.ndarray) :
+            toReturn[key] = store.share(value)
+        else :
+            toReturn[key] = value
+    
+    return toReturn
+
 def plot_and_save_comparison_figures (aData, bData,
                                      plottingFunctionFactoryObjects,
                                      outputPath,
@@ -165,6 +536,10 @@ def plot_and_save_comparison_figures (aData, bData,
                                      shortCircuitComparisons=False,
                                      doFork=False,
                                      shouldClearMemoryWithThreads=False,
+                                     maxWorkers=None, figuresPerWorker=None,
+                                     minFreeMemoryMB=None,
+                                     sharedArrayDirectory=None,
+                                     compactMasks=False,
                                      shouldUseSharedRangeForOriginal=False,
                                      doPlotSettingsDict={ },
                                      aUData=None, aVData=None,
@@ -229,6 +604,17 @@ def plot_and_save_comparison_figures (aData, bData,
                         image? **
     shouldClearMemoryWithThreads - should the process use fork to control long term
                                    memory bloating? **
+    maxWorkers -        the most processes that may create images at once when doFork is
+                        True (None means one per cpu); only one process will be used if
+                        only shouldClearMemoryWithThreads is True
+    figuresPerWorker -  how many images a process may create before it is replaced with
+                        a fresh one (None means there is no limit)
+    minFreeMemoryMB -   the amount of memory that must be available before an additional
+                        process will be started to create images
+    sharedArrayDirectory - where to put the memory mapped files used to share the data with
+                           the processes creating images (None means the system temporary
+                           directory); these files are only made when processes are used
+    compactMasks -      should the masks for the data be kept bit packed?
     shouldUseSharedRangeForOriginal - should the original images share an all-inclusive
                                       data range?
     doPlotSettingsDict - a dictionary containting settings to turn off individual plots
@@ -261,19 +647,28 @@ def plot_and_save_comparison_figures (aData, bData,
             spaciallyInvalidMaskA = lonLatDataDict[INVALID_MASK_KEY]
     
     # compare the two data sets to get our difference data and mismatch info
-    aDataObject = dataobj.DataObject(aData, fillValue=missingValue, ignoreMask=spaciallyInvalidMaskA)
+    aDataObject = dataobj.DataObject(aData, fillValue=missingValue, ignoreMask=spaciallyInvalidMaskA,
+                                     compactMasks=compactMasks)
     bDataObject = None
     diffInfo    = None
     if useBData :
-        bDataObject = dataobj.DataObject(bData, fillValue=missingValueAltInB, ignoreMask=spaciallyInvalidMaskB)
+        bDataObject = dataobj.DataObject(bData, fillValue=missingValueAltInB, ignoreMask=spaciallyInvalidMaskB,
+                                         compactMasks=compactMasks)
         diffInfo = dataobj.DiffInfoObject(aDataObject, bDataObject, epsilonValue=epsilon, epsilonPercent=epsilonPercent)
     else :
         aDataObject.self_analysis() # if we aren't going to do a diff, make sure basic analysis is done
     
-    # from this point on, we're forking to create child processes to parallelize image and report generation
-    # and to help control memory leak creeping that matplotlib causes
-    isParent = True 
-    childPids = [ ]
+    # if the figures will be made in worker processes, move the large arrays into
+    # memory mapped files first so the workers all share one copy of them
+    useWorkers  = doFork or shouldClearMemoryWithThreads
+    sharedStore = None
+    if useWorkers :
+        sharedStore = dataobj.SharedArrayStore(sharedArrayDirectory)
+        if diffInfo is not None :
+            diffInfo.share_arrays(sharedStore)
+        else :
+            aDataObject.share_arrays(sharedStore)
+        lonLatDataDict = _share_lon_lat_data(lonLatDataDict, sharedStore)
     
     plottingFunctions = { }
     
@@ -320,31 +715,46 @@ def plot_and_save_comparison_figures (aData, bData,
     
     LOG.debug ('plotting function information: ' + str(plottingFunctions))
     
-    # for each function in the list, run it to create the figure
+    # from this point on, the figures may be made in worker processes to parallelize image generation
+    # and to help control memory leak creeping that matplotlib causes
+    scheduler = FigureRenderScheduler(useWorkers=useWorkers,
+                                      maxWorkers=maxWorkers if doFork else 1,
+                                      figuresPerWorker=figuresPerWorker,
+                                      minFreeMemoryMB=minFreeMemoryMB,
+                                      fullDPI=fullDPI, thumbDPI=thumbDPI)
+    outputLists = { }
+    
+    # for each function in the list, queue it up to create the figure
     for figDesc in sorted(list(plottingFunctions.keys())) :
         
-        LOG.info("plotting " + figDesc + " figure for " + variableDisplayName)
         # returnDictionary['descriptive name'] = (function, title, file_name, list_this_figure_should_go_into)
         figFunction, figLongDesc, figFileName, outputInfoList = plottingFunctions[figDesc]
         
         # only plot the compared images if we aren't short circuiting them
         if (outputInfoList is not compared_images) or (not shortCircuitComparisons) :
-            try :
-                _log_spawn_and_wait_if_needed(figLongDesc, childPids, figFunction, outputPath, figFileName,
-                                              makeSmall, doFork, shouldClearMemoryWithThreads, fullDPI=fullDPI, thumbDPI=thumbDPI)
-                # if we made an attempt to make the file, hang onto the name
-                outputInfoList.append(figFileName)
-            except ValueError, ve :
-                LOG.warn("Unable to create " + figDesc + " figure for " + variableDisplayName + ": " + str(ve))
-
+            task = scheduler.add_task(figLongDesc, figFunction, outputPath, figFileName, makeSmall)
+            outputLists[task] = outputInfoList
+    
+    LOG.info("creating " + str(len(scheduler.tasks)) + " images for " + variableDisplayName)
+    startTime = time.time()
+    try :
+        scheduler.run()
+    finally :
+        # the workers are done with the shared copies of the data now
+        if sharedStore is not None :
+            sharedStore.close()
+    
+    # only hang onto the names of the figures that were actually made
+    failedCount = 0
+    for task in scheduler.tasks :
+        if task.succeeded :
+            outputLists[task].append(task.figName)
+        else :
+            failedCount += 1
     
-    # now we need to wait for all of our child processes to terminate before returning
-    if (isParent) : # just in case
-        if len(childPids) > 0 :
-            LOG.info ("waiting for completion of " + variableDisplayName + " images...")
-        for pid in childPids:
-            os.waitpid(pid, 0)
-        LOG.info("... creation and saving of images for " + variableDisplayName + " completed")
+    LOG.info("... creation and saving of images for " + variableDisplayName + " completed in "
+             + ("%.2f" % (time.time() - startTime)) + " seconds"
+             + ((" (" + str(failedCount) + " of " + str(len(scheduler.tasks)) + " images failed)") if failedCount > 0 else ""))
     
     return original_images, compared_images
 
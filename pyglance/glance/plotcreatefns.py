@@ -138,8 +138,27 @@ def _make_axis_and_basemap(lonLatDataDict, goodInAMask, goodInBMask=None, variab
     baseMapInstance, fullAxis = maps.create_basemap(lonToUse, latToUse,
                                                     fullAxis, select_projection(fullAxis))
     
+    # project the navigation now, so that the mapped figures (and any processes forked
+    # to make them) can share the projected coordinates rather than each projecting them
+    LOG.info('\t\tprojecting longitude and latitude')
+    for fileKey in (A_FILE_KEY, B_FILE_KEY, COMMON_KEY) :
+        if (fileKey in lonLatDataDict) and (LON_KEY in lonLatDataDict[fileKey]) and (LAT_KEY in lonLatDataDict[fileKey]) :
+            maps.get_projected_coordinates(baseMapInstance, lonLatDataDict[fileKey][LON_KEY], lonLatDataDict[fileKey][LAT_KEY])
+    
     return fullAxis, baseMapInstance
 
+def _get_map_render_settings (doPlotSettingsDict) :
+    """
+    get the keyword arguments that control how mapped figures are drawn from the variable's settings
+    (anything that isn't set is left for the figure to decide)
+    """
+    
+    return {
+            'renderMode':           doPlotSettingsDict[MAP_RENDER_MODE_KEY]        if MAP_RENDER_MODE_KEY        in doPlotSettingsDict else None,
+            'rasterPixelThreshold': doPlotSettingsDict[RASTER_PIXEL_THRESHOLD_KEY] if RASTER_PIXEL_THRESHOLD_KEY in doPlotSettingsDict else None,
+            'rasterResolution':     doPlotSettingsDict[RASTER_RESOLUTION_KEY]      if RASTER_RESOLUTION_KEY      in doPlotSettingsDict else None,
+           }
+
 # ********************* Section of public classes ***********************
 
 """
@@ -265,54 +284,54 @@ class BasicComparisonPlotsFunctionFactory (PlottingFunctionFactory) :
                                                                                        True, units=units_a, rangeList=histRange)),
                                                     "histogram of the amount of difference in " + variableDisplayName,
                                                     "Hist.png", compared_fig_list)
-        # make the scatter plot
-        if (DO_PLOT_SCATTER_KEY not in doPlotSettingsDict) or (doPlotSettingsDict[DO_PLOT_SCATTER_KEY]) :
+        # bin and sample the data once for the scatter, density scatter, and hex plots
+        doPlotScatter = (DO_PLOT_SCATTER_KEY not in doPlotSettingsDict) or (doPlotSettingsDict[DO_PLOT_SCATTER_KEY])
+        doPlotHex     = (DO_PLOT_HEX_KEY     not in doPlotSettingsDict) or (doPlotSettingsDict[DO_PLOT_HEX_KEY])
+        if doPlotScatter or doPlotHex :
             
             assert(aData.shape    == bData.shape)
             assert(bData.shape    == goodInBothMask.shape)
             assert(goodInBothMask.shape == outsideEpsilonMask.shape)
             
-            # TODO, if there's an epsilon percent, how should the epsilon lines be drawn?
-
             good_a_data = aData[goodInBothMask]
             good_b_data = bData[goodInBothMask]
-
-            if good_a_data.size <= figures.MAX_SCATTER_PLOT_DATA :
-                # make a basic scatter plot
-                functionsToReturn[SCATTER_FUNCTION_KEY]   = ((lambda : figures.create_scatter_plot(good_a_data, good_b_data,
-                                                                                                   "Value in File A vs Value in File B",
-                                                                                                   "File A Value", "File B Value",
-                                                                                                   outsideEpsilonMask[goodInBothMask],
-                                                                                                   epsilon, units_x=units_a, units_y=units_b)),
-                                                             "scatter plot of file a values vs file b values for " + variableDisplayName,
-                                                             "Scatter.png", compared_fig_list)
-            else :
-                LOG.warn("Too much data to allow creation of scatter plot for " + variableDisplayName + ".")
+            binnedData  = figures.BinnedScatterData(good_a_data, good_b_data, outsideEpsilonMask[goodInBothMask])
+        
+        # make the scatter plot
+        if doPlotScatter :
+            
+            # TODO, if there's an epsilon percent, how should the epsilon lines be drawn?
+            
+            # make a basic scatter plot
+            functionsToReturn[SCATTER_FUNCTION_KEY]   = ((lambda : figures.create_scatter_plot(good_a_data, good_b_data,
+                                                                                               "Value in File A vs Value in File B",
+                                                                                               "File A Value", "File B Value",
+                                                                                               outsideEpsilonMask[goodInBothMask],
+                                                                                               epsilon, units_x=units_a, units_y=units_b,
+                                                                                               binnedData=binnedData)),
+                                                         "scatter plot of file a values vs file b values for " + variableDisplayName,
+                                                         "Scatter.png", compared_fig_list)
 
             # make a density scatter plot as well
             functionsToReturn[DENSITY_SCATTER_FN_KEY] = ((lambda : figures.create_density_scatter_plot(good_a_data, good_b_data,
                                                                                                        "Density of Value in File A vs Value in File B",
                                                                                                        "File A Value", "File B Value",
                                                                                                        epsilon=epsilon,
-                                                                                                       units_x=units_a, units_y=units_b)),
+                                                                                                       units_x=units_a, units_y=units_b,
+                                                                                                       binnedData=binnedData)),
                                                          "density scatter plot of file a values vs file b values for " + variableDisplayName,
                                                          "DensityScatter.png", compared_fig_list)
         
         # make a hexplot, which is like a scatter plot with density
-        if (DO_PLOT_HEX_KEY not in doPlotSettingsDict) or (doPlotSettingsDict[DO_PLOT_HEX_KEY]) :
+        if doPlotHex :
             
-            assert(aData.shape == bData.shape)
-            assert(bData.shape == goodInBothMask.shape)
-
-            if np.sum(goodInBothMask) <= figures.MAX_HEX_PLOT_DATA :
-                functionsToReturn[HEX_PLOT_FUNCTION_KEY]  = ((lambda : figures.create_hexbin_plot(aData[goodInBothMask], bData[goodInBothMask],
-                                                                                                  "Value in File A vs Value in File B",
-                                                                                                  "File A Value", "File B Value", epsilon,
-                                                                                                  units_x=units_a, units_y=units_b)),
-                                                             "density of file a values vs file b values for " + variableDisplayName,
-                                                             "Hex.png", compared_fig_list)
-            else :
-                LOG.warn("Too much data to allow creation of hex plot for " + variableDisplayName + ".")
+            functionsToReturn[HEX_PLOT_FUNCTION_KEY]  = ((lambda : figures.create_hexbin_plot(good_a_data, good_b_data,
+                                                                                              "Value in File A vs Value in File B",
+                                                                                              "File A Value", "File B Value", epsilon,
+                                                                                              units_x=units_a, units_y=units_b,
+                                                                                              binnedData=binnedData)),
+                                                         "density of file a values vs file b values for " + variableDisplayName,
+                                                         "Hex.png", compared_fig_list)
         
         return functionsToReturn
 
@@ -388,6 +407,7 @@ class MappedContourPlotFunctionFactory (PlottingFunctionFactory) :
         sharedRange = _make_shared_range(aData, goodInAMask,
                                          bData, goodInBMask,
                                          shouldUseSharedRangeForOriginal)
+        mapRenderSettings = _get_map_render_settings(doPlotSettingsDict)
         
         # make the plotting functions
         
@@ -408,7 +428,7 @@ class MappedContourPlotFunctionFactory (PlottingFunctionFactory) :
                                                                                        dataRanges=dataRanges or sharedRange,
                                                                                        dataRangeNames=dataRangeNames,
                                                                                        dataRangeColors=dataColors,
-                                                                                       units=units_a)),
+                                                                                       units=units_a, **mapRenderSettings)),
                                                       variableDisplayName + " in file a",
                                                       "A.png",  original_fig_list)
             
@@ -426,7 +446,7 @@ class MappedContourPlotFunctionFactory (PlottingFunctionFactory) :
                                                                                        dataRanges=dataRanges or sharedRange,
                                                                                        dataRangeNames=dataRangeNames,
                                                                                        dataRangeColors=dataColors,
-                                                                                       units=units_b)),
+                                                                                       units=units_b, **mapRenderSettings)),
                                                       variableDisplayName + " in file b",
                                                       "B.png",  original_fig_list)
         
@@ -447,7 +467,7 @@ class MappedContourPlotFunctionFactory (PlottingFunctionFactory) :
                                                                                            ("Absolute value of difference in\n"
                                                                                             + variableDisplayName),
                                                                                            invalidMask=(~goodInBothMask),
-                                                                                           units=units_a)),
+                                                                                           units=units_a, **mapRenderSettings)),
                                                           "absolute value of difference in " + variableDisplayName,
                                                           "AbsDiff.png", compared_fig_list)
         # make the subtractive difference plot
@@ -467,7 +487,7 @@ class MappedContourPlotFunctionFactory (PlottingFunctionFactory) :
                                                                                            ("Value of (Data File B - Data File A) for\n"
                                                                                             + variableDisplayName),
                                                                                            invalidMask=(~goodInBothMask),
-                                                                                           units=units_a)),
+                                                                                           units=units_a, **mapRenderSettings)),
                                                           "the difference in " + variableDisplayName,
                                                           "Diff.png",    compared_fig_list)
         # make the mismatch data plot
@@ -495,7 +515,7 @@ class MappedContourPlotFunctionFactory (PlottingFunctionFactory) :
                                                                                            colorMap=figures.MEDIUM_GRAY_COLOR_MAP, tagData=mismatchMask,
                                                                                            dataRanges=dataRanges,
                                                                                            dataRangeNames=dataRangeNames,
-                                                                                           units=units_a)), # TODO, does this need modification?
+                                                                                           units=units_a, **mapRenderSettings)), # TODO, does this need modification?
                                                           "mismatch data in " + variableDisplayName,
                                                           "Mismatch.png", compared_fig_list)
         
@@ -1458,6 +1478,7 @@ class InspectMappedContourPlotFunctionFactory (PlottingFunctionFactory) :
         fullAxis, baseMapInstance = _make_axis_and_basemap({A_FILE_KEY:lonLatDataDict},
                                                            goodInAMask, None, # there is no b mask
                                                            variableDisplayName)
+        mapRenderSettings = _get_map_render_settings(doPlotSettingsDict)
         
         # make the original data plot
         if (DO_PLOT_ORIGINALS_KEY not in doPlotSettingsDict) or (doPlotSettingsDict[DO_PLOT_ORIGINALS_KEY]) :
@@ -1475,7 +1496,7 @@ class InspectMappedContourPlotFunctionFactory (PlottingFunctionFactory) :
                                                                                dataRanges=dataRanges,
                                                                                dataRangeNames=dataRangeNames,
                                                                                dataRangeColors=dataColors,
-                                                                               units=units_a)),
+                                                                               units=units_a, **mapRenderSettings)),
                                               variableDisplayName + " in file",
                                               "mapA.png",  original_fig_list)
         
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+This module handles keeping the results of comparing each variable in reportGen
+so that later runs can reuse them when nothing about the comparison has changed.
+
+Copyright (c) 2026 University of Wisconsin SSEC. All rights reserved.
+"""
+
+import os, logging, hashlib, inspect, shutil, tempfile
+import cPickle as pickle
+
+import numpy
+
+import glance.data as dataobj
+from glance.constants import *
+
+LOG = logging.getLogger(__name__)
+
+# change this if what's kept for each variable changes
+RESULT_FORMAT_VERSION = 3
+
+# the results are kept in this directory inside the cache directory,
+# with one directory (named for the result key) for each variable
+RESULTS_DIRECTORY_NAME = 'variable-results'
+RESULT_FILE_NAME       = 'result.pickle'
+RESULT_FILES_DIR_NAME  = 'files'
+
+# run information that doesn't change the results of a comparison
+# (or that's different every run), this isn't part of the result keys
+IGNORED_RUN_INFO_KEYS = set([
+                             MACHINE_INFO_KEY,
+                             USER_INFO_KEY,
+                             TIME_INFO_KEY,
+                             CACHE_DIR_KEY,
+                             NUM_JOBS_KEY,
+                             DO_MAKE_FORKS_KEY,
+                             DO_CLEAR_MEM_THREADED_KEY,
+                             MAX_FIGURE_WORKERS_KEY,
+                             FIGURES_PER_WORKER_KEY,
+                             MIN_FREE_MEMORY_KEY,
+                             SHARED_ARRAY_DIR_KEY,
+                             COMPACT_MASKS_KEY,
+                             SKIP_CHECKSUMS_KEY,
+                             PREFETCH_ATTRIBUTES_KEY,
+                             PNG_COMPRESSION_KEY,
+                             THREADED_IMAGE_ENCODE_KEY,
+                            ])
+
+# variable run information that depends on where the output is going, this isn't kept
+LOCATION_RUN_INFO_KEYS = set([VARIABLE_DIRECTORY_KEY])
+
+# variable and run information naming other files data is loaded from,
+# the contents of these files are part of the result keys
+VARIABLE_ALT_FILE_KEYS = (VAR_FILTER_ALT_FILE_A_KEY, VAR_FILTER_ALT_FILE_B_KEY)
+RUN_ALT_FILE_KEYS      = (LONLAT_ALT_FILE_A_KEY,     LONLAT_ALT_FILE_B_KEY)
+
+def _describe_value (value) :
+    """
+    describe a setting in a way that will be the same in a later run if the setting is,
+    functions (such as filters) are described by their source code
+    """
+    
+    if isinstance(value, dict) :
+        return '{' + ', '.join(_describe_value(key) + ': ' + _describe_value(value[key]) for key in sorted(value)) + '}'
+    if isinstance(value, (list, tuple)) :
+        return '[' + ', '.join(_describe_value(item) for item in value) + ']'
+    if isinstance(value, numpy.ndarray) :
+        return 'array ' + str(value.dtype) + ' ' + str(value.shape) + ' ' + hashlib.md5(numpy.ascontiguousarray(value).view(numpy.uint8)).hexdigest()
+    if callable(value) :
+        try :
+            return 'function ' + inspect.getsource(value)
+        except (IOError, TypeError) :
+            code = getattr(value, 'func_code', None)
+            if code is not None :
+                return 'function ' + repr(code.co_code) + repr(code.co_consts) + repr(code.co_names)
+    
+    return repr(value)
+
+def get_result_key (files, varRunInfo, runInfo) :
+    """
+    get the key the results of comparing this variable are kept under
+    
+    the key covers the md5 sums of the two files (and of any alternate files the filter or
+    longitude/latitude data is loaded from), the variable's settings (including the
+    technical names, epsilons, fill values, and the source of any filter functions), the
+    run settings that change the output, and the glance version; if the md5 sums of the
+    files aren't available, None is returned and the results should not be kept
+    """
+    
+    md5sums = [ ]
+    for fileKey in (A_FILE_TITLE_KEY, B_FILE_TITLE_KEY) :
+        md5sum = files[fileKey][MD5SUM_KEY] if (fileKey in files) and (MD5SUM_KEY in files[fileKey]) else None
+        md5sum = str(md5sum) if md5sum is not None else None
+        if (md5sum is None) or (md5sum == dataobj.SKIPPED_CHECKSUM_TEXT) :
+            return None
+        md5sums.append(md5sum)
+    
+    # the alternate files are named by path, so their contents have to be checked too
+    altFiles = [(key, varRunInfo[key]) for key in VARIABLE_ALT_FILE_KEYS if varRunInfo.get(key, None) is not None]
+    altFiles += [(key, runInfo[key])   for key in RUN_ALT_FILE_KEYS      if runInfo.get(key, None)    is not None]
+    for key, altFilePath in altFiles :
+        try :
+            md5sum = dataobj.get_file_md5(altFilePath)
+        except (IOError, OSError), err :
+            LOG.debug("Unable to get the md5 sum of " + str(altFilePath) + ": " + str(err))
+            return None
+        if md5sum is None :
+            return None
+        md5sums.append(key + "=" + str(md5sum))
+    
+    hasher = hashlib.md5()
+    hasher.update("result format " + str(RESULT_FORMAT_VERSION) + "\n")
+    hasher.update("files " + " ".join(md5sums) + "\n")
+    hasher.update("variable " + _describe_value(varRunInfo) + "\n")
+    hasher.update("run " + _describe_value(dict((key, value) for key, value in runInfo.items()
+                                                 if key not in IGNORED_RUN_INFO_KEYS)) + "\n")
+    
+    return hasher.hexdigest()
+
+def _get_result_directory (cacheDirectory, resultKey) :
+    """
+    get the directory where the results for this key are (or would be) kept
+    """
+    
+    return os.path.join(cacheDirectory, RESULTS_DIRECTORY_NAME, resultKey)
+
+def _copy_directory_files (fromDirectory, toDirectory) :
+    """
+    copy the files in one directory into another
+    (subdirectories are left alone, they may belong to other variables)
+    """
+    
+    if not os.path.isdir(toDirectory) :
+        os.makedirs(toDirectory)
+    for fileName in os.listdir(fromDirectory) :
+        filePath = os.path.join(fromDirectory, fileName)
+        if os.path.isfile(filePath) :
+            shutil.copy2(filePath, os.path.join(toDirectory, fileName))
+
+def save_result (cacheDirectory, resultKey, variableDirectory,
+                 comparisonInfo, didPass, changedRunInfo, statistics, imageNames) :
+    """
+    keep the results of comparing a variable, including a copy of the files made
+    for it (its images and report page) in variableDirectory
+    
+    changedRunInfo should hold the entries of the variable's run information the
+    comparison added or changed, anything that can't be pickled will be left out;
+    the statistics (in dictionary form) and image names are kept so that the report
+    page can be made again for a later run without redoing the comparison
+    """
+    
+    resultsDirectory = os.path.join(cacheDirectory, RESULTS_DIRECTORY_NAME)
+    finalDirectory   = _get_result_directory(cacheDirectory, resultKey)
+    
+    # only keep the run information we'll be able to load later
+    runInfoToKeep = { }
+    for key, value in changedRunInfo.items() :
+        if key in LOCATION_RUN_INFO_KEYS :
+            continue
+        try :
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            runInfoToKeep[key] = value
+        except (pickle.PicklingError, TypeError, AttributeError) :
+            LOG.debug("Not keeping run information " + str(key) + " with the saved variable results.")
+    
+    result = {
+              'comparison_info': comparisonInfo,
+              'did_pass':        didPass,
+              'run_info':        runInfoToKeep,
+              'statistics':      statistics,
+              'image_names':     imageNames,
+             }
+    
+    # build the result in a temporary directory first so no one ever sees a half written one
+    tempDirectory = None
+    try :
+        if not os.path.isdir(resultsDirectory) :
+            os.makedirs(resultsDirectory)
+        tempDirectory = tempfile.mkdtemp(prefix=resultKey + '.', dir=resultsDirectory)
+        
+        if (variableDirectory is not None) and os.path.isdir(variableDirectory) :
+            _copy_directory_files(variableDirectory, os.path.join(tempDirectory, RESULT_FILES_DIR_NAME))
+        with open(os.path.join(tempDirectory, RESULT_FILE_NAME), 'wb') as resultFile :
+            pickle.dump(result, resultFile, pickle.HIGHEST_PROTOCOL)
+        
+        if os.path.isdir(finalDirectory) :
+            shutil.rmtree(finalDirectory)
+        os.rename(tempDirectory, finalDirectory)
+        tempDirectory = None
+    except (IOError, OSError, pickle.PicklingError), err :
+        LOG.warn("Unable to save the results for this variable: " + str(err))
+    finally :
+        if tempDirectory is not None :
+            shutil.rmtree(tempDirectory, ignore_errors=True)
+
+def restore_result (cacheDirectory, resultKey, variableDirectory) :
+    """
+    if results were kept for this key, copy the files made for the variable into
+    variableDirectory and return the result information (a dictionary with the
+    comparison_info, did_pass, run_info, statistics, and image_names), otherwise
+    return None
+    """
+    
+    resultDirectory = _get_result_directory(cacheDirectory, resultKey)
+    resultPath      = os.path.join(resultDirectory, RESULT_FILE_NAME)
+    if not os.path.exists(resultPath) :
+        return None
+    
+    try :
+        with open(resultPath, 'rb') as resultFile :
+            result = pickle.load(resultFile)
+        
+        filesDirectory = os.path.join(resultDirectory, RESULT_FILES_DIR_NAME)
+        if os.path.isdir(filesDirectory) :
+            _copy_directory_files(filesDirectory, variableDirectory)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError), err :
+        LOG.warn("Unable to reuse the saved results (" + resultDirectory + "): " + str(err))
+        return None
+    
+    return result
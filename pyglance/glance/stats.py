@@ -10,9 +10,39 @@ Copyright (c) 2010 University of Wisconsin SSEC. All rights reserved.
 
 import glance.data  as dataobj
 import glance.delta as delta
+import glance.io    as io
+
+from itertools import izip
 
 import numpy as np
 
+# the percentiles (other than the median) that will be reported when
+# a quantile sketch is used to estimate the distribution of the data
+SKETCH_PERCENTILES = [1, 5, 95, 99]
+
+def _get_sketch_quantiles (sketch) :
+    """
+    get the median and a dictionary of the SKETCH_PERCENTILES from a glance.delta.QuantileSketch
+    """
+    
+    estimates = sketch.quantiles([0.5] + [percentile / 100.0 for percentile in SKETCH_PERCENTILES])
+    
+    return estimates[0], dict(zip(SKETCH_PERCENTILES, estimates[1:]))
+
+def _make_sketch (values, quantileSketchAccuracy) :
+    """
+    make a glance.delta.QuantileSketch of the values with the given accuracy,
+    or return None if no quantileSketchAccuracy is given
+    """
+    
+    if quantileSketchAccuracy is None :
+        return None
+    
+    sketch = delta.QuantileSketch(quantileSketchAccuracy)
+    sketch.add(values)
+    
+    return sketch
+
 # I don't like this design, but it's what I could come up
 # with for now. FUTURE: Reconsider this design again later.
 class StatisticalData (object) :
@@ -65,6 +95,125 @@ class StatisticalData (object) :
         
         return prefix, suffix
 
+class DataSetAccumulator (object) :
+    """
+    This class accumulates the information needed for the single data set
+    statistics from a data set that is analyzed one chunk at a time.
+    
+    num_data_points         - the number of data points seen
+    missing_count           - the number of missing (fill) points seen
+    finite_count            - the number of valid (finite, non-missing) points seen
+    nan_count               - the number of non-finite points seen
+    spatially_invalid_count - the number of ignored points seen
+    moments                 - a glance.delta.StreamingMoments of the valid data
+    sketch                  - a glance.delta.QuantileSketch of the valid data
+                              (or None if no quantile sketch accuracy was given)
+    fill_value              - the fill value selected for the data
+    """
+    
+    def __init__ (self, quantile_sketch_accuracy=None) :
+        """
+        create an empty accumulator
+        """
+        
+        self.num_data_points         = 0
+        self.missing_count           = 0
+        self.finite_count            = 0
+        self.nan_count               = 0
+        self.spatially_invalid_count = 0
+        self.moments                 = delta.StreamingMoments()
+        self.sketch                  = delta.QuantileSketch(quantile_sketch_accuracy) if quantile_sketch_accuracy is not None else None
+        self.fill_value              = None
+    
+    def add_chunk (self, dataObject) :
+        """
+        add the information from a glance.data.DataObject holding one chunk of the data
+        """
+        
+        dataObject.self_analysis()
+        
+        self.num_data_points         += dataObject.data.size
+        self.missing_count           += dataObject.masks.count_true('missing_mask')
+        self.finite_count            += dataObject.masks.count_true('valid_mask')
+        self.nan_count               += dataObject.masks.count_true('non_finite_mask')
+        self.spatially_invalid_count += dataObject.masks.count_true('ignore_mask')
+        self.fill_value               = dataObject.select_fill_value()
+        goodData = dataObject.data[dataObject.masks.valid_mask]
+        self.moments.add(goodData)
+        if self.sketch is not None :
+            self.sketch.add(goodData)
+
+class ComparisonAccumulator (object) :
+    """
+    This class accumulates the information needed for a StatisticalAnalysis
+    of two data sets that are compared one chunk at a time, so that the whole
+    of the data sets, their masks, and their difference never need to be in
+    memory at once.
+    
+    a_accumulator / b_accumulator - DataSetAccumulators for the A and B data sets
+    
+    the remaining counts and accumulators mirror the statistics of the same
+    names in the other statistics classes; if a quantile sketch accuracy is
+    given, quantile sketches of the data and differences will also be kept
+    """
+    
+    def __init__ (self, shape, epsilon=0., epsilon_percent=None, quantile_sketch_accuracy=None) :
+        """
+        create an empty accumulator for data sets of the given full shape
+        """
+        
+        self.shape           = shape
+        self.epsilon         = epsilon
+        self.epsilon_percent = epsilon_percent
+        
+        self.a_accumulator   = DataSetAccumulator(quantile_sketch_accuracy=quantile_sketch_accuracy)
+        self.b_accumulator   = DataSetAccumulator(quantile_sketch_accuracy=quantile_sketch_accuracy)
+        
+        self.num_data_points            = 0
+        self.common_missing_count       = 0
+        self.common_finite_count        = 0
+        self.finite_in_only_one_count   = 0
+        self.common_nan_count           = 0
+        self.diff_outside_epsilon_count = 0
+        self.perfect_match_count        = 0
+        self.mismatch_points_count      = 0
+        
+        self.correlation      = delta.StreamingCorrelation()
+        self.delta_moments    = delta.StreamingMoments()
+        self.abs_diff_moments = delta.StreamingMoments()
+        self.delta_sketch     = delta.QuantileSketch(quantile_sketch_accuracy) if quantile_sketch_accuracy is not None else None
+    
+    def add_chunk (self, diffInfoObject) :
+        """
+        add the information from a glance.data.DiffInfoObject comparing one chunk of the data sets
+        """
+        
+        aMasks    = diffInfoObject.a_data_object.masks
+        bMasks    = diffInfoObject.b_data_object.masks
+        diffMasks = diffInfoObject.diff_data_object.masks
+        
+        self.a_accumulator.add_chunk(diffInfoObject.a_data_object)
+        self.b_accumulator.add_chunk(diffInfoObject.b_data_object)
+        
+        self.num_data_points            += diffInfoObject.a_data_object.data.size
+        self.common_missing_count       += np.sum(aMasks.missing_mask    & bMasks.missing_mask)
+        self.common_finite_count        += np.sum(aMasks.valid_mask      & bMasks.valid_mask)
+        self.finite_in_only_one_count   += np.sum((aMasks.valid_mask     ^ bMasks.valid_mask) & ~diffMasks.ignore_mask)
+        self.common_nan_count           += np.sum(aMasks.non_finite_mask & bMasks.non_finite_mask)
+        self.diff_outside_epsilon_count += np.sum(diffMasks.outside_epsilon_mask)
+        self.mismatch_points_count      += np.sum(diffMasks.mismatch_mask)
+        
+        # accumulate the moments of the data that's valid in both sets
+        aGoodData    = diffInfoObject.a_data_object.data[diffMasks.valid_mask]
+        bGoodData    = diffInfoObject.b_data_object.data[diffMasks.valid_mask]
+        diffGoodData = diffInfoObject.diff_data_object.data[diffMasks.valid_mask]
+        self.perfect_match_count += np.sum(aGoodData == bGoodData)
+        self.correlation.add(aGoodData, bGoodData)
+        self.delta_moments.add(diffGoodData)
+        self.abs_diff_moments.add(np.abs(diffGoodData))
+        if self.delta_sketch is not None :
+            self.delta_sketch.add(diffGoodData)
+
 class MissingValueStatistics (StatisticalData) :
     """
     A class representing information about where fill values are found
@@ -138,7 +287,7 @@ class MissingValueStatistics (StatisticalData) :
             noData = len(dataObject.data.shape) <= 0
 
             # figure out some basic statistics
-            self.missing_count    = np.sum(dataObject.masks.missing_mask)
+            self.missing_count    = dataObject.masks.count_true('missing_mask')
             self.missing_fraction = float(self.missing_count) / float(dataObject.data.size) if not noData else np.nan
             
         # if we have a comparison object analyze the data associated with that comparison
@@ -157,6 +306,29 @@ class MissingValueStatistics (StatisticalData) :
         else :
             raise ValueError ("No data set was given when requesting statistical analysis of missing values.")
     
+    @classmethod
+    def withAccumulator (in_class, accumulator=None, dataSetAccumulator=None, dataSetDescription=None) :
+        """
+        build our fill value related statistics from a ComparisonAccumulator or,
+        for a single data set, from a DataSetAccumulator
+        """
+        
+        new_object = in_class.__new__(in_class)
+        new_object.title           = 'Missing Value Statistics'
+        new_object.is_one_data_set = accumulator is None
+        
+        if accumulator is None :
+            new_object.desc_text        = dataSetDescription
+            new_object.missing_count    = dataSetAccumulator.missing_count
+            new_object.missing_fraction = float(new_object.missing_count) / float(dataSetAccumulator.num_data_points)
+        else :
+            new_object.a_missing_stats         = MissingValueStatistics.withAccumulator(dataSetAccumulator=accumulator.a_accumulator, dataSetDescription="a")
+            new_object.b_missing_stats         = MissingValueStatistics.withAccumulator(dataSetAccumulator=accumulator.b_accumulator, dataSetDescription="b")
+            new_object.common_missing_count    = accumulator.common_missing_count
+            new_object.common_missing_fraction = float(accumulator.common_missing_count) / float(accumulator.num_data_points)
+        
+        return new_object
+    
     def dictionary_form(self) :
         """
         get a dictionary form of the statistics
@@ -271,7 +443,7 @@ class FiniteDataStatistics (StatisticalData) :
             self.desc_text       = dataSetDescription
             
             # figure out some basic statistics
-            self.finite_count    = np.sum(dataObject.masks.valid_mask) if len(dataObject.data.shape) > 0 else 0
+            self.finite_count    = dataObject.masks.count_true('valid_mask') if len(dataObject.data.shape) > 0 else 0
             self.finite_fraction = float(self.finite_count) / float(dataObject.data.size) if len(dataObject.data.shape) > 0 else np.nan
             
         # if we have a comparison object analyze the data associated with that comparison
@@ -298,6 +470,32 @@ class FiniteDataStatistics (StatisticalData) :
         else:
             raise ValueError ("No data set was given when requesting statistical analysis of finite values.")
     
+    @classmethod
+    def withAccumulator (in_class, accumulator=None, dataSetAccumulator=None, dataSetDescription=None) :
+        """
+        build our finite data related statistics from a ComparisonAccumulator or,
+        for a single data set, from a DataSetAccumulator
+        """
+        
+        new_object = in_class.__new__(in_class)
+        new_object.title           = 'Finite Data Statistics'
+        new_object.is_one_data_set = accumulator is None
+        
+        if accumulator is None :
+            new_object.desc_text       = dataSetDescription
+            new_object.finite_count    = dataSetAccumulator.finite_count
+            new_object.finite_fraction = float(new_object.finite_count) / float(dataSetAccumulator.num_data_points)
+        else :
+            numPoints = float(accumulator.num_data_points)
+            new_object.a_finite_stats              = FiniteDataStatistics.withAccumulator(dataSetAccumulator=accumulator.a_accumulator, dataSetDescription="a")
+            new_object.b_finite_stats              = FiniteDataStatistics.withAccumulator(dataSetAccumulator=accumulator.b_accumulator, dataSetDescription="b")
+            new_object.common_finite_count         = accumulator.common_finite_count
+            new_object.finite_in_only_one_count    = accumulator.finite_in_only_one_count
+            new_object.common_finite_fraction      = float(accumulator.common_finite_count)      / numPoints
+            new_object.finite_in_only_one_fraction = float(accumulator.finite_in_only_one_count) / numPoints
+        
+        return new_object
+    
     def dictionary_form(self) :
         """
         get a dictionary form of the statistics
@@ -408,7 +606,7 @@ class NotANumberStatistics (StatisticalData) :
             noData = len(dataObject.data.shape) <= 0
 
             # get some basic statistics
-            self.nan_count = np.sum(dataObject.masks.non_finite_mask)
+            self.nan_count = dataObject.masks.count_true('non_finite_mask')
             self.nan_fraction = float(self.nan_count) / float(dataObject.data.size) if not noData else np.nan
             
         # if we have a comparison object analyze the data associated with that comparison
@@ -427,6 +625,29 @@ class NotANumberStatistics (StatisticalData) :
         else:
             raise ValueError ("No data set was given when requesting statistical analysis of NaN values.")
     
+    @classmethod
+    def withAccumulator (in_class, accumulator=None, dataSetAccumulator=None, dataSetDescription=None) :
+        """
+        build our nonfinite data related statistics from a ComparisonAccumulator or,
+        for a single data set, from a DataSetAccumulator
+        """
+        
+        new_object = in_class.__new__(in_class)
+        new_object.title           = 'NaN Statistics'
+        new_object.is_one_data_set = accumulator is None
+        
+        if accumulator is None :
+            new_object.desc_text    = dataSetDescription
+            new_object.nan_count    = dataSetAccumulator.nan_count
+            new_object.nan_fraction = float(new_object.nan_count) / float(dataSetAccumulator.num_data_points)
+        else :
+            new_object.a_nan_stats         = NotANumberStatistics.withAccumulator(dataSetAccumulator=accumulator.a_accumulator, dataSetDescription="a")
+            new_object.b_nan_stats         = NotANumberStatistics.withAccumulator(dataSetAccumulator=accumulator.b_accumulator, dataSetDescription="b")
+            new_object.common_nan_count    = accumulator.common_nan_count
+            new_object.common_nan_fraction = float(accumulator.common_nan_count) / float(accumulator.num_data_points)
+        
+        return new_object
+    
     def dictionary_form(self) :
         """
         get a dictionary form of the statistics
@@ -484,6 +705,9 @@ class GeneralStatistics (StatisticalData) :
     mean                          - the mean of the data values
     median                        - the median of the data values
     std_val                       - the standard deviation of the data values
+    p1, p5, p95, p99              - the 1st, 5th, 95th, and 99th percentiles of the data values
+                                    (only if a quantile sketch accuracy is given, in which case
+                                    these and the median are estimated with a glance.delta.QuantileSketch)
     
     if a DiffInfoObject is given these comparison stats will be produced:
     
@@ -525,10 +749,19 @@ class GeneralStatistics (StatisticalData) :
                     # these are new!
                     'mean_a': "the mean of all finite, non-missing values found in A",
                     'mean_b': "the mean of all finite, non-missing values found in B",
-                    'median_a': "the median of all finite, non-missing values in A",
-                    'median_b': "the median of all finite, non-missing values in B",
+                    'median_a': "the median of all finite, non-missing values in A (estimated if a quantile sketch is used)",
+                    'median_b': "the median of all finite, non-missing values in B (estimated if a quantile sketch is used)",
                     'std_val_a': "the standard deviation of all finite, non-missing values in A",
                     'std_val_b': "the standard deviation of all finite, non-missing values in B",
+                    # these are only present when a quantile sketch is used
+                    'p1_a':  "the estimated 1st percentile of all finite, non-missing values in A",
+                    'p1_b':  "the estimated 1st percentile of all finite, non-missing values in B",
+                    'p5_a':  "the estimated 5th percentile of all finite, non-missing values in A",
+                    'p5_b':  "the estimated 5th percentile of all finite, non-missing values in B",
+                    'p95_a': "the estimated 95th percentile of all finite, non-missing values in A",
+                    'p95_b': "the estimated 95th percentile of all finite, non-missing values in B",
+                    'p99_a': "the estimated 99th percentile of all finite, non-missing values in A",
+                    'p99_b': "the estimated 99th percentile of all finite, non-missing values in B",
                     }
     
     _doc_strings_inspect = \
@@ -542,12 +775,18 @@ class GeneralStatistics (StatisticalData) :
                                                      'in the data that were' +
                                                      ' ignored for the purposes of data analysis and presentation',
                     'mean': "the mean of all finite, non-missing values in the data",
-                    'median': "the median of all finite, non-missing values in the data",
+                    'median': "the median of all finite, non-missing values in the data (estimated if a quantile sketch is used)",
                     'std_val': "the standard deviation of all finite, non-missing values in the data",
+                    # these are only present when a quantile sketch is used
+                    'p1':  "the estimated 1st percentile of all finite, non-missing values in the data",
+                    'p5':  "the estimated 5th percentile of all finite, non-missing values in the data",
+                    'p95': "the estimated 95th percentile of all finite, non-missing values in the data",
+                    'p99': "the estimated 99th percentile of all finite, non-missing values in the data",
                     }
     
     def __init__(self, diffInfoObject=None, dataObject=None,
-                 doExtras=False, dataSetDescription=None) :
+                 doExtras=False, dataSetDescription=None,
+                 quantileSketchAccuracy=None) :
         """
         build our general statistics based on the comparison of two data sets
         
@@ -565,6 +804,10 @@ class GeneralStatistics (StatisticalData) :
         If you are passing a single dataObject and would like shape and size
         statistics reported as well, pass doExtras as True (otherwise these
         stats will be omitted).
+        
+        If quantileSketchAccuracy is given, the median and the SKETCH_PERCENTILES
+        will be estimated in a single pass with a glance.delta.QuantileSketch of that
+        relative accuracy rather than found exactly by sorting the data.
         """
         self.title           = 'General Statistics'
         self.is_one_data_set = False
@@ -581,20 +824,31 @@ class GeneralStatistics (StatisticalData) :
             tempGoodData = dataObject.data[dataObject.masks.valid_mask]
             noData = (tempGoodData.size <= 0) or (len(dataObject.data.shape) <= 0)
 
+            # get the moments of the good data in one pass
+            moments = delta.StreamingMoments()
+            if not noData :
+                moments.add(tempGoodData)
+            
             # fill in our statistics
             self.missing_value   = dataObject.select_fill_value()
-            self.max             =    np.max(tempGoodData) if not noData else np.nan
-            self.min             =    np.min(tempGoodData) if not noData else np.nan
-            self.mean            =   np.mean(tempGoodData) if not noData else np.nan
-            self.median          = np.median(tempGoodData) if not noData else np.nan
-            self.std_val         =    np.std(tempGoodData) if not noData else np.nan
+            self.max             = moments.max  if not noData else np.nan
+            self.min             = moments.min  if not noData else np.nan
+            self.mean            = moments.mean if not noData else np.nan
+            self.std_val         = moments.std()
+            self.percentiles     = None
+            if quantileSketchAccuracy is None :
+                # note: tempGoodData is our own copy, so it's fine to let the median reorder it
+                self.median      = np.median(tempGoodData, overwrite_input=True) if not noData else np.nan
+            else :
+                sketch = _make_sketch(tempGoodData if not noData else np.zeros(0), quantileSketchAccuracy)
+                self.median, self.percentiles = _get_sketch_quantiles(sketch)
             # also calculate the invalid points
-            self.spatially_invalid_pts_ignored = np.sum(dataObject.masks.ignore_mask)
+            self.spatially_invalid_pts_ignored = dataObject.masks.count_true('ignore_mask')
             
             # if we should also do extra stats, do so
             if (doExtras) :
-                self.num_data_points = dataObject.masks.missing_mask.size if not noData else 0
-                self.shape           = dataObject.masks.missing_mask.shape if not dataObject.is_scalar else "a single scalar value"
+                self.num_data_points = dataObject.data.size if not noData else 0
+                self.shape           = dataObject.data.shape if not dataObject.is_scalar else "a single scalar value"
             
         # if we have a comparison object analyze the data associated with that comparison
         elif diffInfoObject is not None :
@@ -602,29 +856,71 @@ class GeneralStatistics (StatisticalData) :
             noData = len(diffInfoObject.a_data_object.data.shape) <= 0
 
             # analyze each of the original data sets that are being compared
-            self.a_gen_stats = GeneralStatistics(dataObject=diffInfoObject.a_data_object, dataSetDescription="a")
-            self.b_gen_stats = GeneralStatistics(dataObject=diffInfoObject.b_data_object, dataSetDescription="b")
+            self.a_gen_stats = GeneralStatistics(dataObject=diffInfoObject.a_data_object, dataSetDescription="a",
+                                                 quantileSketchAccuracy=quantileSketchAccuracy)
+            self.b_gen_stats = GeneralStatistics(dataObject=diffInfoObject.b_data_object, dataSetDescription="b",
+                                                 quantileSketchAccuracy=quantileSketchAccuracy)
             
             # fill in our statistics
             self.epsilon         = diffInfoObject.epsilon_value
             self.epsilon_percent = diffInfoObject.epsilon_percent
-            self.num_data_points = diffInfoObject.a_data_object.masks.missing_mask.size if not noData else 0
-            self.shape           = diffInfoObject.a_data_object.masks.missing_mask.shape
+            self.num_data_points = diffInfoObject.a_data_object.data.size if not noData else 0
+            self.shape           = diffInfoObject.a_data_object.data.shape
             # if we have at least one scalar, we need to build the shape info differently
             if diffInfoObject.a_data_object.is_scalar or diffInfoObject.b_data_object.is_scalar :
                 if diffInfoObject.a_data_object.is_scalar and diffInfoObject.b_data_object.is_scalar :
                     self.shape = "a single scalar value"
                 elif diffInfoObject.a_data_object.is_scalar :
-                    self.shape = "a single scalar value in A and " + str(diffInfoObject.b_data_object.masks.missing_mask.shape) + " in B"
+                    self.shape = "a single scalar value in A and " + str(diffInfoObject.b_data_object.data.shape) + " in B"
                 elif diffInfoObject.b_data_object.is_scalar :
-                    self.shape = str(diffInfoObject.a_data_object.masks.missing_mask.shape) + " in A and a single scalar value in B"
+                    self.shape = str(diffInfoObject.a_data_object.data.shape) + " in A and a single scalar value in B"
             # also calculate the invalid points
-            self.spatially_invalid_pts_ignored_in_a = np.sum(diffInfoObject.a_data_object.masks.ignore_mask)
-            self.spatially_invalid_pts_ignored_in_b = np.sum(diffInfoObject.b_data_object.masks.ignore_mask)
+            self.spatially_invalid_pts_ignored_in_a = diffInfoObject.a_data_object.masks.count_true('ignore_mask')
+            self.spatially_invalid_pts_ignored_in_b = diffInfoObject.b_data_object.masks.count_true('ignore_mask')
             
         else:
             raise ValueError ("No data set was given when requesting general statistical analysis.")
     
+    @classmethod
+    def withAccumulator (in_class, accumulator=None, dataSetAccumulator=None, dataSetDescription=None) :
+        """
+        build our general statistics from a ComparisonAccumulator or,
+        for a single data set, from a DataSetAccumulator
+        
+        note: the exact median can't be found from an accumulator, so it will be nan
+        unless the accumulator kept a quantile sketch (then it will be estimated)
+        """
+        
+        new_object = in_class.__new__(in_class)
+        new_object.title           = 'General Statistics'
+        new_object.is_one_data_set = accumulator is None
+        
+        if accumulator is None :
+            moments = dataSetAccumulator.moments
+            new_object.do_extras       = False
+            new_object.desc_text       = dataSetDescription
+            new_object.missing_value   = dataSetAccumulator.fill_value
+            new_object.max             = moments.max if moments.count > 0 else np.nan
+            new_object.min             = moments.min if moments.count > 0 else np.nan
+            new_object.mean            = moments.mean if moments.count > 0 else np.nan
+            new_object.median          = np.nan
+            new_object.percentiles     = None
+            if dataSetAccumulator.sketch is not None :
+                new_object.median, new_object.percentiles = _get_sketch_quantiles(dataSetAccumulator.sketch)
+            new_object.std_val         = moments.std()
+            new_object.spatially_invalid_pts_ignored = dataSetAccumulator.spatially_invalid_count
+        else :
+            new_object.a_gen_stats     = GeneralStatistics.withAccumulator(dataSetAccumulator=accumulator.a_accumulator, dataSetDescription="a")
+            new_object.b_gen_stats     = GeneralStatistics.withAccumulator(dataSetAccumulator=accumulator.b_accumulator, dataSetDescription="b")
+            new_object.epsilon         = accumulator.epsilon
+            new_object.epsilon_percent = accumulator.epsilon_percent
+            new_object.num_data_points = accumulator.num_data_points
+            new_object.shape           = accumulator.shape
+            new_object.spatially_invalid_pts_ignored_in_a = accumulator.a_accumulator.spatially_invalid_count
+            new_object.spatially_invalid_pts_ignored_in_b = accumulator.b_accumulator.spatially_invalid_count
+        
+        return new_object
+    
     def dictionary_form(self) :
         """
         get a dictionary form of the statistics
@@ -645,6 +941,10 @@ class GeneralStatistics (StatisticalData) :
                         'spatially_invalid_pts_ignored' + temp_suffix: self.spatially_invalid_pts_ignored,
                         }
             
+            if self.percentiles is not None :
+                for percentile in SKETCH_PERCENTILES :
+                    toReturn['p' + str(percentile) + temp_suffix] = self.percentiles[percentile]
+            
             if self.do_extras :
                 toReturn['num_data_points'] = self.num_data_points
                 toReturn['shape']           = self.shape
@@ -701,6 +1001,10 @@ class NumericalComparisonStatistics (StatisticalData) :
     max_delta    -            the maximum of the          difference between the two data sets
     min_delta    -            the minimum of the          difference between the two data sets
     
+    If a quantile sketch accuracy is given, the medians will be estimated with a
+    glance.delta.QuantileSketch and the 1st, 5th, 95th, and 99th percentiles of the
+    difference and absolute difference will also be included (p1_delta, p1_diff, etc.).
+    
     These statistics can also be generated separately in dictionary form by calling the
     basic_analysis method on this class.
     """
@@ -714,13 +1018,23 @@ class NumericalComparisonStatistics (StatisticalData) :
                                             "definitions (out of common_finite_count)",
                     'max_diff': "maximum absolute valued difference of the finite values",
                     'mean_diff': "mean of the absolute value difference of the finite values",
-                    'median_diff': "median of the absolute value difference of the finite values",
+                    'median_diff': "median of the absolute value difference of the finite values (estimated if a quantile sketch is used)",
                     
                     'mean_delta':      "mean of the subtractive difference of the finite values", 
-                    'median_delta':    "median of the subtractive difference of the finite values",
+                    'median_delta':    "median of the subtractive difference of the finite values (estimated if a quantile sketch is used)",
                     'max_delta':       "maximum finite data value from the data set of B file - A file",
                     'min_delta':       "minimum finite data value from the data set of B file - A file",
                     
+                    # these are only present when a quantile sketch is used
+                    'p1_diff':   "estimated 1st percentile of the absolute value difference of the finite values",
+                    'p5_diff':   "estimated 5th percentile of the absolute value difference of the finite values",
+                    'p95_diff':  "estimated 95th percentile of the absolute value difference of the finite values",
+                    'p99_diff':  "estimated 99th percentile of the absolute value difference of the finite values",
+                    'p1_delta':  "estimated 1st percentile of the subtractive difference of the finite values",
+                    'p5_delta':  "estimated 5th percentile of the subtractive difference of the finite values",
+                    'p95_delta': "estimated 95th percentile of the subtractive difference of the finite values",
+                    'p99_delta': "estimated 99th percentile of the subtractive difference of the finite values",
+                    
                     'perfect_match_count': "number of perfectly matched finite data points between A and B",
                     'perfect_match_fraction': "fraction of finite values perfectly matching between A and B (out of common_finite_count)",
                     'rms_val': "root mean square (RMS) difference of finite values",
@@ -732,13 +1046,14 @@ class NumericalComparisonStatistics (StatisticalData) :
                                             ' or are unacceptable when compared according to the current epsilon definitions',
                     }
     
-    def __init__(self, diffInfoObject, include_basic_analysis=True) :
+    def __init__(self, diffInfoObject, include_basic_analysis=True, quantileSketchAccuracy=None) :
         """
         build our comparison statistics based on the comparison
         of two data sets
         
         the include_basic_analysis flag indicates whether the statistics generated by the
-        basic_analysis method should also be generated
+        basic_analysis method should also be generated; the quantileSketchAccuracy is
+        passed on to the basic_analysis
         """
         self.title = 'Numerical Comparison Statistics'
         
@@ -746,24 +1061,34 @@ class NumericalComparisonStatistics (StatisticalData) :
         valid_in_both           = diffInfoObject.diff_data_object.masks.valid_mask
         aData                   = diffInfoObject.a_data_object.data
         bData                   = diffInfoObject.b_data_object.data
-        total_num_finite_values = np.sum(valid_in_both) # just the finite values, not all data
         noData = len(diffInfoObject.a_data_object.data.shape) <= 0
-
+        
+        # select the values that are valid in both sets once, everything else is calculated from these
+        aGoodData               = aData[valid_in_both]
+        bGoodData               = bData[valid_in_both]
+        diffGoodData            = diffInfoObject.diff_data_object.data[valid_in_both]
+        total_num_finite_values = diffGoodData.size # just the finite values, not all data
+        
+        # get the perfect matches, the correlation co-moments, and the moments of the differences together
+        self.perfect_match_count, correlation, deltaMoments, absDiffMoments = \
+                delta.calculate_comparison_moments(aGoodData, bGoodData, diffGoodData)
+        
         # fill in some simple statistics
-        self.diff_outside_epsilon_count = np.sum(diffInfoObject.diff_data_object.masks.outside_epsilon_mask)
-        self.perfect_match_count        = NumericalComparisonStatistics._get_num_perfect(aData, bData,
-                                                                                         goodMask=valid_in_both)
-        self.correlation                = delta.compute_correlation(aData, bData, valid_in_both)  if not noData else np.nan
+        self.diff_outside_epsilon_count = diffInfoObject.diff_data_object.masks.count_true('outside_epsilon_mask')
+        self.correlation                = correlation.correlation()  if not noData else np.nan
         self.r_squared_correlation      = self.correlation * self.correlation  if not noData else np.nan
-        self.mismatch_points_count      = np.sum(diffInfoObject.diff_data_object.masks.mismatch_mask)
+        self.mismatch_points_count      = diffInfoObject.diff_data_object.masks.count_true('mismatch_mask')
         
         # calculate some more complex statistics, be careful not to divide by zero
         self.mismatch_points_fraction      = float(self.mismatch_points_count)      / float(aData.size)              if not noData                    else 0.0
         self.diff_outside_epsilon_fraction = float(self.diff_outside_epsilon_count) / float(total_num_finite_values) if (total_num_finite_values > 0) else 0.0
         self.perfect_match_fraction        = float(self.perfect_match_count)        / float(total_num_finite_values) if (total_num_finite_values > 0) else np.nan
         
-        # if desired, do the basic analysis
-        self.temp_analysis = NumericalComparisonStatistics.basic_analysis(diffInfoObject.diff_data_object.data, valid_in_both) if include_basic_analysis else { }
+        # if desired, do the basic analysis (this is the same as the basic_analysis method, but reuses our moments)
+        self.temp_analysis = NumericalComparisonStatistics._moments_analysis(deltaMoments, absDiffMoments,
+                                                                             goodDiffData=diffGoodData,
+                                                                             deltaSketch=_make_sketch(diffGoodData, quantileSketchAccuracy)) \
+                                                                             if include_basic_analysis else { }
         self.rms_val       = self.temp_analysis['rms_val']      if not noData else np.nan
         self.std_val       = self.temp_analysis['std_val']      if not noData else np.nan
         self.mean_diff     = self.temp_analysis['mean_diff']    if not noData else np.nan
@@ -774,6 +1099,41 @@ class NumericalComparisonStatistics (StatisticalData) :
         self.max_delta     = self.temp_analysis['max_delta']    if not noData else np.nan
         self.min_delta     = self.temp_analysis['min_delta']    if not noData else np.nan
     
+    @classmethod
+    def withAccumulator (in_class, accumulator) :
+        """
+        build our comparison statistics from a ComparisonAccumulator
+        
+        note: the exact medians can't be found from an accumulator, so they will be nan
+        unless the accumulator kept quantile sketches (then they will be estimated)
+        """
+        
+        new_object = in_class.__new__(in_class)
+        new_object.title = 'Numerical Comparison Statistics'
+        
+        total_num_finite_values = accumulator.common_finite_count
+        
+        # fill in some simple statistics
+        new_object.diff_outside_epsilon_count = accumulator.diff_outside_epsilon_count
+        new_object.perfect_match_count        = accumulator.perfect_match_count
+        new_object.correlation                = accumulator.correlation.correlation()
+        new_object.r_squared_correlation      = new_object.correlation * new_object.correlation
+        new_object.mismatch_points_count      = accumulator.mismatch_points_count
+        
+        # calculate some more complex statistics, be careful not to divide by zero
+        new_object.mismatch_points_fraction      = float(new_object.mismatch_points_count)      / float(accumulator.num_data_points)
+        new_object.diff_outside_epsilon_fraction = float(new_object.diff_outside_epsilon_count) / float(total_num_finite_values) if (total_num_finite_values > 0) else 0.0
+        new_object.perfect_match_fraction        = float(new_object.perfect_match_count)        / float(total_num_finite_values) if (total_num_finite_values > 0) else np.nan
+        
+        # the basic analysis comes from the moments of the difference
+        new_object.temp_analysis = NumericalComparisonStatistics._moments_analysis(accumulator.delta_moments,
+                                                                                   accumulator.abs_diff_moments,
+                                                                                   deltaSketch=accumulator.delta_sketch)
+        for statName in new_object.temp_analysis :
+            setattr(new_object, statName, new_object.temp_analysis[statName])
+        
+        return new_object
+    
     def dictionary_form(self) :
         """
         get a dictionary form of the statistics
@@ -801,44 +1161,74 @@ class NumericalComparisonStatistics (StatisticalData) :
         return NumericalComparisonStatistics._doc_strings
     
     @staticmethod
-    def basic_analysis(diffData, valid_mask):
+    def basic_analysis(diffData, valid_mask, quantileSketchAccuracy=None):
         """do some very minimal analysis of the differences
+        
+        if quantileSketchAccuracy is given, the medians will be estimated and the
+        SKETCH_PERCENTILES of the differences will also be included
         """
         
-        # if everything's invalid, stop now
-        noData = np.sum(valid_mask) <= 0
-
-        # calculate and return statistics
-        root_mean_square_value = delta.calculate_root_mean_square(diffData, valid_mask) if not noData else np.nan
-        tempDiffData           = diffData[valid_mask] if not noData else None
-        absDiffData            = np.abs(tempDiffData) if not noData else None
-        return {    'rms_val':       root_mean_square_value, 
-                    'std_val':         np.std(tempDiffData)  if not noData else np.nan,
-                    
-                    'mean_diff':       np.mean(absDiffData) if not noData else np.nan,
-                    'median_diff':   np.median(absDiffData) if not noData else np.nan,
-                    'max_diff':         np.max(absDiffData) if not noData else np.nan,
-                    
-                    'mean_delta':     np.mean(tempDiffData) if not noData else np.nan,
-                    'median_delta': np.median(tempDiffData) if not noData else np.nan,
-                    'max_delta':       np.max(tempDiffData) if not noData else np.nan,
-                    'min_delta':       np.min(tempDiffData) if not noData else np.nan,
+        # get the moments of the valid differences in one pass
+        tempDiffData                 = diffData[valid_mask]
+        deltaMoments, absDiffMoments = delta.calculate_difference_moments(tempDiffData)
+        
+        return NumericalComparisonStatistics._moments_analysis(deltaMoments, absDiffMoments,
+                                                               goodDiffData=tempDiffData,
+                                                               deltaSketch=_make_sketch(tempDiffData, quantileSketchAccuracy))
+    
+    @staticmethod
+    def _moments_analysis(deltaMoments, absDiffMoments, goodDiffData=None, deltaSketch=None):
+        """
+        build the basic analysis from glance.delta.StreamingMoments of the differences
+        and the absolute differences
+        
+        the medians (and percentiles) will be estimated from the deltaSketch if it is
+        given, otherwise they will be found exactly from the goodDiffData if that is
+        given, otherwise they will be nan
+        
+        note: to avoid making copies of it, the goodDiffData will be reordered and
+        overwritten with its absolute values while the medians are found
+        """
+        
+        # if everything's invalid, most of the statistics are meaningless
+        noData = deltaMoments.count <= 0
+        
+        toReturn = {    'rms_val':      deltaMoments.root_mean_square(),
+                        'std_val':      deltaMoments.std(),
+                        
+                        'mean_diff':    absDiffMoments.mean if not noData else np.nan,
+                        'median_diff':  np.nan,
+                        'max_diff':     absDiffMoments.max  if not noData else np.nan,
+                        
+                        'mean_delta':   deltaMoments.mean   if not noData else np.nan,
+                        'median_delta': np.nan,
+                        'max_delta':    deltaMoments.max    if not noData else np.nan,
+                        'min_delta':    deltaMoments.min    if not noData else np.nan,
                     }
+        
+        if deltaSketch is not None :
+            toReturn.update(NumericalComparisonStatistics._sketch_analysis(deltaSketch))
+        elif (goodDiffData is not None) and (not noData) :
+            toReturn['median_delta'] = np.median(goodDiffData, overwrite_input=True)
+            toReturn['median_diff']  = np.median(np.absolute(goodDiffData, out=goodDiffData), overwrite_input=True)
+        
+        return toReturn
     
     @staticmethod
-    def _get_num_perfect(aData, bData, goodMask=None):
+    def _sketch_analysis(deltaSketch):
         """
-        get the number of data points where
-        the value in A perfectly matches the value in B
+        get the estimated medians and percentiles of the differences and absolute
+        differences from a glance.delta.QuantileSketch of the differences
         """
-        numPerfect = 0
         
-        if goodMask is None :
-            numPerfect = np.sum(aData == bData)
-        else :
-            numPerfect = np.sum(aData[goodMask] == bData[goodMask])
+        toReturn = { }
+        toReturn['median_delta'], deltaPercentiles = _get_sketch_quantiles(deltaSketch)
+        toReturn['median_diff'],  diffPercentiles  = _get_sketch_quantiles(deltaSketch.absolute_value())
+        for percentile in SKETCH_PERCENTILES :
+            toReturn['p' + str(percentile) + '_delta'] = deltaPercentiles[percentile]
+            toReturn['p' + str(percentile) + '_diff']  =  diffPercentiles[percentile]
         
-        return numPerfect
+        return toReturn
 
 class StatisticalAnalysis (StatisticalData) :
     """
@@ -854,6 +1244,10 @@ class StatisticalAnalysis (StatisticalData) :
     
     It can also provide a dictionary form of the statistics and
     documentation for the statistics.
+    
+    If a quantile_sketch_accuracy is given when creating the analysis, medians
+    and percentiles will be estimated with glance.delta.QuantileSketches of that
+    relative accuracy rather than found exactly by sorting the data.
     """
     
     def __init__ (self) :
@@ -867,27 +1261,33 @@ class StatisticalAnalysis (StatisticalData) :
                         a_data,                b_data,
                         a_missing_value=None,  b_missing_value=None,
                         a_ignore_mask=None,    b_ignore_mask=None,
-                        epsilon=0., epsilon_percent=None) :
+                        epsilon=0., epsilon_percent=None,
+                        quantile_sketch_accuracy=None,
+                        compact_masks=False) :
         """
         do a full statistical analysis of the data, after building the data objects
+        (if compact_masks is True the data objects will keep their masks bit packed)
         """
         
         new_object  = in_class()
         
-        aDataObject = dataobj.DataObject(a_data, fillValue=a_missing_value, ignoreMask=a_ignore_mask)
-        bDataObject = dataobj.DataObject(b_data, fillValue=b_missing_value, ignoreMask=b_ignore_mask)
+        aDataObject = dataobj.DataObject(a_data, fillValue=a_missing_value, ignoreMask=a_ignore_mask,
+                                         compactMasks=compact_masks)
+        bDataObject = dataobj.DataObject(b_data, fillValue=b_missing_value, ignoreMask=b_ignore_mask,
+                                         compactMasks=compact_masks)
         
         diffInfo    = dataobj.DiffInfoObject(aDataObject, bDataObject,
                                              epsilonValue=epsilon, epsilonPercent=epsilon_percent) 
         
-        new_object._create_stats(diffInfo)
+        new_object._create_stats(diffInfo, quantile_sketch_accuracy=quantile_sketch_accuracy)
         
         return new_object
     
     @classmethod
     def withDataObjects (in_class,
                          a_data_object, b_data_object,
-                         epsilon=0.,    epsilon_percent=None) :
+                         epsilon=0.,    epsilon_percent=None,
+                         quantile_sketch_accuracy=None) :
         """
         do a full statistical analysis of the data, using the given data objects
         """
@@ -897,17 +1297,63 @@ class StatisticalAnalysis (StatisticalData) :
         diffInfo   = dataobj.DiffInfoObject(a_data_object, b_data_object,
                                             epsilonValue=epsilon, epsilonPercent=epsilon_percent) 
         
-        new_object._create_stats(diffInfo)
+        new_object._create_stats(diffInfo, quantile_sketch_accuracy=quantile_sketch_accuracy)
+        
+        return new_object
+    
+    @classmethod
+    def withChunkedData (in_class,
+                         a_data,                b_data,
+                         a_missing_value=None,  b_missing_value=None,
+                         epsilon=0., epsilon_percent=None,
+                         rows_per_chunk=1000, quantile_sketch_accuracy=None) :
+        """
+        do a full statistical analysis of the data, working through the data
+        rows_per_chunk rows (along the first dimension) at a time
+        
+        a_data and b_data may be numpy arrays or anything else that can be sliced
+        like them and has a shape (such as a glance.io.LazyVariableArray); only one
+        chunk of the data and its masks will be in memory at a time
+        
+        note: the exact medians can't be found this way, so they will be nan
+        unless a quantile_sketch_accuracy is given (then they will be estimated)
+        """
+        
+        assert(tuple(a_data.shape) == tuple(b_data.shape))
+        assert(len(a_data.shape) > 0)
+        assert(rows_per_chunk > 0)
+        
+        new_object  = in_class()
+        accumulator = ComparisonAccumulator(tuple(a_data.shape), epsilon=epsilon, epsilon_percent=epsilon_percent,
+                                            quantile_sketch_accuracy=quantile_sketch_accuracy)
+        
+        for (_, _, aChunk), (_, _, bChunk) in izip(io.iter_chunks(a_data, rows_per_chunk),
+                                                   io.iter_chunks(b_data, rows_per_chunk)) :
+            
+            aDataObject = dataobj.DataObject(aChunk, fillValue=a_missing_value)
+            bDataObject = dataobj.DataObject(bChunk, fillValue=b_missing_value)
+            diffInfo    = dataobj.DiffInfoObject(aDataObject, bDataObject,
+                                                 epsilonValue=epsilon, epsilonPercent=epsilon_percent)
+            
+            accumulator.add_chunk(diffInfo)
+        
+        new_object.general      = GeneralStatistics.withAccumulator            (accumulator=accumulator)
+        new_object.comparison   = NumericalComparisonStatistics.withAccumulator(accumulator)
+        new_object.notANumber   = NotANumberStatistics.withAccumulator         (accumulator=accumulator)
+        new_object.missingValue = MissingValueStatistics.withAccumulator       (accumulator=accumulator)
+        new_object.finiteData   = FiniteDataStatistics.withAccumulator         (accumulator=accumulator)
         
         return new_object
     
-    def _create_stats(self, diffInfoObject) :
+    def _create_stats(self, diffInfoObject, quantile_sketch_accuracy=None) :
         """
         build and set all of the statistics sets
         """
         
-        self.general      = GeneralStatistics            (diffInfoObject=diffInfoObject)
-        self.comparison   = NumericalComparisonStatistics(diffInfoObject)
+        self.general      = GeneralStatistics            (diffInfoObject=diffInfoObject,
+                                                          quantileSketchAccuracy=quantile_sketch_accuracy)
+        self.comparison   = NumericalComparisonStatistics(diffInfoObject,
+                                                          quantileSketchAccuracy=quantile_sketch_accuracy)
         self.notANumber   = NotANumberStatistics         (diffInfoObject=diffInfoObject)
         self.missingValue = MissingValueStatistics       (diffInfoObject=diffInfoObject)
         self.finiteData   = FiniteDataStatistics         (diffInfoObject=diffInfoObject)
@@ -1040,7 +1486,8 @@ class StatisticalInspectionAnalysis (StatisticalData) :
     def withSimpleData (in_class,
                         dataSet,
                         missingValue=None,
-                        ignoreMask=None) :
+                        ignoreMask=None,
+                        quantile_sketch_accuracy=None) :
         """
         do a full statistical analysis of the data, after building the data object
         """
@@ -1050,13 +1497,14 @@ class StatisticalInspectionAnalysis (StatisticalData) :
         dataObject = dataobj.DataObject(dataSet, fillValue=missingValue, ignoreMask=ignoreMask)
         dataObject.self_analysis()
         
-        new_object._create_stats(dataObject)
+        new_object._create_stats(dataObject, quantile_sketch_accuracy=quantile_sketch_accuracy)
         
         return new_object
     
     @classmethod
     def withDataObjects (in_class,
-                         dataObject) :
+                         dataObject,
+                         quantile_sketch_accuracy=None) :
         """
         do a full statistical analysis of the data, using the given data object
         """
@@ -1064,17 +1512,18 @@ class StatisticalInspectionAnalysis (StatisticalData) :
         new_object = in_class()
         
         dataObject.self_analysis()
-        new_object._create_stats(dataObject)
+        new_object._create_stats(dataObject, quantile_sketch_accuracy=quantile_sketch_accuracy)
         
         return new_object
     
-    def _create_stats(self, dataObject) :
+    def _create_stats(self, dataObject, quantile_sketch_accuracy=None) :
         """
         build and set all of the statistics sets
         """
         
         self.general      = GeneralStatistics(     dataObject=dataObject,
-                                                           doExtras=True)
+                                                           doExtras=True,
+                                                           quantileSketchAccuracy=quantile_sketch_accuracy)
         self.notANumber   = NotANumberStatistics(  dataObject=dataObject)
         self.missingValue = MissingValueStatistics(dataObject=dataObject)
         self.finiteData   = FiniteDataStatistics(  dataObject=dataObject)